@@ -1,9 +1,52 @@
 import os
 from flask import Flask
+from flask_migrate import Migrate
 from .models import db
-from flask_bcrypt import Bcrypt
+from .comandos import registrar_comandos
+from .invalidacion import iniciar_invalidacion
+from .contrasenas import iniciar_contrasenas
+from .limites import iniciar_limites
+from .conexiones import opciones_motor, instrumentar_pool
+from .replica import configurar_replica
+from .metricas import iniciar_metricas
+from .trazas import iniciar_trazas
+from .perfilador import iniciar_perfilador
+from .detector_sql import iniciar_detector_sql
 
-def create_app():
+migrate = Migrate()
+
+def registrar_blueprints(app):
+    """
+    Las rutas se importan aquí y no al importar el paquete: los scripts que
+    solo necesitan los modelos usan create_app(registrar_rutas=False)
+    """
+    from .routes.empresa_routes import empresa_bp
+    from .routes.usuario_routes import usuario_bp
+    from .routes.producto_routes import producto_bp
+    from .routes.venta_routes import venta_bp
+    from .routes.index_routes import index_bp
+    from .routes.inventario_routes import inventario_bp
+    from .routes.compra_routes import compra_bp
+    from .routes.interno_routes import interno_bp, metricas_bp
+
+    app.register_blueprint(empresa_bp)
+    app.register_blueprint(usuario_bp, url_prefix="/usuario")
+    app.register_blueprint(producto_bp)
+    app.register_blueprint(venta_bp)
+    app.register_blueprint(index_bp)
+    app.register_blueprint(inventario_bp)
+    app.register_blueprint(compra_bp)
+    app.register_blueprint(interno_bp)
+    app.register_blueprint(metricas_bp)
+
+def create_app(registrar_rutas=True):
+    """
+    Crear la aplicación sin abrir conexiones a la BD, para que gunicorn
+    pueda cargarla una vez en el proceso maestro (preload_app) antes del
+    fork. El esquema se administra con migraciones: `flask db upgrade`
+    (una base creada antes con create_all se marca primero con
+    `flask db stamp 3f2a9c1d7b40`).
+    """
     app = Flask(__name__)
 
     # Obtener la URL de la base de datos que Render provee automáticamente
@@ -15,14 +58,60 @@ def create_app():
 
     app.config['SQLALCHEMY_DATABASE_URI'] = uri
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Pool de conexiones según DB_POOL_PERFIL (directo, pgbouncer, nulo)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = opciones_motor(uri)
+    # Réplica de lectura para reportes (DATABASE_REPLICA_URL, opcional)
+    configurar_replica(app, opciones_motor)
     app.config['SECRET_KEY'] = os.getenv("SECRET_KEY", "supersecreto")
+    # Token para los endpoints /interno/... (monitoreo); sin token no hay acceso
+    app.config['INTERNO_TOKEN'] = os.getenv("INTERNO_TOKEN")
+    # Token de Prometheus: solo abre /metrics
+    app.config['METRICAS_TOKEN'] = os.getenv("METRICAS_TOKEN")
 
-    db.init_app(app)
+    # Los snapshots de stock solo cubren hasta hace este tiempo: un movimiento
+    # fechado antes del corte pero confirmado después quedaría fuera del libro
+    app.config['SNAPSHOT_MARGEN_MINUTOS'] = int(os.getenv("SNAPSHOT_MARGEN_MINUTOS", 15))
+    # Tiempo que un carrito abierto del POS mantiene apartado el stock
+    app.config['RESERVA_TTL_SEGUNDOS'] = int(os.getenv("RESERVA_TTL_SEGUNDOS", 600))
+    # Vigencia máxima de los precios cacheados por proceso para el carrito del POS
+    # (los cambios llegan antes por el bus de invalidación)
+    app.config['CATALOGO_TTL_SEGUNDOS'] = int(os.getenv("CATALOGO_TTL_SEGUNDOS", 3600))
+    # Caché de consultas de los controladores (CACHE_CONSULTAS=0 la desactiva)
+    app.config['CACHE_CONSULTAS'] = os.getenv("CACHE_CONSULTAS", "1") != "0"
+    # Segundos que una llamada espera el reporte que ya está calculando otro hilo
+    app.config['CONSULTA_COMPARTIDA_ESPERA'] = float(os.getenv("CONSULTA_COMPARTIDA_ESPERA", 30))
 
-    bcrypt = Bcrypt()
-    bcrypt.init_app(app)
+    db.init_app(app)
+    migrate.init_app(app, db)
 
+    # Crear el engine no abre conexiones
     with app.app_context():
-        db.create_all()
+        instrumentar_pool(db.engine)
+
+    # Latencia, códigos de estado y SQL por endpoint (antes que los demás
+    # before_request, para medirlos también)
+    iniciar_metricas(app)
+    iniciar_invalidacion(app)
+
+    # Costo de bcrypt y cupos de hash por worker (BCRYPT_LOG_ROUNDS, BCRYPT_HILOS, ...)
+    iniciar_contrasenas(app)
+    # Límite de intentos de login por usuario e IP (LOGIN_INTENTOS_*, LOGIN_LIMITE_BACKEND)
+    iniciar_limites(app)
+
+    registrar_comandos(app)
+
+    # Trazas muestreadas de ruta, controladores, plantillas y SQL
+    # (TRAZAS_MUESTREO, TRAZAS_SALIDA); envuelve los controladores antes de
+    # que las rutas los importen
+    iniciar_trazas(app)
+    # Perfilador por muestreo, inactivo hasta que el operador lo activa
+    # (/interno/perfilador con INTERNO_TOKEN o `flask perfilador activar`)
+    iniciar_perfilador(app)
+    # Avisos de N+1, consultas lentas y presupuesto de SQL por endpoint en
+    # desarrollo y pruebas (DETECTOR_SQL, DETECTOR_SQL_ESTRICTO)
+    iniciar_detector_sql(app)
+
+    if registrar_rutas:
+        registrar_blueprints(app)
 
     return app
@@ -0,0 +1,298 @@
+import inspect
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from functools import wraps
+from time import monotonic
+from flask import g, has_request_context, current_app
+from sqlalchemy import select, update
+from app.models import db, VersionCache
+from app.invalidacion import suscribir
+from app.replica import leyendo_replica
+
+# ----------------------------------------------------------------------
+# Versiones de caché compartidas entre procesos
+# ----------------------------------------------------------------------
+def _versiones_request():
+    """Versiones ya leídas en este request (la BD se consulta una vez por clave)"""
+    if not has_request_context():
+        return {}
+    if '_versiones_cache' not in g:
+        g._versiones_cache = {}
+    return g._versiones_cache
+
+def obtener_version(clave):
+    """
+    Versión actual de una clave de caché
+    """
+    versiones = _versiones_request()
+    if clave not in versiones:
+        versiones[clave] = db.session.execute(
+            select(VersionCache.version).where(VersionCache.clave == clave)
+        ).scalar() or 0
+    return versiones[clave]
+
+def incrementar_version(clave):
+    """
+    Invalidar una clave en todos los procesos. Se ejecuta dentro de la
+    transacción de quien llama, así que solo cuenta si esa transacción se
+    confirma.
+    """
+    dialecto = db.session.get_bind().dialect.name
+
+    if dialecto in ('postgresql', 'sqlite'):
+        if dialecto == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as insertar
+        else:
+            from sqlalchemy.dialects.sqlite import insert as insertar
+
+        db.session.execute(
+            insertar(VersionCache)
+            .values(clave=clave, version=1)
+            .on_conflict_do_update(
+                index_elements=[VersionCache.clave],
+                set_={'version': VersionCache.version + 1}
+            )
+        )
+    else:
+        actualizadas = db.session.execute(
+            update(VersionCache)
+            .where(VersionCache.clave == clave)
+            .values(version=VersionCache.version + 1)
+        ).rowcount
+        if not actualizadas:
+            db.session.add(VersionCache(clave=clave, version=1))
+
+    _versiones_request().pop(clave, None)
+
+# ----------------------------------------------------------------------
+# Caché de resultados de consultas (por proceso, LRU + TTL)
+# ----------------------------------------------------------------------
+_caches = {}
+
+class CacheConsulta:
+    """
+    Resultados de una función de controlador por (id_empresa, argumentos).
+    Se guardan serializados: cada acierto entrega copias nuevas sin
+    consultar la BD.
+    """
+
+    def __init__(self, nombre, max_entradas, ttl):
+        self.nombre = nombre
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.entradas = OrderedDict()  # llave -> (vence, id_empresa, datos)
+        self.candado = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+        self.expulsiones = 0
+
+    def leer(self, llave):
+        with self.candado:
+            entrada = self.entradas.get(llave)
+            if entrada is None or entrada[0] < monotonic():
+                if entrada is not None:
+                    del self.entradas[llave]
+                self.fallos += 1
+                return None
+            self.entradas.move_to_end(llave)
+            self.aciertos += 1
+            return entrada[2]
+
+    def guardar(self, llave, id_empresa, datos):
+        with self.candado:
+            self.entradas[llave] = (monotonic() + self.ttl, id_empresa, datos)
+            self.entradas.move_to_end(llave)
+            while len(self.entradas) > self.max_entradas:
+                self.entradas.popitem(last=False)
+                self.expulsiones += 1
+
+    def invalidar(self, id_empresa, llave=None, columnas=None):
+        """Suscriptor del bus: descarta las entradas de la empresa (o todas)"""
+        with self.candado:
+            if id_empresa is None:
+                borradas = list(self.entradas)
+            else:
+                borradas = [l for l, e in self.entradas.items() if e[1] == id_empresa]
+            for l in borradas:
+                del self.entradas[l]
+            self.invalidaciones += len(borradas)
+
+    def estadisticas(self):
+        with self.candado:
+            consultas = self.aciertos + self.fallos
+            return {
+                'entradas': len(self.entradas),
+                'max_entradas': self.max_entradas,
+                'ttl': self.ttl,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': round(self.aciertos / consultas, 3) if consultas else 0,
+                'invalidaciones': self.invalidaciones,
+                'expulsiones': self.expulsiones
+            }
+
+def cache_consulta(*tablas, ttl=None, max_entradas=None):
+    """
+    Decorador para funciones de lectura de los controladores.
+
+    La llave es id_empresa más los argumentos. Las entradas se descartan
+    cuando el bus de invalidación informa un cambio en alguna de `tablas`
+    para esa empresa, o al vencer el TTL. El tipo de retorno no cambia.
+
+    Acierto o fallo, quien llama recibe una copia deserializada: las
+    instancias del modelo no pertenecen a ninguna sesión (detached). Se
+    pueden leer sus columnas y las relaciones que la función cargó con
+    joinedload/selectinload; una relación perezosa lanza
+    DetachedInstanceError. Por eso no se debe usar en funciones cuyo
+    resultado se modifica y guarda.
+    """
+    def decorador(funcion):
+        cache = CacheConsulta(
+            f"{funcion.__module__.rsplit('.', 1)[-1]}.{funcion.__name__}",
+            max_entradas or int(os.getenv("CACHE_CONSULTAS_MAX_ENTRADAS", 256)),
+            ttl or int(os.getenv("CACHE_CONSULTAS_TTL", 300))
+        )
+        _caches[cache.nombre] = cache
+        for tabla in tablas:
+            suscribir(tabla, cache.invalidar)
+
+        firma = inspect.signature(funcion)
+
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if not current_app.config.get('CACHE_CONSULTAS', True):
+                return funcion(*args, **kwargs)
+
+            argumentos = firma.bind(*args, **kwargs)
+            argumentos.apply_defaults()
+            id_empresa = argumentos.arguments.get('id_empresa')
+            llave = tuple(sorted(argumentos.arguments.items()))
+
+            try:
+                hash(llave)
+            except TypeError:
+                return funcion(*args, **kwargs)
+
+            datos = cache.leer(llave)
+            if datos is not None:
+                return pickle.loads(datos)
+
+            resultado = funcion(*args, **kwargs)
+
+            try:
+                datos = pickle.dumps(resultado)
+            except Exception as e:
+                print(f"No se pudo cachear {cache.nombre}: {str(e)}")
+                return resultado
+
+            # Lo leído de la réplica puede venir atrasado respecto a la
+            # invalidación que vació la entrada: no se guarda
+            if not leyendo_replica():
+                cache.guardar(llave, id_empresa, datos)
+
+            # Misma forma que un acierto: una relación perezosa que funcione
+            # en el primer request no debe fallar en el siguiente
+            return pickle.loads(datos)
+
+        envoltura.cache = cache
+        return envoltura
+    return decorador
+
+def estadisticas_cache():
+    """
+    Aciertos, fallos y tamaño de cada caché de consultas de este proceso
+    """
+    return {nombre: cache.estadisticas() for nombre, cache in sorted(_caches.items())}
+
+# ----------------------------------------------------------------------
+# Consultas compartidas (single-flight)
+#
+# Si varios hilos del proceso piden el mismo reporte con los mismos
+# argumentos a la vez, solo el primero lo calcula; los demás esperan y
+# reciben una copia de su resultado. El primero también devuelve una copia,
+# para que todos vean instancias sin sesión como en cache_consulta. No
+# guarda nada: cuando termina el cálculo, la siguiente llamada vuelve a
+# consultar la BD.
+#
+# La coordinación es por proceso: con W workers el mismo reporte se
+# calcula como mucho W veces a la vez, y con un solo hilo por worker no se
+# comparte nada (gunicorn.conf.py usa workers con hilos por eso).
+# ----------------------------------------------------------------------
+_en_curso = {}
+_candado_en_curso = threading.Lock()
+_estadisticas_compartidas = {}
+
+class _Calculo:
+    def __init__(self):
+        self.listo = threading.Event()
+        self.datos = None
+
+def consulta_compartida(funcion):
+    """
+    Decorador para reportes costosos: las llamadas concurrentes con los
+    mismos argumentos (id_empresa incluido) dentro del mismo proceso
+    esperan un único cálculo; otros workers hacen el suyo. Quien espera
+    más de CONSULTA_COMPARTIDA_ESPERA segundos, o si el resultado no se
+    puede copiar, hace su propia consulta.
+    """
+    nombre = f"{funcion.__module__.rsplit('.', 1)[-1]}.{funcion.__name__}"
+    contadores = _estadisticas_compartidas.setdefault(nombre, {'calculos': 0, 'compartidas': 0})
+    firma = inspect.signature(funcion)
+
+    @wraps(funcion)
+    def envoltura(*args, **kwargs):
+        argumentos = firma.bind(*args, **kwargs)
+        argumentos.apply_defaults()
+        llave = (nombre, tuple(sorted(argumentos.arguments.items())))
+
+        try:
+            hash(llave)
+        except TypeError:
+            return funcion(*args, **kwargs)
+
+        with _candado_en_curso:
+            calculo = _en_curso.get(llave)
+            lider = calculo is None
+            if lider:
+                calculo = _en_curso[llave] = _Calculo()
+
+        if not lider:
+            espera = current_app.config.get('CONSULTA_COMPARTIDA_ESPERA', 30)
+            if calculo.listo.wait(espera) and calculo.datos is not None:
+                contadores['compartidas'] += 1
+                return pickle.loads(calculo.datos)
+            return funcion(*args, **kwargs)
+
+        try:
+            resultado = funcion(*args, **kwargs)
+        except Exception:
+            with _candado_en_curso:
+                _en_curso.pop(llave, None)
+            calculo.listo.set()
+            raise
+
+        try:
+            datos = pickle.dumps(resultado)
+        except Exception as e:
+            print(f"No se pudo compartir {nombre}: {str(e)}")
+            datos = None
+
+        # Los que lleguen después de este punto inician un cálculo nuevo
+        with _candado_en_curso:
+            _en_curso.pop(llave, None)
+        contadores['calculos'] += 1
+
+        calculo.datos = datos
+        calculo.listo.set()
+        return resultado if datos is None else pickle.loads(datos)
+
+    return envoltura
+
+def estadisticas_consultas_compartidas():
+    """
+    Cálculos hechos y llamadas que reutilizaron un cálculo en curso
+    """
+    return {nombre: dict(c) for nombre, c in sorted(_estadisticas_compartidas.items())}
@@ -0,0 +1,14 @@
+from .inventario import inventario_cli
+from .seguridad import seguridad_cli
+from .trazas import trazas_cli
+from .perfilador import perfilador_cli
+from .datos import datos_cli
+
+
+def registrar_comandos(app):
+    """Registrar los comandos `flask ...` de la aplicación"""
+    app.cli.add_command(inventario_cli)
+    app.cli.add_command(seguridad_cli)
+    app.cli.add_command(trazas_cli)
+    app.cli.add_command(perfilador_cli)
+    app.cli.add_command(datos_cli)
@@ -0,0 +1,44 @@
+import click
+from datetime import datetime
+from flask.cli import AppGroup
+from app.datos_sinteticos import generar_datos_sinteticos
+
+datos_cli = AppGroup("datos", help="Datos sintéticos para pruebas de rendimiento.")
+
+
+def _fecha(valor):
+    try:
+        return datetime.strptime(valor, "%Y-%m-%d").date()
+    except ValueError:
+        raise click.BadParameter("Usa el formato AAAA-MM-DD")
+
+
+@datos_cli.command("generar")
+@click.option("--empresas", default=10, show_default=True)
+@click.option("--usuarios", default=5, show_default=True, help="Usuarios por empresa (el primero es admin).")
+@click.option("--productos", default=200, show_default=True, help="Productos por empresa.")
+@click.option("--meses", default=6, show_default=True, help="Meses de historial hasta --hasta.")
+@click.option("--ventas-dia", default=80, show_default=True, help="Ventas diarias de una empresa promedio.")
+@click.option("--sesgo", default=1.1, show_default=True, help="Exponente Zipf de la popularidad de productos.")
+@click.option("--semilla", default=1, show_default=True, help="Misma semilla y --hasta, mismos datos.")
+@click.option("--hasta", default=None, help="Último día de historial (AAAA-MM-DD); por defecto hoy.")
+@click.option("--contrasena", default="clave123", show_default=True, help="Contraseña de todos los usuarios.")
+def generar(empresas, usuarios, productos, meses, ventas_dia, sesgo, semilla, hasta, contrasena):
+    """Generar empresas, usuarios, catálogo y meses de ventas con carga masiva."""
+
+    def progreso(hechas, total, filas, segundos):
+        cantidad = sum(filas.values())
+        click.echo(f"  {hechas}/{total} empresas, {cantidad:,} filas, {cantidad / max(segundos, 1e-9):,.0f} filas/s")
+
+    resumen, error = generar_datos_sinteticos(
+        empresas, usuarios, productos, meses, ventas_dia, sesgo, semilla,
+        _fecha(hasta) if hasta else None, contrasena, progreso
+    )
+    if error:
+        raise click.ClickException(error)
+    click.echo(
+        f"{resumen['empresas']} empresas, {resumen['usuarios']} usuarios, {resumen['productos']:,} productos, "
+        f"{resumen['ventas']:,} ventas, {resumen['detalles']:,} detalles y {resumen['movimientos']:,} movimientos "
+        f"del {resumen['desde']} al {resumen['hasta']} en {resumen['segundos']} s"
+    )
+    click.echo(f"NIT de las empresas: {resumen['nits'][0]} ... {resumen['nits'][-1]}")
@@ -0,0 +1,168 @@
+import click
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from flask.cli import AppGroup
+from app.models import Empresa
+from app.controllers.reserva_controller import purgar_reservas_vencidas
+from app.controllers.carrito_controller import purgar_carritos_abandonados
+from app.controllers.inventario_controller import (
+    asegurar_particiones,
+    migrar_a_particionada,
+    tomar_snapshot,
+    archivar_movimientos,
+    listar_particiones,
+    conciliar_stock_empresa
+)
+
+inventario_cli = AppGroup("inventario", help="Mantenimiento del libro de movimientos de inventario.")
+
+
+def _fecha(valor):
+    try:
+        return datetime.strptime(valor, "%Y-%m-%d").date()
+    except ValueError:
+        raise click.BadParameter("Usa el formato AAAA-MM-DD")
+
+
+@inventario_cli.command("particiones")
+@click.option("--meses", default=3, show_default=True, help="Meses a crear por adelantado.")
+@click.option("--desde", default=None, help="Primer mes a crear (AAAA-MM-DD); por defecto el actual.")
+def particiones(meses, desde):
+    """Crear las particiones mensuales que falten (PostgreSQL)."""
+    creadas, error = asegurar_particiones(meses, _fecha(desde) if desde else None)
+    if error:
+        raise click.ClickException(error)
+    for nombre in creadas:
+        click.echo(f"Creada {nombre}")
+    click.echo(f"{len(creadas)} particiones creadas; {len(listar_particiones())} en total")
+
+
+@inventario_cli.command("migrar-particiones")
+def migrar_particiones():
+    """Convertir la tabla de movimientos existente en tabla particionada."""
+    copiadas, error = migrar_a_particionada()
+    if error:
+        raise click.ClickException(error)
+    click.echo(f"Tabla particionada; {copiadas} movimientos copiados")
+
+
+@inventario_cli.command("snapshot")
+@click.option("--fecha", default=None, help="Fecha de corte (AAAA-MM-DD); por defecto ahora menos SNAPSHOT_MARGEN_MINUTOS.")
+@click.option("--empresa", "id_empresa", type=int, default=None, help="Solo esta empresa.")
+def snapshot(fecha, id_empresa):
+    """Guardar el stock de cada producto en una fecha de corte."""
+    fecha_corte = _fecha(fecha).strftime("%Y-%m-%d 00:00:00") if fecha else None
+    empresas = [id_empresa] if id_empresa else [e.id_empresa for e in Empresa.query.all()]
+
+    total = 0
+    for empresa in empresas:
+        guardados, error = tomar_snapshot(empresa, fecha_corte)
+        if error:
+            raise click.ClickException(f"Empresa {empresa}: {error}")
+        total += guardados
+    click.echo(f"{total} snapshots guardados para {len(empresas)} empresas")
+
+
+@inventario_cli.command("purgar-reservas")
+@click.option("--horas", default=24, show_default=True, help="Antigüedad de los carritos abandonados.")
+def purgar_reservas(horas):
+    """Borrar las reservas vencidas y los carritos del POS abandonados."""
+    borradas, error = purgar_reservas_vencidas()
+    if error:
+        raise click.ClickException(error)
+    carritos, error = purgar_carritos_abandonados(horas)
+    if error:
+        raise click.ClickException(error)
+    click.echo(f"{borradas} reservas vencidas y {carritos} carritos abandonados borrados")
+
+
+@inventario_cli.command("archivar")
+@click.option("--hasta", required=True, help="Archivar los meses anteriores a esta fecha (AAAA-MM-DD).")
+def archivar(hasta):
+    """Desacoplar (o mover al archivo) los movimientos de meses antiguos."""
+    archivadas, error = archivar_movimientos(_fecha(hasta))
+    if error:
+        raise click.ClickException(error)
+    for nombre in archivadas:
+        click.echo(f"Archivada {nombre}")
+    if not archivadas:
+        click.echo("No hay meses para archivar")
+
+
+# ----------------------------------------------------------------------
+# Conciliación en paralelo
+# ----------------------------------------------------------------------
+_app_proceso = None
+
+
+def _iniciar_proceso():
+    """Cada proceso del pool crea su propia app y su propio pool de conexiones"""
+    global _app_proceso
+    from app import create_app
+    _app_proceso = create_app()
+
+
+def _conciliar_en_proceso(id_empresa, lote, reparar, fuente):
+    with _app_proceso.app_context():
+        inicio = time.perf_counter()
+        resultado, error = conciliar_stock_empresa(id_empresa, lote=lote, reparar=reparar, fuente=fuente)
+        if error:
+            return {'id_empresa': id_empresa, 'error': error}
+        resultado['segundos'] = round(time.perf_counter() - inicio, 3)
+        return resultado
+
+
+@inventario_cli.command("conciliar")
+@click.option("--empresa", "id_empresa", type=int, default=None, help="Solo esta empresa.")
+@click.option("--procesos", type=int, default=None, help="Procesos en paralelo (por defecto, uno por CPU hasta 8).")
+@click.option("--lote", type=int, default=1000, show_default=True, help="Productos por consulta.")
+@click.option("--reparar", is_flag=True, help="Corregir las diferencias encontradas.")
+@click.option("--fuente", type=click.Choice(["stock", "libro"]), default="stock", show_default=True,
+              help="Valor que se toma como correcto al reparar.")
+@click.option("--salida", type=click.Path(dir_okay=False), default=None, help="Guardar el reporte completo en JSON.")
+def conciliar(id_empresa, procesos, lote, reparar, fuente, salida):
+    """Comparar Producto.stock con el libro de movimientos, por empresa y en paralelo."""
+    empresas = [id_empresa] if id_empresa else [e.id_empresa for e in Empresa.query.order_by(Empresa.id_empresa)]
+    procesos = max(1, min(procesos or min(os.cpu_count() or 1, 8), len(empresas) or 1))
+
+    inicio = time.perf_counter()
+    resultados = []
+
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso) as pool:
+        tareas = [pool.submit(_conciliar_en_proceso, e, lote, reparar, fuente) for e in empresas]
+        for tarea in as_completed(tareas):
+            resultado = tarea.result()
+            resultados.append(resultado)
+            if 'error' in resultado:
+                click.echo(f"Empresa {resultado['id_empresa']}: ERROR {resultado['error']}", err=True)
+            else:
+                click.echo(
+                    f"Empresa {resultado['id_empresa']}: {resultado['productos']} productos, "
+                    f"{len(resultado['diferencias'])} diferencias"
+                    f"{', ' + str(resultado['reparados']) + ' reparadas' if reparar else ''} "
+                    f"({resultado['segundos']}s)"
+                )
+
+    segundos = time.perf_counter() - inicio
+    productos = sum(r.get('productos', 0) for r in resultados)
+    diferencias = sum(len(r.get('diferencias', [])) for r in resultados)
+    click.echo(
+        f"{len(empresas)} empresas, {productos} productos, {diferencias} diferencias en "
+        f"{segundos:.2f}s ({productos / segundos if segundos else 0:.0f} productos/s, {procesos} procesos)"
+    )
+
+    if salida:
+        with open(salida, "w", encoding="utf-8") as archivo:
+            json.dump({
+                'fecha': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                'reparar': reparar,
+                'fuente': fuente,
+                'empresas': sorted(resultados, key=lambda r: r['id_empresa'])
+            }, archivo, ensure_ascii=False, indent=2)
+        click.echo(f"Reporte guardado en {salida}")
+
+    if any('error' in r for r in resultados):
+        raise SystemExit(1)
@@ -0,0 +1,36 @@
+import click
+import json
+from flask.cli import AppGroup
+from app.perfilador import activar_perfilador, desactivar_perfilador, estado_perfilador
+
+perfilador_cli = AppGroup("perfilador", help="Perfilador por muestreo de requests en producción.")
+
+
+@perfilador_cli.command("activar")
+@click.option("--cada", default=1, show_default=True, help="Perfilar 1 de cada N requests que cumplan el filtro.")
+@click.option("--endpoint", default=None, help="Solo este endpoint (p. ej. venta.procesar_venta).")
+@click.option("--ruta", default=None, help="Solo rutas que empiecen así (p. ej. /venta/).")
+@click.option("--empresa", "id_empresa", type=int, default=None, help="Solo requests de esta empresa.")
+@click.option("--segundos", default=600, show_default=True, help="Se apaga solo después de este tiempo.")
+@click.option("--max-requests", default=200, show_default=True, help="Máximo de requests perfilados por worker.")
+def activar(cada, endpoint, ruta, id_empresa, segundos, max_requests):
+    """Activar el perfilador en todos los workers."""
+    activacion, error = activar_perfilador(cada, endpoint, ruta, id_empresa, segundos, max_requests)
+    if error:
+        raise click.ClickException(error)
+    click.echo(json.dumps(activacion, indent=2))
+
+
+@perfilador_cli.command("desactivar")
+def desactivar():
+    """Apagar el perfilador."""
+    desactivado, error = desactivar_perfilador()
+    if error:
+        raise click.ClickException(error)
+    click.echo("Perfilador desactivado" if desactivado else "El perfilador no estaba activo")
+
+
+@perfilador_cli.command("estado")
+def estado():
+    """Mostrar la activación vigente."""
+    click.echo(json.dumps(estado_perfilador()['activacion'], indent=2))
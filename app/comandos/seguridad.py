@@ -0,0 +1,14 @@
+import click
+from flask.cli import AppGroup
+from app.limites import purgar_limites
+
+seguridad_cli = AppGroup("seguridad", help="Mantenimiento de los controles de acceso.")
+
+
+@seguridad_cli.command("purgar-limites")
+def purgar_limites_login():
+    """Borrar las cubetas de intentos de login ya recargadas (backend tabla)."""
+    borradas, error = purgar_limites()
+    if error:
+        raise click.ClickException(error)
+    click.echo(f"{borradas} cubetas de intentos borradas")
@@ -0,0 +1,105 @@
+import click
+import glob
+import json
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from flask import current_app
+from flask.cli import AppGroup
+
+trazas_cli = AppGroup("trazas", help="Colector local y consulta de trazas de requests.")
+
+
+def _span_desde_otlp(span):
+    atributos = {}
+    for a in span.get("attributes", []):
+        valor = a.get("value", {})
+        atributos[a["key"]] = next(iter(valor.values()), None)
+    inicio = int(span["startTimeUnixNano"])
+    return {
+        "trace_id": span["traceId"],
+        "span_id": span["spanId"],
+        "parent_id": span.get("parentSpanId") or None,
+        "nombre": span["name"],
+        "tipo": atributos.pop("tipo", None),
+        "inicio_ns": inicio,
+        "duracion_ms": round((int(span["endTimeUnixNano"]) - inicio) / 1e6, 3),
+        "atributos": atributos,
+        "error": span.get("status", {}).get("message"),
+    }
+
+
+@trazas_cli.command("colector")
+@click.option("--puerto", default=4318, show_default=True)
+@click.option("--archivo", default="trazas_colector.jsonl", show_default=True, help="Dónde guardar los spans recibidos.")
+def colector(puerto, archivo):
+    """Recibir trazas OTLP/HTTP JSON (POST /v1/traces) y guardarlas como JSON lines."""
+
+    class Receptor(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != "/v1/traces":
+                self.send_response(404)
+                self.end_headers()
+                return
+            try:
+                datos = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                spans = [
+                    _span_desde_otlp(span)
+                    for recurso in datos.get("resourceSpans", [])
+                    for alcance in recurso.get("scopeSpans", [])
+                    for span in alcance.get("spans", [])
+                ]
+            except (ValueError, KeyError) as e:
+                self.send_response(400)
+                self.end_headers()
+                self.wfile.write(str(e).encode("utf-8"))
+                return
+
+            with open(archivo, "a", encoding="utf-8") as salida:
+                for span in spans:
+                    salida.write(json.dumps(span, ensure_ascii=False) + "\n")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, formato, *args):
+            pass
+
+    click.echo(f"Colector de trazas en http://127.0.0.1:{puerto}/v1/traces -> {archivo}")
+    ThreadingHTTPServer(("0.0.0.0", puerto), Receptor).serve_forever()
+
+
+@trazas_cli.command("ver")
+@click.argument("trace_id")
+@click.option("--archivos", default=None, help="Patrón de archivos JSON lines; por defecto los de TRAZAS_ARCHIVO.")
+def ver(trace_id, archivos):
+    """Mostrar los spans de una traza como árbol con sus duraciones."""
+    if not archivos:
+        base, extension = os.path.splitext(current_app.config["TRAZAS_ARCHIVO"])
+        archivos = f"{base}*{extension or '.jsonl'}*"
+
+    spans = []
+    for ruta in glob.glob(archivos):
+        with open(ruta, encoding="utf-8") as entrada:
+            for linea in entrada:
+                if trace_id in linea:
+                    span = json.loads(linea)
+                    if span["trace_id"] == trace_id:
+                        spans.append(span)
+    if not spans:
+        raise click.ClickException(f"No se encontró la traza {trace_id} en {archivos}")
+
+    hijos = {}
+    ids = {s["span_id"] for s in spans}
+    for span in sorted(spans, key=lambda s: s["inicio_ns"]):
+        padre = span["parent_id"] if span["parent_id"] in ids else None
+        hijos.setdefault(padre, []).append(span)
+
+    def imprimir(padre, nivel):
+        for span in hijos.get(padre, []):
+            detalle = span["atributos"].get("db.statement", "") if span["tipo"] == "sql" else ""
+            error = f"  ❌ {span['error']}" if span.get("error") else ""
+            click.echo(f"{'  ' * nivel}{span['duracion_ms']:9.3f} ms  [{span['tipo']}] {span['nombre']} {detalle[:100]}{error}")
+            imprimir(span["span_id"], nivel + 1)
+
+    imprimir(None, 0)
@@ -0,0 +1,180 @@
+import os
+import threading
+from time import perf_counter
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+# ----------------------------------------------------------------------
+# Pool de conexiones
+#
+# SQLALCHEMY_ENGINE_OPTIONS se arma según DB_POOL_PERFIL:
+#   directo    app -> PostgreSQL (por defecto)
+#   pgbouncer  app -> PgBouncer en modo transacción: pool local pequeño, sin
+#              opciones de sesión (statement_timeout) ni LISTEN, que se
+#              pierden al cambiar de conexión del servidor
+#   nulo       sin pool local (cada checkout abre conexión; para scripts)
+# Cada valor se puede sobrescribir con DB_POOL_SIZE, DB_MAX_OVERFLOW,
+# DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING y DB_STATEMENT_TIMEOUT_MS.
+# ----------------------------------------------------------------------
+PERFILES = {
+    'directo': {'pool_size': 5, 'max_overflow': 10, 'pool_timeout': 10, 'pool_recycle': 1800, 'pool_pre_ping': True},
+    'pgbouncer': {'pool_size': 2, 'max_overflow': 3, 'pool_timeout': 5, 'pool_recycle': 300, 'pool_pre_ping': True},
+    'nulo': {},
+}
+
+# Esperas para el histograma de checkout, en milisegundos
+LIMITES_ESPERA_MS = (1, 5, 10, 50, 100, 500, 1000)
+
+def _entero(nombre, valor):
+    return int(os.getenv(nombre, valor))
+
+def opciones_motor(uri):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS para la URI y el perfil del entorno
+    """
+    perfil = os.getenv("DB_POOL_PERFIL", "directo")
+    if perfil not in PERFILES:
+        raise ValueError(f"DB_POOL_PERFIL desconocido: {perfil} (usa {', '.join(PERFILES)})")
+
+    # SQLite (desarrollo): solo se mide el pool por defecto; en memoria no hay pool
+    if not uri or uri.startswith("sqlite"):
+        return {'poolclass': PoolMedido} if uri and ":memory:" not in uri and uri != "sqlite://" else {}
+
+    if perfil == 'nulo':
+        from sqlalchemy.pool import NullPool
+        return {'poolclass': NullPool}
+
+    base = PERFILES[perfil]
+    opciones = {
+        'poolclass': PoolMedido,
+        'pool_size': _entero("DB_POOL_SIZE", base['pool_size']),
+        'max_overflow': _entero("DB_MAX_OVERFLOW", base['max_overflow']),
+        'pool_timeout': _entero("DB_POOL_TIMEOUT", base['pool_timeout']),
+        'pool_recycle': _entero("DB_POOL_RECYCLE", base['pool_recycle']),
+        'pool_pre_ping': os.getenv("DB_POOL_PRE_PING", "1" if base['pool_pre_ping'] else "0") != "0",
+    }
+
+    timeout_ms = _entero("DB_STATEMENT_TIMEOUT_MS", 0)
+    if timeout_ms and perfil != 'pgbouncer' and uri.startswith("postgresql"):
+        opciones['connect_args'] = {'options': f"-c statement_timeout={timeout_ms}"}
+
+    return opciones
+
+def perfil_pool():
+    return os.getenv("DB_POOL_PERFIL", "directo")
+
+# ----------------------------------------------------------------------
+# Métricas del pool (por proceso)
+# ----------------------------------------------------------------------
+class PoolMedido(QueuePool):
+    """
+    QueuePool que mide cuánto tarda cada checkout (espera por una conexión
+    libre, creación y pre-ping) y cuenta los que vencen por pool_timeout
+    """
+
+    def connect(self):
+        inicio = perf_counter()
+        try:
+            conexion = super().connect()
+        except exc.TimeoutError:
+            _metricas.registrar_timeout()
+            raise
+        _metricas.registrar_checkout(perf_counter() - inicio)
+        return conexion
+
+class MetricasPool:
+
+    def __init__(self):
+        self.candado = threading.Lock()
+        self.motor = None
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self.candado:
+            self.checkouts = 0
+            self.espera_total = 0.0
+            self.espera_max = 0.0
+            self.histograma = [0] * (len(LIMITES_ESPERA_MS) + 1)
+            self.timeouts = 0
+            self.conexiones_nuevas = 0
+            self.invalidadas = 0
+            self.en_uso_max = 0
+            self.pid = os.getpid()
+
+    def registrar_checkout(self, segundos):
+        milisegundos = segundos * 1000
+        indice = next((i for i, limite in enumerate(LIMITES_ESPERA_MS) if milisegundos <= limite), len(LIMITES_ESPERA_MS))
+        with self.candado:
+            self.checkouts += 1
+            self.espera_total += segundos
+            self.espera_max = max(self.espera_max, segundos)
+            self.histograma[indice] += 1
+            if self.motor is not None and isinstance(self.motor.pool, QueuePool):
+                self.en_uso_max = max(self.en_uso_max, self.motor.pool.checkedout())
+
+    def registrar_timeout(self):
+        with self.candado:
+            self.timeouts += 1
+
+    def resumen(self):
+        # Después de un fork los contadores heredados no son de este worker
+        if self.pid != os.getpid():
+            self.reiniciar()
+
+        with self.candado:
+            datos = {
+                'pid': self.pid,
+                'perfil': perfil_pool(),
+                'checkouts': self.checkouts,
+                'espera_media_ms': round(self.espera_total / self.checkouts * 1000, 3) if self.checkouts else 0,
+                'espera_max_ms': round(self.espera_max * 1000, 3),
+                'histograma_espera_ms': {
+                    (f"<={limite}" if i < len(LIMITES_ESPERA_MS) else f">{LIMITES_ESPERA_MS[-1]}"): cantidad
+                    for i, (limite, cantidad) in enumerate(zip(LIMITES_ESPERA_MS + (None,), self.histograma))
+                },
+                'timeouts': self.timeouts,
+                'conexiones_nuevas': self.conexiones_nuevas,
+                'invalidadas': self.invalidadas,
+                'en_uso_max': self.en_uso_max,
+            }
+            # engine.dispose() reemplaza el pool: siempre se lee el actual
+            pool = self.motor.pool if self.motor is not None else None
+
+        if pool is not None:
+            datos['estado'] = {'clase': type(pool).__name__, 'descripcion': pool.status()}
+            if isinstance(pool, QueuePool):
+                datos['estado'].update({
+                    'tamano': pool.size(),
+                    'en_uso': pool.checkedout(),
+                    'libres': pool.checkedin(),
+                    'overflow': pool.overflow(),
+                    'max_overflow': pool._max_overflow,
+                    'timeout': pool.timeout(),
+                })
+        return datos
+
+_metricas = MetricasPool()
+
+def _al_conectar(conexion, registro):
+    with _metricas.candado:
+        _metricas.conexiones_nuevas += 1
+
+def _al_invalidar(conexion, registro, excepcion):
+    with _metricas.candado:
+        _metricas.invalidadas += 1
+
+def instrumentar_pool(engine):
+    """
+    Conectar los eventos del pool del engine a las métricas del proceso
+    """
+    _metricas.motor = engine
+    if not event.contains(engine, "connect", _al_conectar):
+        event.listen(engine, "connect", _al_conectar)
+        event.listen(engine, "invalidate", _al_invalidar)
+        event.listen(engine, "soft_invalidate", _al_invalidar)
+
+def metricas_pool():
+    """
+    Contadores y estado actual del pool de este worker
+    """
+    return _metricas.resumen()
@@ -0,0 +1,88 @@
+import os
+import threading
+from flask import current_app
+from flask_bcrypt import Bcrypt
+
+# ----------------------------------------------------------------------
+# Hash de contraseñas
+#
+# bcrypt libera el GIL mientras calcula. El hash corre en el hilo del
+# request, pero solo si consigue uno de los BCRYPT_HILOS cupos de cálculo;
+# si no, espera en cola hasta BCRYPT_ESPERA_SEGUNDOS. Si ya hay
+# BCRYPT_MAX_PENDIENTES esperando, el intento se rechaza en vez de
+# acumular espera.
+#
+# Los cupos son semáforos de hilos de cada worker: el límite efectivo del
+# servidor es BCRYPT_HILOS * WEB_CONCURRENCY hashes a la vez. Por eso
+# BCRYPT_HILOS vale por defecto los núcleos repartidos entre los workers.
+# No se comparten entre procesos a propósito: un worker que muere (SIGKILL,
+# timeout de gunicorn) con un cupo tomado lo perdería para siempre. Cada
+# worker crea los suyos después del fork (post_fork en gunicorn.conf.py, o
+# al primer uso en un proceso nuevo).
+# Un login en espera solo ocupa su hilo: con workers gthread (ver
+# gunicorn.conf.py) los demás hilos del worker siguen atendiendo.
+# ----------------------------------------------------------------------
+bcrypt = Bcrypt()
+
+class HashOcupado(Exception):
+    """Demasiados hashes en curso en el worker"""
+
+_cupos = {'pid': None, 'calculo': None, 'admitidos': None}
+_candado_cupos = threading.Lock()
+
+def iniciar_contrasenas(app):
+    """
+    Configurar el costo de bcrypt y los cupos de hash por worker
+    """
+    nucleos = os.cpu_count() or 2
+    workers = max(1, int(os.getenv("WEB_CONCURRENCY", 2)))
+    app.config.setdefault('BCRYPT_LOG_ROUNDS', int(os.getenv("BCRYPT_LOG_ROUNDS", 12)))
+    app.config.setdefault('BCRYPT_HILOS', int(os.getenv("BCRYPT_HILOS", max(1, nucleos // workers))))
+    app.config.setdefault('BCRYPT_MAX_PENDIENTES', int(os.getenv("BCRYPT_MAX_PENDIENTES", 32)))
+    app.config.setdefault('BCRYPT_ESPERA_SEGUNDOS', float(os.getenv("BCRYPT_ESPERA_SEGUNDOS", 10)))
+    bcrypt.init_app(app)
+
+def reiniciar_cupos(config):
+    """
+    Crear los cupos de este proceso (gunicorn.conf.py lo llama en post_fork)
+    """
+    with _candado_cupos:
+        _cupos['calculo'] = threading.BoundedSemaphore(config['BCRYPT_HILOS'])
+        _cupos['admitidos'] = threading.BoundedSemaphore(config['BCRYPT_HILOS'] + config['BCRYPT_MAX_PENDIENTES'])
+        _cupos['pid'] = os.getpid()
+
+def _ejecutar(funcion, *args):
+    if _cupos['pid'] != os.getpid():
+        reiniciar_cupos(current_app.config)
+    admitidos, calculo = _cupos['admitidos'], _cupos['calculo']
+    if not admitidos.acquire(blocking=False):
+        raise HashOcupado("Demasiados inicios de sesión en curso, intenta de nuevo en unos segundos")
+    try:
+        if not calculo.acquire(timeout=current_app.config['BCRYPT_ESPERA_SEGUNDOS']):
+            raise HashOcupado("Demasiados inicios de sesión en curso, intenta de nuevo en unos segundos")
+        try:
+            return funcion(*args)
+        finally:
+            calculo.release()
+    finally:
+        admitidos.release()
+
+def generar_hash(contrasena):
+    """
+    Hash bcrypt con el costo configurado (BCRYPT_LOG_ROUNDS)
+    """
+    rondas = current_app.config['BCRYPT_LOG_ROUNDS']
+    return _ejecutar(bcrypt.generate_password_hash, contrasena, rondas).decode("utf-8")
+
+def verificar_contrasena(hash_guardado, contrasena):
+    return _ejecutar(bcrypt.check_password_hash, hash_guardado, contrasena)
+
+def necesita_rehash(hash_guardado):
+    """
+    True si el hash se generó con un costo distinto al configurado
+    ($2b$<costo>$...)
+    """
+    try:
+        return int(hash_guardado.split("$")[2]) != current_app.config['BCRYPT_LOG_ROUNDS']
+    except (AttributeError, IndexError, ValueError):
+        return False
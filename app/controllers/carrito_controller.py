@@ -0,0 +1,400 @@
+from app.models import db, Producto, Venta, DetalleVenta, MovimientoInventario, Carrito, ItemCarrito, ReservaStock
+from app.controllers.reserva_controller import reservar_stock, liberar_reservas
+from app.invalidacion import suscribir
+from flask import current_app
+from datetime import datetime, timedelta
+from time import monotonic
+from sqlalchemy import select, insert, update, delete, func, literal
+
+# ----------------------------------------------------------------------
+# Catálogo de precios en memoria (por proceso)
+# ----------------------------------------------------------------------
+_catalogo = {}
+
+def obtener_precio_catalogo(id_empresa, id_producto):
+    """
+    (nombre, precio) del producto, leído del catálogo en memoria. Las
+    entradas se invalidan por el bus cuando cambia el producto en cualquier
+    proceso; CATALOGO_TTL_SEGUNDOS es solo un límite de seguridad.
+    """
+    llave = (id_empresa, id_producto)
+    entrada = _catalogo.get(llave)
+    if entrada and entrada[2] > monotonic():
+        return entrada[0], entrada[1]
+
+    fila = db.session.execute(
+        select(Producto.nombre, Producto.precio).where(
+            Producto.id_producto == id_producto,
+            Producto.id_empresa == id_empresa
+        )
+    ).first()
+    if not fila:
+        _catalogo.pop(llave, None)
+        return None
+
+    ttl = current_app.config.get('CATALOGO_TTL_SEGUNDOS', 3600)
+    _catalogo[llave] = (fila.nombre, fila.precio, monotonic() + ttl)
+    return fila.nombre, fila.precio
+
+def invalidar_catalogo(id_empresa, id_producto=None):
+    """
+    Quitar del catálogo un producto, todos los de la empresa o, con
+    id_empresa None, todo el catálogo
+    """
+    if id_empresa is None:
+        _catalogo.clear()
+        return
+    if id_producto is not None:
+        _catalogo.pop((id_empresa, id_producto), None)
+        return
+    for llave in [l for l in _catalogo if l[0] == id_empresa]:
+        _catalogo.pop(llave, None)
+
+def _al_cambiar_producto(id_empresa, id_producto, columnas):
+    # El catálogo solo guarda nombre y precio: los cambios de stock no lo afectan
+    if columnas and set(columnas) <= {'stock'}:
+        return
+    invalidar_catalogo(id_empresa, id_producto)
+
+suscribir('producto', _al_cambiar_producto)
+
+# ----------------------------------------------------------------------
+# Carrito del punto de venta
+# ----------------------------------------------------------------------
+def _ahora():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def _totales(carrito, subtotal=None, cantidad=None):
+    """Totales del carrito; subtotal y cantidad reemplazan a los acumulados"""
+    subtotal = carrito.subtotal if subtotal is None else subtotal
+    cantidad = carrito.cantidad if cantidad is None else cantidad
+    descuento_valor = (subtotal * carrito.descuento / 100) if carrito.descuento > 0 else 0
+    return {
+        'cantidad_total': cantidad,
+        'subtotal': subtotal,
+        'descuento_porcentaje': carrito.descuento,
+        'descuento_valor': descuento_valor,
+        'total': int(subtotal - descuento_valor)
+    }
+
+def _linea(item):
+    return {
+        'id_producto': item.id_producto,
+        'cantidad': item.cantidad,
+        'precio_unitario': item.precio_unitario,
+        'subtotal': item.subtotal
+    }
+
+def obtener_carrito(id_empresa, id_carrito):
+    """
+    Obtener un carrito de la empresa
+    """
+    try:
+        return Carrito.query.filter_by(id_carrito=id_carrito, id_empresa=id_empresa).first()
+    except Exception as e:
+        print(f"Error al obtener carrito: {str(e)}")
+        return None
+
+def _borrar_carrito(id_empresa, id_carrito):
+    """
+    Borrar el carrito, sus líneas y sus reservas (no confirma la transacción).
+    Solo si el carrito es de la empresa: el id llega del cliente.
+    """
+    carrito_empresa = select(Carrito.id_carrito).where(
+        Carrito.id_carrito == id_carrito,
+        Carrito.id_empresa == id_empresa
+    )
+    db.session.execute(
+        delete(ItemCarrito).where(ItemCarrito.id_carrito.in_(carrito_empresa))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        delete(Carrito).where(Carrito.id_carrito == id_carrito, Carrito.id_empresa == id_empresa)
+        .execution_options(synchronize_session=False)
+    )
+    _, error = liberar_reservas(id_empresa, id_carrito, confirmar=False)
+    if error:
+        raise Exception(error)
+
+def _bloquear_carrito(id_empresa, id_carrito):
+    """
+    Leer el carrito con SELECT ... FOR UPDATE: los cambios concurrentes del
+    mismo carrito (el POS envía un request por cada tecla) esperan su turno
+    en vez de pisarse los totales
+    """
+    return db.session.execute(
+        select(Carrito)
+        .where(Carrito.id_carrito == id_carrito, Carrito.id_empresa == id_empresa)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    ).scalar_one_or_none()
+
+def _obtener_o_crear_carrito(id_empresa, id_carrito, id_usuario):
+    carrito = _bloquear_carrito(id_empresa, id_carrito)
+    if carrito:
+        return carrito
+    if db.session.get(Carrito, id_carrito):
+        # El id existe en otra empresa
+        return None
+
+    carrito = Carrito(
+        id_carrito=id_carrito,
+        descuento=0,
+        subtotal=0,
+        cantidad=0,
+        actualizado_en=_ahora(),
+        id_usuario=id_usuario,
+        id_empresa=id_empresa
+    )
+    db.session.add(carrito)
+    return carrito
+
+def actualizar_item_carrito(id_empresa, id_carrito, id_producto, id_usuario, cantidad=None, delta=None):
+    """
+    Cambiar una línea del carrito y ajustar los totales por diferencia.
+
+    Se indica la cantidad final o un delta (+1, -1). El precio sale del
+    catálogo y queda fijo en la línea; la reserva de stock se actualiza en
+    la misma transacción. El costo no depende del tamaño del carrito.
+
+    Retorna ({'linea', 'totales', 'disponible'}, error).
+    """
+    try:
+        if not id_carrito:
+            return None, "Carrito no válido"
+
+        carrito = _obtener_o_crear_carrito(id_empresa, id_carrito, id_usuario)
+        if not carrito:
+            return None, "Carrito no encontrado"
+
+        # Con el carrito bloqueado la línea no cambia hasta el commit
+        item = db.session.get(ItemCarrito, (id_carrito, id_producto), populate_existing=True)
+        cantidad_anterior = item.cantidad if item else 0
+
+        if cantidad is None:
+            cantidad = cantidad_anterior + int(delta or 0)
+        cantidad = int(cantidad)
+        if cantidad < 0:
+            db.session.rollback()
+            return None, "La cantidad no puede ser negativa"
+
+        if item:
+            precio = item.precio_unitario
+        else:
+            if cantidad == 0:
+                db.session.rollback()
+                return {'linea': None, 'totales': _totales(carrito), 'disponible': None}, None
+            catalogo = obtener_precio_catalogo(id_empresa, id_producto)
+            if not catalogo:
+                db.session.rollback()
+                return None, "Producto no encontrado"
+            precio = catalogo[1]
+
+        disponible, error = reservar_stock(
+            id_empresa, id_carrito, id_producto, cantidad, id_usuario, confirmar=False
+        )
+        if error:
+            db.session.rollback()
+            return {'linea': _linea(item) if item else None, 'disponible': max(disponible, 0)}, error
+
+        # Totales por diferencia (seguro: el carrito está bloqueado); no se
+        # recorre el resto del carrito
+        carrito.subtotal += (cantidad - cantidad_anterior) * precio
+        carrito.cantidad += cantidad - cantidad_anterior
+        carrito.actualizado_en = _ahora()
+
+        if cantidad == 0:
+            db.session.delete(item)
+            linea = None
+        else:
+            if not item:
+                item = ItemCarrito(id_carrito=id_carrito, id_producto=id_producto, precio_unitario=precio)
+                db.session.add(item)
+            item.cantidad = cantidad
+            item.subtotal = cantidad * precio
+            linea = _linea(item)
+
+        db.session.commit()
+        return {'linea': linea, 'totales': _totales(carrito), 'disponible': disponible}, None
+
+    except ValueError:
+        db.session.rollback()
+        return None, "La cantidad debe ser un número entero"
+    except Exception as e:
+        db.session.rollback()
+        return None, f"Error al actualizar carrito: {str(e)}"
+
+def fijar_descuento_carrito(id_empresa, id_carrito, descuento, id_usuario):
+    """
+    Cambiar el porcentaje de descuento del carrito
+    """
+    try:
+        descuento = float(descuento or 0)
+        if descuento < 0 or descuento > 100:
+            return None, "El descuento debe estar entre 0 y 100"
+
+        carrito = _obtener_o_crear_carrito(id_empresa, id_carrito, id_usuario)
+        if not carrito:
+            return None, "Carrito no encontrado"
+
+        carrito.descuento = descuento
+        carrito.actualizado_en = _ahora()
+        db.session.commit()
+        return _totales(carrito), None
+
+    except ValueError:
+        return None, "El descuento debe ser un número"
+    except Exception as e:
+        db.session.rollback()
+        return None, f"Error al aplicar descuento: {str(e)}"
+
+def vaciar_carrito(id_empresa, id_carrito):
+    """
+    Borrar el carrito con sus líneas y liberar sus reservas
+    """
+    try:
+        _borrar_carrito(id_empresa, id_carrito)
+        db.session.commit()
+        return True, None
+    except Exception as e:
+        db.session.rollback()
+        return False, f"Error al vaciar carrito: {str(e)}"
+
+def cobrar_carrito(id_empresa, id_carrito, metodo_pago, id_usuario):
+    """
+    Convertir el carrito en una venta.
+
+    Se cobran los precios ya guardados en las líneas del carrito, con el
+    carrito bloqueado; los totales salen de un SUM() sobre esas mismas líneas
+    y no de los acumulados, así la venta cuadra con sus detalles. El stock se
+    valida con una sola consulta (bloqueando las filas de los productos), los
+    detalles y las salidas de inventario se insertan con INSERT ... SELECT y
+    el stock se descuenta con un único UPDATE.
+    """
+    try:
+        carrito = _bloquear_carrito(id_empresa, id_carrito)
+        if not carrito:
+            db.session.rollback()
+            return None, "No hay productos en la venta"
+
+        subtotal, cantidad_total = db.session.execute(
+            select(
+                func.coalesce(func.sum(ItemCarrito.subtotal), 0),
+                func.coalesce(func.sum(ItemCarrito.cantidad), 0)
+            ).where(ItemCarrito.id_carrito == id_carrito)
+        ).one()
+        if cantidad_total <= 0:
+            db.session.rollback()
+            return None, "No hay productos en la venta"
+
+        ahora = _ahora()
+        productos_carrito = select(ItemCarrito.id_producto).where(ItemCarrito.id_carrito == id_carrito)
+
+        reservado_otros = select(func.coalesce(func.sum(ReservaStock.cantidad), 0)).where(
+            ReservaStock.id_producto == Producto.id_producto,
+            ReservaStock.id_carrito != id_carrito,
+            ReservaStock.expira_en > ahora
+        ).scalar_subquery()
+
+        lineas = db.session.execute(
+            select(Producto.nombre, Producto.stock - reservado_otros, ItemCarrito.cantidad)
+            .join(ItemCarrito, ItemCarrito.id_producto == Producto.id_producto)
+            .where(
+                ItemCarrito.id_carrito == id_carrito,
+                Producto.id_empresa == id_empresa
+            )
+            .with_for_update(of=Producto)
+        ).all()
+        for nombre, disponible, cantidad in lineas:
+            if disponible < cantidad:
+                db.session.rollback()
+                return None, f"Stock insuficiente para {nombre}. Disponible: {max(int(disponible), 0)}"
+
+        totales = _totales(carrito, int(subtotal), int(cantidad_total))
+        venta = Venta(
+            fecha_hora=ahora,
+            metodo_pago=metodo_pago,
+            total=totales['total'],
+            subtotal=totales['subtotal'],
+            cantidad=totales['cantidad_total'],
+            id_usuario=id_usuario,
+            id_empresa=id_empresa
+        )
+        db.session.add(venta)
+        db.session.flush()  # Para obtener el ID de la venta
+
+        db.session.execute(
+            insert(DetalleVenta).from_select(
+                ['id_detalle', 'id_venta', 'id_producto', 'cantidad', 'precio_unitario', 'subtotal'],
+                select(
+                    literal(f"DET_{venta.id_venta}_") + ItemCarrito.id_producto,
+                    literal(venta.id_venta),
+                    ItemCarrito.id_producto,
+                    ItemCarrito.cantidad,
+                    ItemCarrito.precio_unitario,
+                    ItemCarrito.subtotal
+                ).where(ItemCarrito.id_carrito == id_carrito)
+            )
+        )
+
+        db.session.execute(
+            insert(MovimientoInventario).from_select(
+                ['id_movimiento', 'tipo_movimiento', 'fecha_hora', 'cantidad', 'id_producto', 'id_usuario'],
+                select(
+                    literal(f"VTA_{venta.id_venta}_") + ItemCarrito.id_producto,
+                    literal("SALIDA"),
+                    literal(ahora),
+                    ItemCarrito.cantidad,
+                    ItemCarrito.id_producto,
+                    literal(id_usuario)
+                ).where(ItemCarrito.id_carrito == id_carrito)
+            )
+        )
+
+        cantidad_vendida = select(ItemCarrito.cantidad).where(
+            ItemCarrito.id_carrito == id_carrito,
+            ItemCarrito.id_producto == Producto.id_producto
+        ).scalar_subquery()
+
+        db.session.execute(
+            update(Producto)
+            .where(
+                Producto.id_empresa == id_empresa,
+                Producto.id_producto.in_(productos_carrito)
+            )
+            .values(stock=Producto.stock - cantidad_vendida)
+            .execution_options(synchronize_session=False)
+        )
+
+        _borrar_carrito(id_empresa, id_carrito)
+
+        db.session.commit()
+
+        # Los productos cargados en la sesión tienen el stock anterior
+        db.session.expire_all()
+
+        return venta, None
+
+    except Exception as e:
+        db.session.rollback()
+        return None, f"Error al procesar venta: {str(e)}"
+
+def purgar_carritos_abandonados(horas=24):
+    """
+    Borrar carritos sin cambios en las últimas `horas`
+    """
+    try:
+        limite = (datetime.now() - timedelta(hours=horas)).strftime("%Y-%m-%d %H:%M:%S")
+        abandonados = select(Carrito.id_carrito).where(Carrito.actualizado_en < limite)
+
+        db.session.execute(
+            delete(ItemCarrito).where(ItemCarrito.id_carrito.in_(abandonados))
+        )
+        resultado = db.session.execute(
+            delete(Carrito).where(Carrito.actualizado_en < limite)
+        )
+        db.session.commit()
+        return resultado.rowcount, None
+    except Exception as e:
+        db.session.rollback()
+        return 0, f"Error al purgar carritos: {str(e)}"
@@ -0,0 +1,244 @@
+from app.models import db, Proveedor, Producto, Compra, DetalleCompra, MovimientoInventario
+from datetime import datetime
+from sqlalchemy import select, insert, update, func, cast, literal, desc, String
+from sqlalchemy.orm import joinedload
+from sqlalchemy.exc import IntegrityError
+from app.cache import cache_consulta
+
+# ----------------------------------------------------------------------
+# Proveedores
+# ----------------------------------------------------------------------
+def crear_proveedor(id_proveedores, nombre, id_empresa, telefono=None, correo=None, direccion=None):
+    """
+    Registrar un proveedor de la empresa
+    """
+    try:
+        if db.session.get(Proveedor, id_proveedores):
+            return None, "Ya existe un proveedor con este código"
+
+        proveedor = Proveedor(
+            id_proveedores=id_proveedores,
+            nombre=nombre,
+            telefono=telefono,
+            correo=correo or None,
+            direccion=direccion or None,
+            id_empresa=id_empresa
+        )
+        db.session.add(proveedor)
+        db.session.commit()
+        return proveedor, None
+
+    except IntegrityError:
+        db.session.rollback()
+        return None, "Error de integridad: verifica que todos los datos sean válidos"
+    except Exception as e:
+        db.session.rollback()
+        return None, f"Error al crear proveedor: {str(e)}"
+
+@cache_consulta('proveedor')
+def listar_proveedores(id_empresa):
+    """
+    Obtener los proveedores de una empresa. Cacheada: copias sin sesión,
+    solo columnas (compras no está disponible)
+    """
+    try:
+        return Proveedor.query.filter_by(id_empresa=id_empresa).order_by(Proveedor.nombre).all()
+    except Exception as e:
+        print(f"Error al listar proveedores: {str(e)}")
+        return []
+
+def obtener_proveedor(id_empresa, id_proveedor):
+    """
+    Obtener un proveedor específico de la empresa
+    """
+    try:
+        return Proveedor.query.filter_by(id_proveedores=id_proveedor, id_empresa=id_empresa).first()
+    except Exception as e:
+        print(f"Error al obtener proveedor: {str(e)}")
+        return None
+
+# ----------------------------------------------------------------------
+# Compras (recepción de mercancía)
+# ----------------------------------------------------------------------
+def registrar_compra(id_empresa, id_proveedor, items, id_usuario, numero_factura=None):
+    """
+    Registrar la recepción de una compra y aumentar el stock.
+
+    items: lista de {'id_producto', 'cantidad', 'costo_unitario'}. El stock
+    se incrementa con un único UPDATE y las entradas de inventario se
+    escriben con un INSERT ... SELECT, todo en una sola transacción.
+    """
+    try:
+        proveedor = obtener_proveedor(id_empresa, id_proveedor)
+        if not proveedor:
+            return None, "Proveedor no encontrado"
+
+        # Consolidar líneas repetidas del mismo producto
+        lineas = {}
+        for item in items:
+            id_producto = str(item.get('id_producto', '')).strip()
+            if not id_producto:
+                continue
+            cantidad = int(item.get('cantidad', 0))
+            costo = int(item.get('costo_unitario', 0) or 0)
+            if cantidad <= 0:
+                return None, f"La cantidad de {id_producto} debe ser mayor a 0"
+            if costo < 0:
+                return None, f"El costo de {id_producto} no puede ser negativo"
+
+            if id_producto in lineas:
+                lineas[id_producto]['cantidad'] += cantidad
+                lineas[id_producto]['subtotal'] += cantidad * costo
+            else:
+                lineas[id_producto] = {'cantidad': cantidad, 'subtotal': cantidad * costo}
+
+        if not lineas:
+            return None, "La compra no tiene productos"
+
+        # Validar todos los productos con una sola consulta
+        validos = set(db.session.execute(
+            select(Producto.id_producto).where(
+                Producto.id_empresa == id_empresa,
+                Producto.id_producto.in_(lineas.keys())
+            )
+        ).scalars())
+        invalidos = [p for p in lineas if p not in validos]
+        if invalidos:
+            return None, f"Productos no encontrados: {', '.join(invalidos[:10])}"
+
+        ahora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        compra = Compra(
+            numero_factura=numero_factura or None,
+            fecha_hora=ahora,
+            cantidad=sum(l['cantidad'] for l in lineas.values()),
+            total=sum(l['subtotal'] for l in lineas.values()),
+            id_proveedor=proveedor.id_proveedores,
+            id_usuario=id_usuario,
+            id_empresa=id_empresa
+        )
+        db.session.add(compra)
+        db.session.flush()  # Para obtener el ID de la compra
+
+        db.session.execute(insert(DetalleCompra), [
+            {
+                'id_compra': compra.id_compra,
+                'id_producto': id_producto,
+                'cantidad': linea['cantidad'],
+                # Costo promedio si el producto vino en varias líneas
+                'costo_unitario': linea['subtotal'] // linea['cantidad'],
+                'subtotal': linea['subtotal']
+            }
+            for id_producto, linea in lineas.items()
+        ])
+
+        # Entradas de inventario, una por línea de la compra
+        db.session.execute(
+            insert(MovimientoInventario).from_select(
+                ['id_movimiento', 'tipo_movimiento', 'fecha_hora', 'cantidad', 'id_producto', 'id_usuario'],
+                select(
+                    literal("CMP_") + cast(DetalleCompra.id_detalle_compra, String),
+                    literal("ENTRADA"),
+                    literal(ahora),
+                    DetalleCompra.cantidad,
+                    DetalleCompra.id_producto,
+                    literal(id_usuario)
+                ).where(DetalleCompra.id_compra == compra.id_compra)
+            )
+        )
+
+        # Incremento de stock en un solo UPDATE
+        cantidad_recibida = select(DetalleCompra.cantidad).where(
+            DetalleCompra.id_compra == compra.id_compra,
+            DetalleCompra.id_producto == Producto.id_producto
+        ).scalar_subquery()
+
+        db.session.execute(
+            update(Producto)
+            .where(
+                Producto.id_empresa == id_empresa,
+                Producto.id_producto.in_(
+                    select(DetalleCompra.id_producto).where(DetalleCompra.id_compra == compra.id_compra)
+                )
+            )
+            .values(stock=Producto.stock + cantidad_recibida)
+            .execution_options(synchronize_session=False)
+        )
+
+        db.session.commit()
+
+        # Los productos cargados en la sesión tienen el stock anterior
+        db.session.expire_all()
+
+        return compra, None
+
+    except ValueError:
+        db.session.rollback()
+        return None, "Las cantidades y costos deben ser números enteros"
+    except Exception as e:
+        db.session.rollback()
+        return None, f"Error al registrar compra: {str(e)}"
+
+def listar_compras(id_empresa, id_proveedor=None, fecha_desde=None, fecha_hasta=None, limit=50):
+    """
+    Obtener compras de la empresa, opcionalmente de un solo proveedor
+    """
+    try:
+        query = Compra.query.options(joinedload(Compra.proveedor)).filter(Compra.id_empresa == id_empresa)
+
+        if id_proveedor:
+            query = query.filter(Compra.id_proveedor == id_proveedor)
+
+        # fecha_hora se guarda como 'YYYY-MM-DD HH:MM:SS', así que el rango
+        # se compara como texto y puede usar el índice (empresa, proveedor, fecha)
+        if fecha_desde:
+            query = query.filter(Compra.fecha_hora >= f"{fecha_desde} 00:00:00")
+
+        if fecha_hasta:
+            query = query.filter(Compra.fecha_hora <= f"{fecha_hasta} 23:59:59")
+
+        return query.order_by(desc(Compra.fecha_hora), desc(Compra.id_compra)).limit(limit).all()
+
+    except Exception as e:
+        print(f"Error al listar compras: {str(e)}")
+        return []
+
+def obtener_compra(id_empresa, id_compra):
+    """
+    Obtener una compra con sus detalles y productos
+    """
+    try:
+        return Compra.query.options(
+            joinedload(Compra.proveedor),
+            joinedload(Compra.detalles).joinedload(DetalleCompra.producto)
+        ).filter_by(id_compra=id_compra, id_empresa=id_empresa).first()
+    except Exception as e:
+        print(f"Error al obtener compra: {str(e)}")
+        return None
+
+def obtener_resumen_proveedor(id_empresa, id_proveedor):
+    """
+    Totales históricos de compras a un proveedor
+    """
+    try:
+        resumen = db.session.execute(
+            select(
+                func.count(Compra.id_compra),
+                func.coalesce(func.sum(Compra.total), 0),
+                func.coalesce(func.sum(Compra.cantidad), 0),
+                func.max(Compra.fecha_hora)
+            ).where(
+                Compra.id_empresa == id_empresa,
+                Compra.id_proveedor == id_proveedor
+            )
+        ).one()
+
+        return {
+            'total_compras': resumen[0],
+            'total_invertido': resumen[1],
+            'unidades_recibidas': resumen[2],
+            'ultima_compra': resumen[3]
+        }
+    except Exception as e:
+        print(f"Error al obtener resumen del proveedor: {str(e)}")
+        return {'total_compras': 0, 'total_invertido': 0, 'unidades_recibidas': 0, 'ultima_compra': None}
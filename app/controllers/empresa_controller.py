@@ -1,8 +1,10 @@
+from sqlalchemy.exc import IntegrityError
 from app.models import db, Empresa
+from app.cache import cache_consulta
 
 def crear_empresa(nit, nombre, correo_electronico, telefono_contacto):
     # Convertir nit y telefono a string para evitar errores con VARCHAR
-    nit = str(nit)
+    nit = str(nit).strip()
     telefono_contacto = str(telefono_contacto)
 
     # 1. Validar si ya existe la empresa
@@ -17,7 +19,21 @@ def crear_empresa(nit, nombre, correo_electronico, telefono_contacto):
         correo_electronico=correo_electronico,
         telefono_contacto=telefono_contacto
     )
-    db.session.add(nueva_empresa)
-    db.session.commit()
+    try:
+        db.session.add(nueva_empresa)
+        db.session.commit()
+    except IntegrityError:
+        # Otra solicitud registró el mismo NIT al mismo tiempo
+        db.session.rollback()
+        return None, "La empresa ya existe"
 
     return nueva_empresa, None
+
+
+@cache_consulta('empresa')
+def obtener_empresa(id_empresa):
+    """
+    Datos de la empresa. Cacheada: copia sin sesión, solo columnas; para
+    modificarla hay que leerla con db.session.get
+    """
+    return db.session.get(Empresa, id_empresa)
@@ -0,0 +1,922 @@
+from app.models import db, Producto, Usuario, MovimientoInventario, ConteoInventario, DetalleConteo, SnapshotStock
+from datetime import datetime, date, timedelta
+from flask import current_app
+from uuid import uuid4
+from sqlalchemy import select, insert, update, func, case, cast, literal, tuple_, text, values, column, String, Integer
+from sqlalchemy.orm import joinedload, aliased
+import base64
+import json
+
+# ----------------------------------------------------------------------
+# Conteo físico de inventario
+# ----------------------------------------------------------------------
+def crear_conteo(id_empresa, id_usuario, descripcion=""):
+    """
+    Abrir una nueva sesión de conteo físico
+    """
+    try:
+        conteo = ConteoInventario(
+            descripcion=descripcion or None,
+            estado="ABIERTO",
+            fecha_inicio=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            id_usuario=id_usuario,
+            id_empresa=id_empresa
+        )
+        db.session.add(conteo)
+        db.session.commit()
+        return conteo, None
+
+    except Exception as e:
+        db.session.rollback()
+        return None, f"Error al crear conteo: {str(e)}"
+
+def listar_conteos(id_empresa, limit=50):
+    """
+    Obtener los conteos de una empresa, del más reciente al más antiguo
+    """
+    try:
+        return ConteoInventario.query.filter_by(id_empresa=id_empresa)\
+            .order_by(ConteoInventario.id_conteo.desc()).limit(limit).all()
+    except Exception as e:
+        print(f"Error al listar conteos: {str(e)}")
+        return []
+
+def obtener_conteo(id_empresa, id_conteo):
+    """
+    Obtener un conteo específico de la empresa
+    """
+    try:
+        return ConteoInventario.query.filter_by(
+            id_conteo=id_conteo,
+            id_empresa=id_empresa
+        ).first()
+    except Exception as e:
+        print(f"Error al obtener conteo: {str(e)}")
+        return None
+
+def registrar_conteos(conteo, items, acumular=False):
+    """
+    Registrar (o corregir) las cantidades contadas de varios productos.
+
+    items: lista de {'id_producto': ..., 'cantidad': ...}. Si `acumular` es
+    True la cantidad se suma a la ya contada (lectura por escáner); si no,
+    la reemplaza.
+    """
+    try:
+        if conteo.estado != "ABIERTO":
+            return 0, "El conteo ya no está abierto"
+
+        # Consolidar el lote: un mismo producto puede venir varias veces
+        cantidades = {}
+        for item in items:
+            id_producto = str(item.get('id_producto', '')).strip()
+            if not id_producto:
+                continue
+            cantidad = int(item.get('cantidad', 0))
+            if cantidad < 0:
+                return 0, f"La cantidad contada de {id_producto} no puede ser negativa"
+            if acumular:
+                cantidades[id_producto] = cantidades.get(id_producto, 0) + cantidad
+            else:
+                cantidades[id_producto] = cantidad
+
+        if not cantidades:
+            return 0, "No hay cantidades para registrar"
+
+        # Validar que todos los productos pertenezcan a la empresa (una sola consulta)
+        validos = set(db.session.execute(
+            select(Producto.id_producto).where(
+                Producto.id_empresa == conteo.id_empresa,
+                Producto.id_producto.in_(cantidades.keys())
+            )
+        ).scalars())
+        invalidos = [p for p in cantidades if p not in validos]
+        if invalidos:
+            return 0, f"Productos no encontrados: {', '.join(invalidos[:10])}"
+
+        # Cargar lo ya contado de estos productos (una sola consulta)
+        existentes = {
+            d.id_producto: d for d in DetalleConteo.query.filter(
+                DetalleConteo.id_conteo == conteo.id_conteo,
+                DetalleConteo.id_producto.in_(cantidades.keys())
+            )
+        }
+
+        nuevos = []
+        for id_producto, cantidad in cantidades.items():
+            detalle = existentes.get(id_producto)
+            if detalle:
+                detalle.cantidad_contada = detalle.cantidad_contada + cantidad if acumular else cantidad
+            else:
+                nuevos.append({
+                    'id_conteo': conteo.id_conteo,
+                    'id_producto': id_producto,
+                    'cantidad_contada': cantidad
+                })
+
+        if nuevos:
+            db.session.execute(insert(DetalleConteo), nuevos)
+
+        db.session.commit()
+        return len(cantidades), None
+
+    except ValueError:
+        db.session.rollback()
+        return 0, "Las cantidades deben ser números enteros"
+    except Exception as e:
+        db.session.rollback()
+        return 0, f"Error al registrar conteo: {str(e)}"
+
+def obtener_diferencias_conteo(conteo, solo_diferencias=False):
+    """
+    Comparar lo contado contra el stock del sistema (calculado en SQL).
+    En un conteo cerrado se usa el stock registrado al momento del cierre.
+    """
+    try:
+        stock = DetalleConteo.stock_sistema if conteo.estado == "CERRADO" else Producto.stock
+        diferencia = (DetalleConteo.cantidad_contada - stock).label('diferencia')
+
+        query = select(
+            Producto.id_producto,
+            Producto.nombre,
+            stock.label('stock_sistema'),
+            DetalleConteo.cantidad_contada,
+            diferencia
+        ).join(Producto, Producto.id_producto == DetalleConteo.id_producto)\
+         .where(DetalleConteo.id_conteo == conteo.id_conteo)
+
+        if solo_diferencias:
+            query = query.where(DetalleConteo.cantidad_contada != stock)
+
+        return db.session.execute(query.order_by(Producto.nombre)).all()
+
+    except Exception as e:
+        print(f"Error al obtener diferencias del conteo: {str(e)}")
+        return []
+
+def cerrar_conteo(conteo, id_usuario):
+    """
+    Conciliar el conteo contra Producto.stock en una sola transacción.
+
+    Las diferencias, los movimientos de ajuste y el nuevo stock se calculan
+    y escriben con sentencias masivas (INSERT ... SELECT / UPDATE con
+    subconsulta), sin recorrer los productos uno por uno.
+    """
+    try:
+        if conteo.estado != "ABIERTO":
+            return None, "El conteo ya no está abierto"
+
+        ahora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        productos_conteo = select(DetalleConteo.id_producto).where(
+            DetalleConteo.id_conteo == conteo.id_conteo
+        )
+
+        # 1. Bloquear los productos contados para que ninguna venta cambie el stock a mitad del cierre
+        db.session.execute(
+            select(Producto.id_producto).where(
+                Producto.id_empresa == conteo.id_empresa,
+                Producto.id_producto.in_(productos_conteo)
+            ).with_for_update()
+        )
+
+        # 2. Congelar el stock del sistema en cada línea del conteo
+        stock_actual = select(Producto.stock).where(
+            Producto.id_producto == DetalleConteo.id_producto
+        ).scalar_subquery()
+
+        db.session.execute(
+            update(DetalleConteo)
+            .where(DetalleConteo.id_conteo == conteo.id_conteo)
+            .values(stock_sistema=stock_actual)
+            .execution_options(synchronize_session=False)
+        )
+
+        # 3. Registrar un movimiento por cada diferencia (INSERT ... SELECT)
+        diferencia = DetalleConteo.cantidad_contada - DetalleConteo.stock_sistema
+        con_diferencia = (
+            DetalleConteo.id_conteo == conteo.id_conteo,
+            DetalleConteo.cantidad_contada != DetalleConteo.stock_sistema
+        )
+
+        movimientos = select(
+            literal("CNT_") + cast(DetalleConteo.id_detalle_conteo, String),
+            case((diferencia > 0, literal("ENTRADA")), else_=literal("SALIDA")),
+            literal(ahora),
+            func.abs(diferencia),
+            DetalleConteo.id_producto,
+            literal(id_usuario)
+        ).where(*con_diferencia)
+
+        db.session.execute(
+            insert(MovimientoInventario).from_select(
+                ['id_movimiento', 'tipo_movimiento', 'fecha_hora', 'cantidad', 'id_producto', 'id_usuario'],
+                movimientos
+            )
+        )
+
+        # 4. Aplicar el stock contado a todos los productos con diferencia (un solo UPDATE)
+        cantidad_contada = select(DetalleConteo.cantidad_contada).where(
+            DetalleConteo.id_conteo == conteo.id_conteo,
+            DetalleConteo.id_producto == Producto.id_producto
+        ).scalar_subquery()
+
+        db.session.execute(
+            update(Producto)
+            .where(
+                Producto.id_empresa == conteo.id_empresa,
+                Producto.id_producto.in_(
+                    select(DetalleConteo.id_producto).where(*con_diferencia)
+                )
+            )
+            .values(stock=cantidad_contada)
+            .execution_options(synchronize_session=False)
+        )
+
+        # 5. Resumen del cierre (una consulta agregada)
+        resumen = db.session.execute(
+            select(
+                func.count(),
+                func.count(case((diferencia != 0, 1))),
+                func.coalesce(func.sum(case((diferencia > 0, diferencia), else_=0)), 0),
+                func.coalesce(func.sum(case((diferencia < 0, -diferencia), else_=0)), 0)
+            ).where(DetalleConteo.id_conteo == conteo.id_conteo)
+        ).one()
+
+        conteo.estado = "CERRADO"
+        conteo.fecha_cierre = ahora
+        db.session.commit()
+
+        # Los productos cargados en la sesión tienen el stock anterior
+        db.session.expire_all()
+
+        return {
+            'productos_contados': resumen[0],
+            'productos_ajustados': resumen[1],
+            'unidades_entrada': resumen[2],
+            'unidades_salida': resumen[3]
+        }, None
+
+    except Exception as e:
+        db.session.rollback()
+        return None, f"Error al cerrar conteo: {str(e)}"
+
+def cancelar_conteo(conteo):
+    """
+    Cancelar un conteo abierto sin modificar el stock
+    """
+    try:
+        if conteo.estado != "ABIERTO":
+            return False, "El conteo ya no está abierto"
+
+        conteo.estado = "CANCELADO"
+        conteo.fecha_cierre = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        db.session.commit()
+        return True, None
+
+    except Exception as e:
+        db.session.rollback()
+        return False, f"Error al cancelar conteo: {str(e)}"
+
+# ----------------------------------------------------------------------
+# Kardex (historial de stock)
+# ----------------------------------------------------------------------
+def _cantidad_con_signo():
+    """Cantidad del movimiento con signo: positiva para entradas, negativa para salidas"""
+    return case(
+        (MovimientoInventario.tipo_movimiento == "ENTRADA", MovimientoInventario.cantidad),
+        else_=-MovimientoInventario.cantidad
+    )
+
+def codificar_cursor(datos):
+    """Convertir la posición de la última fila leída en un token opaco para la URL"""
+    return base64.urlsafe_b64encode(json.dumps(datos).encode("utf-8")).decode("ascii")
+
+def decodificar_cursor(cursor):
+    """Leer el token de paginación; devuelve None si no es válido"""
+    try:
+        datos = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datos if isinstance(datos, dict) else None
+    except Exception:
+        return None
+
+def _posicion_kardex(cursor):
+    """Cursor del kardex; los anteriores a `secuencia` vuelven al inicio"""
+    posicion = decodificar_cursor(cursor) if cursor else None
+    if posicion and 'fecha_hora' in posicion and 'secuencia' in posicion:
+        return posicion
+    return None
+
+def obtener_kardex_producto(id_empresa, id_producto, cursor=None, limit=100):
+    """
+    Movimientos de un producto en orden cronológico con su saldo acumulado.
+
+    La paginación es por llave (fecha_hora, secuencia) sobre el índice
+    ix_movimiento_producto_fecha, y el saldo acumulado de la página se calcula
+    con una función de ventana. El cursor guarda el saldo al final de la
+    página anterior, así que cada página cuesta lo mismo sin importar cuántos
+    movimientos tenga el producto.
+    """
+    try:
+        producto = Producto.query.filter_by(id_producto=id_producto, id_empresa=id_empresa).first()
+        if not producto:
+            return None, "Producto no encontrado"
+
+        posicion = _posicion_kardex(cursor)
+        saldo_anterior = int(posicion.get('saldo', 0)) if posicion else 0
+
+        pagina = select(
+            MovimientoInventario.id_movimiento,
+            MovimientoInventario.fecha_hora,
+            MovimientoInventario.secuencia,
+            MovimientoInventario.tipo_movimiento,
+            MovimientoInventario.cantidad,
+            _cantidad_con_signo().label('cantidad_signo')
+        ).where(MovimientoInventario.id_producto == id_producto)
+
+        if posicion:
+            pagina = pagina.where(
+                tuple_(MovimientoInventario.fecha_hora, MovimientoInventario.secuencia) >
+                tuple_(literal(posicion['fecha_hora']), literal(posicion['secuencia']))
+            )
+
+        # LIMIT dentro de la subconsulta: la ventana solo recorre la página
+        pagina = pagina.order_by(
+            MovimientoInventario.fecha_hora, MovimientoInventario.secuencia
+        ).limit(limit + 1).subquery()
+
+        filas = db.session.execute(
+            select(
+                pagina.c.id_movimiento,
+                pagina.c.fecha_hora,
+                pagina.c.secuencia,
+                pagina.c.tipo_movimiento,
+                pagina.c.cantidad,
+                (func.sum(pagina.c.cantidad_signo).over(
+                    order_by=(pagina.c.fecha_hora, pagina.c.secuencia)
+                ) + saldo_anterior).label('saldo')
+            ).order_by(pagina.c.fecha_hora, pagina.c.secuencia)
+        ).all()
+
+        hay_mas = len(filas) > limit
+        filas = filas[:limit]
+
+        movimientos = [_fila_kardex(f) for f in filas]
+
+        # Primera página: si los meses más antiguos se archivaron, el saldo
+        # de partida sale del snapshot que los cubre
+        if not posicion and movimientos:
+            saldo_inicial = db.session.execute(
+                select(_saldo_previo(literal(id_producto), filas[0].fecha_hora))
+            ).scalar() or 0
+            if saldo_inicial:
+                for movimiento in movimientos:
+                    movimiento['saldo'] += int(saldo_inicial)
+
+        siguiente = None
+        if hay_mas:
+            ultima = movimientos[-1]
+            siguiente = codificar_cursor({
+                'fecha_hora': ultima['fecha_hora'],
+                'secuencia': filas[-1].secuencia,
+                'saldo': ultima['saldo']
+            })
+
+        return {
+            'producto': producto,
+            'movimientos': movimientos,
+            'siguiente': siguiente
+        }, None
+
+    except Exception as e:
+        return None, f"Error al obtener kardex: {str(e)}"
+
+def obtener_kardex_empresa(id_empresa, fecha_desde=None, fecha_hasta=None, cursor=None, limit=100):
+    """
+    Movimientos de todos los productos de la empresa en orden cronológico,
+    cada uno con el saldo acumulado de su producto.
+
+    La página se lee por llave (fecha_hora, secuencia); el saldo previo de
+    los productos que aparecen en la página sale del snapshot más cercano más
+    la cola de movimientos sobre el índice (id_producto, fecha_hora), y el
+    acumulado dentro de la página con SUM() OVER (PARTITION BY id_producto ...).
+    """
+    try:
+        posicion = _posicion_kardex(cursor)
+
+        pagina = select(
+            MovimientoInventario.id_movimiento,
+            MovimientoInventario.fecha_hora,
+            MovimientoInventario.secuencia,
+            MovimientoInventario.tipo_movimiento,
+            MovimientoInventario.cantidad,
+            MovimientoInventario.id_producto,
+            Producto.nombre,
+            _cantidad_con_signo().label('cantidad_signo')
+        ).join(Producto, Producto.id_producto == MovimientoInventario.id_producto)\
+         .where(Producto.id_empresa == id_empresa)
+
+        if fecha_desde:
+            pagina = pagina.where(MovimientoInventario.fecha_hora >= f"{fecha_desde} 00:00:00")
+        if fecha_hasta:
+            pagina = pagina.where(MovimientoInventario.fecha_hora <= f"{fecha_hasta} 23:59:59")
+
+        llave = tuple_(MovimientoInventario.fecha_hora, MovimientoInventario.secuencia)
+        if posicion:
+            llave_cursor = tuple_(literal(posicion['fecha_hora']), literal(posicion['secuencia']))
+            pagina = pagina.where(llave > llave_cursor)
+
+        pagina = pagina.order_by(
+            MovimientoInventario.fecha_hora, MovimientoInventario.secuencia
+        ).limit(limit + 1).cte('pagina')
+
+        # Saldo de cada producto de la página antes de su primera fila:
+        # snapshot más cercano + cola de movimientos hasta el inicio de la página
+        productos_pagina = select(pagina.c.id_producto).distinct().subquery('productos_pagina')
+
+        if posicion:
+            saldo = _saldo_previo(
+                productos_pagina.c.id_producto,
+                posicion['fecha_hora'],
+                llave_limite=(posicion['fecha_hora'], posicion['secuencia'])
+            )
+        else:
+            # Sin cursor la página empieza en fecha_desde (o en el movimiento
+            # más antiguo que siga en el libro)
+            inicio = select(func.min(pagina.c.fecha_hora)).scalar_subquery()
+            saldo = _saldo_previo(
+                productos_pagina.c.id_producto,
+                f"{fecha_desde} 00:00:00" if fecha_desde else inicio
+            )
+
+        previos = select(
+            productos_pagina.c.id_producto,
+            saldo.label('saldo')
+        ).subquery('previos')
+
+        filas = db.session.execute(
+            select(
+                pagina.c.id_movimiento,
+                pagina.c.fecha_hora,
+                pagina.c.tipo_movimiento,
+                pagina.c.cantidad,
+                pagina.c.id_producto,
+                pagina.c.nombre,
+                pagina.c.secuencia,
+                (func.sum(pagina.c.cantidad_signo).over(
+                    partition_by=pagina.c.id_producto,
+                    order_by=(pagina.c.fecha_hora, pagina.c.secuencia)
+                ) + func.coalesce(previos.c.saldo, 0)).label('saldo')
+            ).outerjoin(previos, previos.c.id_producto == pagina.c.id_producto)
+             .order_by(pagina.c.fecha_hora, pagina.c.secuencia)
+        ).all()
+
+        hay_mas = len(filas) > limit
+        filas = filas[:limit]
+
+        siguiente = None
+        if hay_mas:
+            ultima = filas[-1]
+            siguiente = codificar_cursor({
+                'fecha_hora': ultima.fecha_hora,
+                'secuencia': ultima.secuencia
+            })
+
+        movimientos = []
+        for fila in filas:
+            movimiento = _fila_kardex(fila)
+            movimiento['id_producto'] = fila.id_producto
+            movimiento['nombre'] = fila.nombre
+            movimientos.append(movimiento)
+
+        return {'movimientos': movimientos, 'siguiente': siguiente}, None
+
+    except Exception as e:
+        return None, f"Error al obtener kardex: {str(e)}"
+
+def _fila_kardex(fila):
+    """Convertir una fila del kardex en diccionario serializable"""
+    return {
+        'id_movimiento': fila.id_movimiento,
+        'fecha_hora': fila.fecha_hora,
+        'tipo_movimiento': fila.tipo_movimiento,
+        'entrada': fila.cantidad if fila.tipo_movimiento == "ENTRADA" else 0,
+        'salida': fila.cantidad if fila.tipo_movimiento != "ENTRADA" else 0,
+        'saldo': int(fila.saldo)
+    }
+
+def obtener_movimientos_recientes(id_producto, limit=10):
+    """
+    Últimos movimientos de un producto (usa el índice por producto y fecha)
+    """
+    try:
+        return MovimientoInventario.query.options(joinedload(MovimientoInventario.usuario))\
+            .filter(MovimientoInventario.id_producto == id_producto)\
+            .order_by(MovimientoInventario.fecha_hora.desc(), MovimientoInventario.secuencia.desc())\
+            .limit(limit).all()
+    except Exception as e:
+        print(f"Error al obtener movimientos: {str(e)}")
+        return []
+
+# ----------------------------------------------------------------------
+# Snapshots de stock y stock histórico
+# ----------------------------------------------------------------------
+def _saldo_previo(id_producto, fecha_limite, llave_limite=None):
+    """
+    Expresión SQL con el saldo de un producto antes de un punto del libro:
+    el snapshot más cercano con fecha_corte <= fecha_limite más la cola de
+    movimientos desde ese corte.
+
+    Si se da `llave_limite` (fecha_hora, secuencia) la cola incluye los
+    movimientos hasta esa llave inclusive; si no, los anteriores a fecha_limite.
+    """
+    # `corte` va anidado dos niveles (dentro de stock_corte y de cola): la
+    # correlación automática solo mira la consulta inmediata, así que se
+    # declara explícita para que id_producto sea el de la fila exterior
+    snapshot_corte = aliased(SnapshotStock)
+    corte = select(func.max(snapshot_corte.fecha_corte)).where(
+        snapshot_corte.id_producto == id_producto,
+        snapshot_corte.fecha_corte <= fecha_limite
+    ).correlate_except(snapshot_corte).scalar_subquery()
+
+    stock_corte = select(SnapshotStock.stock).where(
+        SnapshotStock.id_producto == id_producto,
+        SnapshotStock.fecha_corte == corte
+    ).scalar_subquery()
+
+    if llave_limite:
+        hasta = tuple_(MovimientoInventario.fecha_hora, MovimientoInventario.secuencia) <= \
+            tuple_(literal(llave_limite[0]), literal(llave_limite[1]))
+    else:
+        hasta = MovimientoInventario.fecha_hora < fecha_limite
+
+    cola = select(func.sum(_cantidad_con_signo())).where(
+        MovimientoInventario.id_producto == id_producto,
+        MovimientoInventario.fecha_hora >= func.coalesce(corte, ""),
+        hasta
+    ).scalar_subquery()
+
+    return func.coalesce(stock_corte, 0) + func.coalesce(cola, 0)
+
+def tomar_snapshot(id_empresa, fecha_corte=None):
+    """
+    Guardar el stock de todos los productos de la empresa en una fecha de corte.
+
+    El stock se calcula desde el libro (snapshot anterior + movimientos hasta
+    el corte) con un solo INSERT ... SELECT. Los productos que ya tienen
+    snapshot en ese corte se omiten, así que repetir el comando es seguro.
+
+    El corte debe quedar al menos SNAPSHOT_MARGEN_MINUTOS en el pasado (por
+    defecto se usa ese límite): la fecha_hora de un movimiento se fija antes
+    de confirmar su transacción, y uno anterior al corte que se confirmara
+    después del snapshot no entraría ni en él ni en la cola (fecha_hora >= corte).
+    """
+    try:
+        margen = current_app.config['SNAPSHOT_MARGEN_MINUTOS']
+        limite = (datetime.now() - timedelta(minutes=margen)).strftime("%Y-%m-%d %H:%M:%S")
+        fecha_corte = fecha_corte or limite
+        if fecha_corte > limite:
+            return 0, f"La fecha de corte debe ser anterior a {limite} (margen de {margen} minutos)"
+
+        ya_tomados = select(SnapshotStock.id_producto).where(
+            SnapshotStock.id_empresa == id_empresa,
+            SnapshotStock.fecha_corte == fecha_corte
+        )
+
+        resultado = db.session.execute(
+            insert(SnapshotStock).from_select(
+                ['id_producto', 'fecha_corte', 'stock', 'id_empresa'],
+                select(
+                    Producto.id_producto,
+                    literal(fecha_corte),
+                    _saldo_previo(Producto.id_producto, fecha_corte),
+                    Producto.id_empresa
+                ).where(
+                    Producto.id_empresa == id_empresa,
+                    Producto.id_producto.not_in(ya_tomados)
+                )
+            )
+        )
+        db.session.commit()
+        return resultado.rowcount, None
+
+    except Exception as e:
+        db.session.rollback()
+        return 0, f"Error al tomar snapshot: {str(e)}"
+
+def obtener_stock_en_fecha(id_empresa, fecha_hora, id_producto=None):
+    """
+    Stock de los productos de la empresa en una fecha y hora pasadas
+    (snapshot más cercano + movimientos posteriores hasta esa fecha).
+    """
+    try:
+        query = select(
+            Producto.id_producto,
+            Producto.nombre,
+            _saldo_previo(Producto.id_producto, fecha_hora).label('stock')
+        ).where(Producto.id_empresa == id_empresa)
+
+        if id_producto:
+            query = query.where(Producto.id_producto == id_producto)
+
+        return db.session.execute(query.order_by(Producto.nombre)).all(), None
+
+    except Exception as e:
+        return [], f"Error al obtener stock histórico: {str(e)}"
+
+# ----------------------------------------------------------------------
+# Particiones del libro de movimientos
+# ----------------------------------------------------------------------
+TABLA_MOVIMIENTOS = MovimientoInventario.__tablename__
+TABLA_ARCHIVO = f"{TABLA_MOVIMIENTOS}_archivo"
+PARTICION_DEFAULT = f"{TABLA_MOVIMIENTOS}_pdefault"
+
+def _es_postgresql():
+    return db.session.get_bind().dialect.name == "postgresql"
+
+def _inicio_mes(fecha):
+    return date(fecha.year, fecha.month, 1)
+
+def _sumar_meses(mes, meses):
+    total = mes.year * 12 + (mes.month - 1) + meses
+    return date(total // 12, total % 12 + 1, 1)
+
+def _nombre_particion(mes):
+    return f"{TABLA_MOVIMIENTOS}_p{mes.strftime('%Y%m')}"
+
+def _limite_mes(mes):
+    return mes.strftime("%Y-%m-%d 00:00:00")
+
+def listar_particiones():
+    """
+    Particiones mensuales del libro en PostgreSQL (vacío en otras bases)
+    """
+    if not _es_postgresql():
+        return []
+    return db.session.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :tabla ORDER BY c.relname"
+    ), {'tabla': TABLA_MOVIMIENTOS}).scalars().all()
+
+def crear_particion_mes(conexion, mes):
+    """
+    Crear la partición de un mes. Si la partición DEFAULT tiene filas de ese
+    mes se mueven a la nueva partición antes de adjuntarla.
+    """
+    nombre = _nombre_particion(mes)
+    desde, hasta = _limite_mes(mes), _limite_mes(_sumar_meses(mes, 1))
+
+    conexion.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {nombre} "
+        f"(LIKE {TABLA_MOVIMIENTOS} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+    ))
+    conexion.execute(text(
+        f"WITH movidas AS (DELETE FROM {PARTICION_DEFAULT} "
+        f"WHERE fecha_hora >= :desde AND fecha_hora < :hasta RETURNING *) "
+        f"INSERT INTO {nombre} SELECT * FROM movidas"
+    ), {'desde': desde, 'hasta': hasta})
+    conexion.execute(text(
+        f"ALTER TABLE {TABLA_MOVIMIENTOS} ATTACH PARTITION {nombre} "
+        f"FOR VALUES FROM ('{desde}') TO ('{hasta}')"
+    ))
+    return nombre
+
+def asegurar_particiones(meses_adelante=3, desde=None):
+    """
+    Crear las particiones mensuales que falten desde `desde` (mes actual por
+    defecto) hasta `meses_adelante` meses en el futuro.
+    """
+    try:
+        if not _es_postgresql():
+            return [], None
+
+        existentes = set(listar_particiones())
+        mes = _inicio_mes(desde or date.today())
+        ultimo = _sumar_meses(_inicio_mes(date.today()), meses_adelante)
+
+        creadas = []
+        conexion = db.session.connection()
+        while mes <= ultimo:
+            if _nombre_particion(mes) not in existentes:
+                creadas.append(crear_particion_mes(conexion, mes))
+            mes = _sumar_meses(mes, 1)
+
+        db.session.commit()
+        return creadas, None
+
+    except Exception as e:
+        db.session.rollback()
+        return [], f"Error al crear particiones: {str(e)}"
+
+def migrar_a_particionada():
+    """
+    Convertir una tabla movimiento_inventario existente (sin particiones) en
+    la tabla particionada por mes, copiando todas las filas.
+    """
+    try:
+        if not _es_postgresql():
+            return 0, "El particionamiento solo está disponible en PostgreSQL"
+
+        conexion = db.session.connection()
+        particionada = conexion.execute(text(
+            "SELECT relkind = 'p' FROM pg_class WHERE relname = :tabla"
+        ), {'tabla': TABLA_MOVIMIENTOS}).scalar()
+        if particionada:
+            return 0, "La tabla de movimientos ya está particionada"
+
+        anterior = f"{TABLA_MOVIMIENTOS}_sin_particion"
+        conexion.execute(text(f"ALTER TABLE {TABLA_MOVIMIENTOS} RENAME TO {anterior}"))
+        conexion.execute(text(
+            f"ALTER TABLE {anterior} RENAME CONSTRAINT {TABLA_MOVIMIENTOS}_pkey TO {anterior}_pkey"
+        ))
+        conexion.execute(text("DROP INDEX IF EXISTS ix_movimiento_producto_fecha"))
+
+        # Crea la tabla particionada y su partición DEFAULT (ver evento after_create)
+        MovimientoInventario.__table__.create(conexion, checkfirst=True)
+
+        primera = conexion.execute(text(f"SELECT MIN(fecha_hora) FROM {anterior}")).scalar()
+        if primera:
+            mes = _inicio_mes(datetime.strptime(primera[:10], "%Y-%m-%d").date())
+            ultimo = _sumar_meses(_inicio_mes(date.today()), 3)
+            while mes <= ultimo:
+                crear_particion_mes(conexion, mes)
+                mes = _sumar_meses(mes, 1)
+
+        copiadas = conexion.execute(text(
+            f"INSERT INTO {TABLA_MOVIMIENTOS} "
+            f"(id_movimiento, tipo_movimiento, fecha_hora, cantidad, id_producto, id_usuario) "
+            f"SELECT id_movimiento, tipo_movimiento, fecha_hora, cantidad, id_producto, id_usuario FROM {anterior} "
+            f"ORDER BY fecha_hora, id_movimiento"
+        )).rowcount
+        conexion.execute(text(f"DROP TABLE {anterior}"))
+
+        db.session.commit()
+        return copiadas, None
+
+    except Exception as e:
+        db.session.rollback()
+        return 0, f"Error al migrar la tabla de movimientos: {str(e)}"
+
+def archivar_movimientos(hasta_mes):
+    """
+    Sacar del libro activo los movimientos anteriores a `hasta_mes`.
+
+    En PostgreSQL se desacoplan (DETACH) las particiones de esos meses, que
+    quedan como tablas independientes para respaldo o borrado. En otras bases
+    las filas se mueven a movimiento_inventario_archivo. Solo se permite si
+    todos los productos afectados tienen un snapshot en o después del corte,
+    para que el stock histórico siga siendo calculable.
+    """
+    try:
+        corte = _limite_mes(_inicio_mes(hasta_mes))
+
+        sin_snapshot = db.session.execute(
+            select(func.count(func.distinct(MovimientoInventario.id_producto))).where(
+                MovimientoInventario.fecha_hora < corte,
+                ~select(SnapshotStock.id_producto).where(
+                    SnapshotStock.id_producto == MovimientoInventario.id_producto,
+                    SnapshotStock.fecha_corte >= corte
+                ).exists()
+            )
+        ).scalar()
+        if sin_snapshot:
+            return [], f"{sin_snapshot} productos no tienen snapshot en o después de {corte}; toma un snapshot primero"
+
+        conexion = db.session.connection()
+
+        if _es_postgresql():
+            archivadas = []
+            for nombre in listar_particiones():
+                if nombre == PARTICION_DEFAULT:
+                    continue
+                mes = datetime.strptime(nombre[-6:], "%Y%m").date()
+                if _limite_mes(_sumar_meses(mes, 1)) <= corte:
+                    conexion.execute(text(f"ALTER TABLE {TABLA_MOVIMIENTOS} DETACH PARTITION {nombre}"))
+                    archivadas.append(nombre)
+            db.session.commit()
+            return archivadas, None
+
+        # Respaldo sin particiones: mover las filas a la tabla de archivo
+        conexion.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {TABLA_ARCHIVO} AS SELECT * FROM {TABLA_MOVIMIENTOS} WHERE 1 = 0"
+        ))
+        movidas = conexion.execute(text(
+            f"INSERT INTO {TABLA_ARCHIVO} SELECT * FROM {TABLA_MOVIMIENTOS} WHERE fecha_hora < :corte"
+        ), {'corte': corte}).rowcount
+        conexion.execute(text(f"DELETE FROM {TABLA_MOVIMIENTOS} WHERE fecha_hora < :corte"), {'corte': corte})
+
+        db.session.commit()
+        return [f"{TABLA_ARCHIVO} ({movidas} movimientos)"], None
+
+    except Exception as e:
+        db.session.rollback()
+        return [], f"Error al archivar movimientos: {str(e)}"
+
+# ----------------------------------------------------------------------
+# Conciliación entre el libro y Producto.stock
+# ----------------------------------------------------------------------
+FIN_DEL_LIBRO = "9999-12-31 23:59:59"
+
+def conciliar_stock_empresa(id_empresa, lote=1000, reparar=False, fuente="stock", id_usuario=None):
+    """
+    Comparar Producto.stock con el stock que resulta del libro de movimientos.
+
+    Recorre los productos de la empresa en lotes por llave (id_producto) y
+    calcula el stock esperado de cada lote en una sola consulta (snapshot más
+    reciente + movimientos posteriores). Con `reparar`:
+      - fuente="stock": se confía en Producto.stock y se agregan movimientos
+        de ajuste para que el libro cuadre.
+      - fuente="libro": se corrige Producto.stock al valor del libro.
+    """
+    try:
+        if fuente not in ("stock", "libro"):
+            return None, "La fuente debe ser 'stock' o 'libro'"
+
+        if reparar and fuente == "stock" and not id_usuario:
+            admin = Usuario.query.filter_by(id_empresa=id_empresa).order_by(Usuario.rol, Usuario.id_usuario).first()
+            if not admin:
+                return None, "La empresa no tiene usuarios para registrar los ajustes"
+            id_usuario = admin.id_usuario
+
+        resultado = {'id_empresa': id_empresa, 'productos': 0, 'diferencias': [], 'reparados': 0}
+        ultimo = None
+
+        while True:
+            stock_libro = _saldo_previo(Producto.id_producto, FIN_DEL_LIBRO).label('stock_libro')
+            query = select(Producto.id_producto, Producto.stock, stock_libro)\
+                .where(Producto.id_empresa == id_empresa)
+            if ultimo is not None:
+                query = query.where(Producto.id_producto > ultimo)
+            query = query.order_by(Producto.id_producto).limit(lote)
+            if reparar:
+                # Las ventas concurrentes esperan a que el lote termine
+                query = query.with_for_update(of=Producto)
+
+            filas = db.session.execute(query).all()
+            if not filas:
+                break
+
+            ultimo = filas[-1].id_producto
+            resultado['productos'] += len(filas)
+            diferencias = [f for f in filas if f.stock != f.stock_libro]
+
+            for fila in diferencias:
+                resultado['diferencias'].append({
+                    'id_producto': fila.id_producto,
+                    'stock': fila.stock,
+                    'stock_libro': int(fila.stock_libro),
+                    'diferencia': fila.stock - int(fila.stock_libro)
+                })
+
+            if reparar and diferencias:
+                if fuente == "stock":
+                    _registrar_ajustes_conciliacion(diferencias, id_usuario)
+                else:
+                    _corregir_stock_desde_libro(id_empresa, diferencias)
+                resultado['reparados'] += len(diferencias)
+
+            # Confirmar por lote para liberar los bloqueos pronto
+            db.session.commit()
+
+            if len(filas) < lote:
+                break
+
+        return resultado, None
+
+    except Exception as e:
+        db.session.rollback()
+        return None, f"Error al conciliar stock: {str(e)}"
+
+def _registrar_ajustes_conciliacion(diferencias, id_usuario):
+    """Agregar al libro un movimiento por diferencia (inserción masiva)"""
+    ahora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    db.session.execute(insert(MovimientoInventario), [
+        {
+            'id_movimiento': f"CONC_{uuid4().hex[:16]}",
+            'tipo_movimiento': "ENTRADA" if fila.stock > fila.stock_libro else "SALIDA",
+            'fecha_hora': ahora,
+            'cantidad': abs(fila.stock - int(fila.stock_libro)),
+            'id_producto': fila.id_producto,
+            'id_usuario': id_usuario
+        }
+        for fila in diferencias
+    ])
+
+def _corregir_stock_desde_libro(id_empresa, diferencias):
+    """Llevar Producto.stock al valor del libro con un solo UPDATE ... FROM (VALUES ...)"""
+    valores = values(
+        column('id_producto', String),
+        column('stock_libro', Integer),
+        name='libro'
+    ).data([(f.id_producto, int(f.stock_libro)) for f in diferencias]).cte('libro')
+
+    db.session.execute(
+        update(Producto)
+        .where(
+            Producto.id_empresa == id_empresa,
+            Producto.id_producto == valores.c.id_producto
+        )
+        .values(stock=valores.c.stock_libro)
+        .execution_options(synchronize_session=False)
+    )
@@ -1,6 +1,9 @@
-from app.models import db, Producto, MovimientoInventario
+from app.models import db, Producto, MovimientoInventario, SnapshotStock, ReservaStock, ItemCarrito, DetalleConteo
+from app.cache import cache_consulta
 from flask import session
 from datetime import datetime
+from uuid import uuid4
+from sqlalchemy import select, delete
 from sqlalchemy.exc import IntegrityError
 
 def crear_producto(id_producto, nombre, descripcion, precio, stock, id_empresa):
@@ -28,10 +31,10 @@ def crear_producto(id_producto, nombre, descripcion, precio, stock, id_empresa):
         )
         
         db.session.add(nuevo_producto)
-        db.session.commit()
         
-        # Registrar movimiento de inventario inicial
+        # Registrar movimiento de inventario inicial (en la misma transacción)
         if stock > 0:
+            db.session.flush()
             registrar_movimiento_inventario(
                 id_producto=id_producto,
                 tipo_movimiento="ENTRADA",
@@ -39,6 +42,7 @@ def crear_producto(id_producto, nombre, descripcion, precio, stock, id_empresa):
                 motivo="Stock inicial"
             )
         
+        db.session.commit()
         return nuevo_producto, None
         
     except IntegrityError:
@@ -48,9 +52,11 @@ def crear_producto(id_producto, nombre, descripcion, precio, stock, id_empresa):
         db.session.rollback()
         return None, f"Error al crear producto: {str(e)}"
 
+@cache_consulta('producto')
 def listar_productos(id_empresa):
     """
-    Obtener todos los productos de una empresa
+    Obtener todos los productos de una empresa. Cacheada: copias sin
+    sesión, solo columnas
     """
     try:
         productos = Producto.query.filter_by(id_empresa=id_empresa).order_by(Producto.nombre).all()
@@ -117,15 +123,34 @@ def eliminar_producto(producto):
         if hasattr(producto, 'detalles_venta') and producto.detalles_venta:
             return False, "No se puede eliminar: el producto tiene ventas registradas"
         
-        # Registrar movimiento de salida total si tenía stock
-        if producto.stock > 0:
-            registrar_movimiento_inventario(
-                id_producto=producto.id_producto,
-                tipo_movimiento="SALIDA",
-                cantidad=producto.stock,
-                motivo="Eliminación de producto"
-            )
-        
+        # El libro de movimientos es de solo inserción: un producto con
+        # historial no se puede borrar sin romper el kardex. La única
+        # excepción es la ENTRADA de stock inicial que registra
+        # crear_producto, que se borra junto con el producto.
+        movimientos = db.session.execute(
+            select(MovimientoInventario.tipo_movimiento)
+            .where(MovimientoInventario.id_producto == producto.id_producto)
+            .limit(2)
+        ).scalars().all()
+        if len(movimientos) > 1 or (movimientos and movimientos[0] != "ENTRADA"):
+            return False, "No se puede eliminar: el producto tiene movimientos de inventario registrados"
+
+        en_conteos = db.session.execute(
+            select(DetalleConteo.id_detalle_conteo).where(DetalleConteo.id_producto == producto.id_producto).limit(1)
+        ).first()
+        if en_conteos:
+            return False, "No se puede eliminar: el producto aparece en conteos de inventario"
+
+        en_carritos = db.session.execute(
+            select(ItemCarrito.id_carrito).where(ItemCarrito.id_producto == producto.id_producto).limit(1)
+        ).first()
+        if en_carritos:
+            return False, "No se puede eliminar: el producto está en un carrito abierto del POS"
+
+        # Sin ORM: los eventos del modelo impiden borrar movimientos sueltos.
+        # Las reservas que quedan sin línea de carrito ya están vencidas.
+        for modelo in (MovimientoInventario, SnapshotStock, ReservaStock):
+            db.session.execute(delete(modelo).where(modelo.id_producto == producto.id_producto))
         db.session.delete(producto)
         db.session.commit()
         return True, None
@@ -171,9 +196,10 @@ def registrar_movimiento_inventario(id_producto, tipo_movimiento, cantidad, moti
     Registrar un movimiento de inventario
     """
     try:
-        # Generar ID único para el movimiento
+        # Generar ID único para el movimiento (el sufijo aleatorio evita
+        # choques entre movimientos registrados en el mismo segundo)
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        id_movimiento = f"MOV_{id_producto}_{timestamp}"
+        id_movimiento = f"MOV_{timestamp}_{uuid4().hex[:12]}"
         
         movimiento = MovimientoInventario(
             id_movimiento=id_movimiento,
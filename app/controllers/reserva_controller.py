@@ -0,0 +1,171 @@
+from app.models import db, Producto, ReservaStock
+from flask import current_app
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete, func
+
+# ----------------------------------------------------------------------
+# Reservas de stock para carritos abiertos del POS
+# ----------------------------------------------------------------------
+def _ahora():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def _vencimiento():
+    ttl = current_app.config.get('RESERVA_TTL_SEGUNDOS', 600)
+    return (datetime.now() + timedelta(seconds=ttl)).strftime("%Y-%m-%d %H:%M:%S")
+
+def _reservado_por_otros(id_producto, id_carrito, ahora):
+    """Unidades del producto apartadas por otros carritos con reserva vigente"""
+    return select(func.coalesce(func.sum(ReservaStock.cantidad), 0)).where(
+        ReservaStock.id_producto == id_producto,
+        ReservaStock.id_carrito != (id_carrito or ""),
+        ReservaStock.expira_en > ahora
+    ).scalar_subquery()
+
+def obtener_reservas_activas(ids_productos, excluir_carrito=None):
+    """
+    Unidades reservadas por producto (reservas vigentes), en una sola consulta.
+    Las del carrito `excluir_carrito` no se cuentan.
+    """
+    try:
+        if not ids_productos:
+            return {}
+
+        query = select(ReservaStock.id_producto, func.sum(ReservaStock.cantidad)).where(
+            ReservaStock.id_producto.in_(ids_productos),
+            ReservaStock.expira_en > _ahora()
+        )
+        if excluir_carrito:
+            query = query.where(ReservaStock.id_carrito != excluir_carrito)
+
+        return dict(db.session.execute(query.group_by(ReservaStock.id_producto)).all())
+
+    except Exception as e:
+        print(f"Error al obtener reservas: {str(e)}")
+        return {}
+
+def reservar_stock(id_empresa, id_carrito, id_producto, cantidad, id_usuario, confirmar=True):
+    """
+    Fijar cuántas unidades del producto aparta el carrito (0 libera la línea).
+
+    La disponibilidad se calcula con una lectura simple (stock menos las
+    reservas vigentes de otros carritos), sin bloquear la fila del producto.
+    Cada llamada renueva el vencimiento de todo el carrito. Con
+    confirmar=False se deja la transacción abierta para quien llama.
+
+    Retorna (disponible_para_el_carrito, error).
+    """
+    try:
+        if not id_carrito:
+            return 0, "Carrito no válido"
+
+        cantidad = int(cantidad)
+        if cantidad < 0:
+            return 0, "La cantidad no puede ser negativa"
+
+        ahora = _ahora()
+
+        fila = db.session.execute(
+            select(
+                Producto.nombre,
+                Producto.stock - _reservado_por_otros(id_producto, id_carrito, ahora)
+            ).where(
+                Producto.id_producto == id_producto,
+                Producto.id_empresa == id_empresa
+            )
+        ).first()
+        if not fila:
+            return 0, "Producto no encontrado"
+
+        nombre, disponible = fila[0], int(fila[1])
+        if cantidad > disponible:
+            return disponible, f"Stock insuficiente para {nombre}. Disponible: {max(disponible, 0)}"
+
+        # Limpieza de reservas vencidas de este producto (usa el índice)
+        db.session.execute(
+            delete(ReservaStock).where(
+                ReservaStock.id_producto == id_producto,
+                ReservaStock.expira_en <= ahora
+            ).execution_options(synchronize_session=False)
+        )
+
+        reserva = db.session.get(ReservaStock, (id_carrito, id_producto))
+        if cantidad == 0:
+            if reserva:
+                db.session.delete(reserva)
+        elif reserva:
+            reserva.cantidad = cantidad
+        else:
+            db.session.add(ReservaStock(
+                id_carrito=id_carrito,
+                id_producto=id_producto,
+                cantidad=cantidad,
+                expira_en=ahora,
+                id_usuario=id_usuario,
+                id_empresa=id_empresa
+            ))
+
+        db.session.flush()
+        renovar_reservas(id_empresa, id_carrito)
+        if confirmar:
+            db.session.commit()
+
+        return disponible, None
+
+    except ValueError:
+        return 0, "La cantidad debe ser un número entero"
+    except Exception as e:
+        if confirmar:
+            db.session.rollback()
+        return 0, f"Error al reservar stock: {str(e)}"
+
+def renovar_reservas(id_empresa, id_carrito):
+    """
+    Extender el vencimiento de todas las líneas del carrito (no confirma la transacción)
+    """
+    db.session.execute(
+        update(ReservaStock)
+        .where(
+            ReservaStock.id_empresa == id_empresa,
+            ReservaStock.id_carrito == id_carrito
+        )
+        .values(expira_en=_vencimiento())
+        .execution_options(synchronize_session=False)
+    )
+
+def liberar_reservas(id_empresa, id_carrito, confirmar=True):
+    """
+    Liberar todas las reservas del carrito (al vaciarlo o al cobrar la venta).
+    Con confirmar=False se deja la transacción abierta para quien llama.
+    """
+    try:
+        if not id_carrito:
+            return True, None
+
+        db.session.execute(
+            delete(ReservaStock).where(
+                ReservaStock.id_empresa == id_empresa,
+                ReservaStock.id_carrito == id_carrito
+            ).execution_options(synchronize_session=False)
+        )
+        if confirmar:
+            db.session.commit()
+        return True, None
+
+    except Exception as e:
+        if confirmar:
+            db.session.rollback()
+        return False, f"Error al liberar reservas: {str(e)}"
+
+def purgar_reservas_vencidas():
+    """
+    Borrar todas las reservas vencidas
+    """
+    try:
+        resultado = db.session.execute(
+            delete(ReservaStock).where(ReservaStock.expira_en <= _ahora())
+        )
+        db.session.commit()
+        return resultado.rowcount, None
+    except Exception as e:
+        db.session.rollback()
+        return 0, f"Error al purgar reservas: {str(e)}"
@@ -1,7 +1,8 @@
-from app.models import db, Usuario
-from flask_bcrypt import Bcrypt
-
-bcrypt = Bcrypt()
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from app.models import db, Usuario, Empresa
+from app.cache import cache_consulta
+from app.contrasenas import generar_hash, verificar_contrasena, necesita_rehash, HashOcupado
 
 # ----------------------------------------------------------------------
 # Crear usuario
@@ -19,8 +20,11 @@ def crear_usuario(nom_usuario, contrasena, correo_recuperacion, rol, id_empresa)
     if not existe_usuario:
         rol = 1  # Admin
 
-    # Generar hash con bcrypt
-    hashed_password = bcrypt.generate_password_hash(contrasena).decode("utf-8")
+    # Generar hash con bcrypt (en el pool, con el costo configurado)
+    try:
+        hashed_password = generar_hash(contrasena)
+    except HashOcupado as e:
+        return None, str(e)
 
     nuevo_usuario = Usuario(
         nom_usuario=nom_usuario,
@@ -29,8 +33,12 @@ def crear_usuario(nom_usuario, contrasena, correo_recuperacion, rol, id_empresa)
         rol=int(rol),
         id_empresa=int(id_empresa)
     )
-    db.session.add(nuevo_usuario)
-    db.session.commit()
+    try:
+        db.session.add(nuevo_usuario)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return None, "El usuario ya existe en esta empresa"
 
     return nuevo_usuario, None
 
@@ -38,16 +46,34 @@ def crear_usuario(nom_usuario, contrasena, correo_recuperacion, rol, id_empresa)
 # ----------------------------------------------------------------------
 # Autenticación
 # ----------------------------------------------------------------------
-def autenticar_usuario(nom_usuario, contrasena):
-    usuario = Usuario.query.filter_by(
-        nom_usuario=nom_usuario,
-    ).first()
+def autenticar_usuario(nit, nom_usuario, contrasena):
+    # Una sola consulta: uq_empresa_nit y uq_usuario_empresa_nom_usuario
+    usuario = db.session.execute(
+        select(Usuario)
+        .join(Empresa, Empresa.id_empresa == Usuario.id_empresa)
+        .where(
+            Empresa.nit == (nit or "").strip(),
+            Usuario.nom_usuario == nom_usuario
+        )
+    ).scalar_one_or_none()
 
     if not usuario:
         return None, "Usuario no encontrado en esta empresa"
 
-    if not bcrypt.check_password_hash(usuario.contrasena, contrasena):
-        return None, "Contraseña incorrecta"
+    try:
+        if not verificar_contrasena(usuario.contrasena, contrasena):
+            return None, "Contraseña incorrecta"
+
+        # Si cambió BCRYPT_LOG_ROUNDS, se actualiza el hash ahora que se conoce la contraseña
+        if necesita_rehash(usuario.contrasena):
+            usuario.contrasena = generar_hash(contrasena)
+            db.session.commit()
+
+    except HashOcupado as e:
+        return None, str(e)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error al actualizar hash de {usuario.nom_usuario}: {str(e)}")
 
     return usuario, None
 
@@ -55,7 +81,12 @@ def autenticar_usuario(nom_usuario, contrasena):
 # ----------------------------------------------------------------------
 # CRUD
 # ----------------------------------------------------------------------
+@cache_consulta('usuario')
 def listar_usuarios(id_empresa):
+    """
+    Usuarios de la empresa. Cacheada: copias sin sesión, solo columnas
+    (rol_rel y empresa no están disponibles)
+    """
     return Usuario.query.filter_by(id_empresa=id_empresa).all()
 
 
@@ -64,13 +95,20 @@ def obtener_usuario(id_empresa, id_usuario):
 
 
 def actualizar_usuario(usuario, nom_usuario, contrasena, correo_recuperacion, rol):
-    usuario.nom_usuario = nom_usuario
     if contrasena:
-        usuario.contrasena = bcrypt.generate_password_hash(contrasena).decode("utf-8")
+        try:
+            usuario.contrasena = generar_hash(contrasena)
+        except HashOcupado as e:
+            return None, str(e)
+    usuario.nom_usuario = nom_usuario
     usuario.correo_recuperacion = correo_recuperacion
     usuario.rol = int(rol)
-    db.session.commit()
-    return usuario
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return None, "Ya existe otro usuario con ese nombre en esta empresa"
+    return usuario, None
 
 
 def eliminar_usuario(usuario):
@@ -1,30 +1,52 @@
-from app.models import db, Venta, DetalleVenta, Producto, MovimientoInventario, Usuario
+from app.models import db, Venta, DetalleVenta, Producto, MovimientoInventario, Usuario, DevolucionVenta, DetalleDevolucion, MetodoPago, Carrito
+from app.cache import obtener_version, incrementar_version, cache_consulta, consulta_compartida
+from app.replica import solo_lectura
+from app.invalidacion import suscribir
+from app.controllers.reserva_controller import obtener_reservas_activas, liberar_reservas
+from app.controllers.carrito_controller import obtener_precio_catalogo
 from flask import session
 from datetime import datetime, date
+from uuid import uuid4
+from collections import namedtuple
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import func, and_, desc
-
-# Modelo para métodos de pago (temporal, mientras no esté en la BD)
-class MetodoPago:
-    def __init__(self, id, nombre, descripcion="", activo=True):
-        self.id = id
-        self.nombre = nombre
-        self.descripcion = descripcion
-        self.activo = activo
-
-# Métodos de pago predeterminados (luego se pueden guardar en BD)
-METODOS_PAGO_DEFAULT = {
-    1: MetodoPago(1, "💵 Efectivo", "Pago en dinero físico", True),
-    2: MetodoPago(2, "💳 Tarjeta de Débito", "Pago con tarjeta débito", True),
-    3: MetodoPago(3, "💳 Tarjeta de Crédito", "Pago con tarjeta crédito", True),
-    4: MetodoPago(4, "📱 Transferencia", "Transferencia bancaria", True),
-    5: MetodoPago(5, "📱 PSE", "Pagos Seguros en Línea", True),
-    6: MetodoPago(6, "🏦 Consignación", "Depósito bancario", True),
-}
-
-def crear_venta(items, metodo_pago, descuento=0, id_empresa=None, id_usuario=None):
-    """
-    Crear una nueva venta con sus detalles
+from sqlalchemy import select, insert, update, func, and_, desc, cast, literal, values, column, String, Integer
+from sqlalchemy.orm import joinedload, selectinload
+
+# Métodos de pago que se crean para cada empresa la primera vez
+METODOS_PAGO_PREDETERMINADOS = [
+    ("💵 Efectivo", "Pago en dinero físico"),
+    ("💳 Tarjeta de Débito", "Pago con tarjeta débito"),
+    ("💳 Tarjeta de Crédito", "Pago con tarjeta crédito"),
+    ("📱 Transferencia", "Transferencia bancaria"),
+    ("📱 PSE", "Pagos Seguros en Línea"),
+    ("🏦 Consignación", "Depósito bancario"),
+]
+
+# Copia de solo lectura de un método de pago, segura para compartir entre requests
+MetodoPagoLectura = namedtuple("MetodoPagoLectura", "id nombre descripcion activo predeterminado")
+
+# Caché por proceso: id_empresa -> (versión, [MetodoPagoLectura])
+_metodos_cache = {}
+
+def _al_cambiar_metodos(id_empresa, id_metodo, columnas):
+    if id_empresa is None:
+        _metodos_cache.clear()
+    else:
+        _metodos_cache.pop(id_empresa, None)
+
+suscribir('metodo_pago', _al_cambiar_metodos)
+
+def crear_venta(items, metodo_pago, descuento=0, id_empresa=None, id_usuario=None, id_carrito=None):
+    """
+    Crear una nueva venta con sus detalles.
+
+    Las unidades reservadas por otros carritos abiertos no se pueden vender;
+    las reservas del propio carrito se liberan en la misma transacción. Solo
+    cuenta como propio un carrito de la empresa abierto por el mismo usuario.
+
+    Las filas de los productos se leen con SELECT ... FOR UPDATE (en orden
+    de id_producto, para no cruzar bloqueos): dos ventas del mismo producto
+    se validan y descuentan una después de la otra.
     """
     try:
         # Calcular totales
@@ -32,22 +54,46 @@ def crear_venta(items, metodo_pago, descuento=0, id_empresa=None, id_usuario=Non
         cantidad_total = 0
         detalles_venta = []
         
+        if id_carrito and not Carrito.query.filter_by(
+            id_carrito=id_carrito, id_empresa=id_empresa, id_usuario=id_usuario
+        ).first():
+            id_carrito = None
+        
+        ids_productos = sorted({item['id_producto'] for item in items})
+        productos = {
+            p.id_producto: p for p in db.session.execute(
+                select(Producto)
+                .where(Producto.id_producto.in_(ids_productos), Producto.id_empresa == id_empresa)
+                .order_by(Producto.id_producto)
+                .with_for_update()
+                .execution_options(populate_existing=True)
+            ).scalars()
+        }
+        
+        # Con los productos bloqueados: las reservas leídas ya no cambian de
+        # dueño por una venta concurrente
+        reservadas = obtener_reservas_activas(ids_productos, excluir_carrito=id_carrito)
+        solicitadas = {}
+        
         # Validar productos y calcular subtotal
         for item in items:
-            producto = Producto.query.filter_by(
-                id_producto=item['id_producto'],
-                id_empresa=id_empresa
-            ).first()
+            producto = productos.get(item['id_producto'])
             
             if not producto:
+                db.session.rollback()
                 return None, f"Producto {item['id_producto']} no encontrado"
             
             cantidad = int(item['cantidad'])
             if cantidad <= 0:
+                db.session.rollback()
                 return None, f"La cantidad debe ser mayor a 0"
             
-            if producto.stock < cantidad:
-                return None, f"Stock insuficiente para {producto.nombre}. Disponible: {producto.stock}"
+            # Un producto repetido en varias líneas se valida por el total
+            solicitadas[producto.id_producto] = solicitadas.get(producto.id_producto, 0) + cantidad
+            disponible = producto.stock - reservadas.get(producto.id_producto, 0)
+            if disponible < solicitadas[producto.id_producto]:
+                db.session.rollback()
+                return None, f"Stock insuficiente para {producto.nombre}. Disponible: {max(disponible, 0)}"
             
             precio_unitario = producto.precio
             subtotal_item = precio_unitario * cantidad
@@ -106,6 +152,10 @@ def crear_venta(items, metodo_pago, descuento=0, id_empresa=None, id_usuario=Non
                 id_usuario=id_usuario
             )
         
+        _, error = liberar_reservas(id_empresa, id_carrito, confirmar=False)
+        if error:
+            raise Exception(error)
+        
         db.session.commit()
         return venta, None
         
@@ -113,12 +163,17 @@ def crear_venta(items, metodo_pago, descuento=0, id_empresa=None, id_usuario=Non
         db.session.rollback()
         return None, f"Error al procesar venta: {str(e)}"
 
+@solo_lectura
 def listar_ventas(id_empresa, fecha_desde=None, fecha_hasta=None, limit=50):
     """
     Obtener lista de ventas con filtros
     """
     try:
-        query = Venta.query.filter_by(id_empresa=id_empresa)
+        # El historial muestra vendedor y productos de cada venta
+        query = Venta.query.options(
+            joinedload(Venta.usuario),
+            selectinload(Venta.detalles).joinedload(DetalleVenta.producto)
+        ).filter_by(id_empresa=id_empresa)
         
         if fecha_desde:
             query = query.filter(func.date(Venta.fecha_hora) >= fecha_desde)
@@ -133,12 +188,16 @@ def listar_ventas(id_empresa, fecha_desde=None, fecha_hasta=None, limit=50):
         print(f"Error al listar ventas: {str(e)}")
         return []
 
+@solo_lectura
 def obtener_venta(id_empresa, id_venta):
     """
     Obtener una venta específica con sus detalles
     """
     try:
-        venta = Venta.query.filter_by(
+        venta = Venta.query.options(
+            joinedload(Venta.usuario),
+            selectinload(Venta.detalles).joinedload(DetalleVenta.producto)
+        ).filter_by(
             id_venta=id_venta,
             id_empresa=id_empresa
         ).first()
@@ -147,9 +206,11 @@ def obtener_venta(id_empresa, id_venta):
         print(f"Error al obtener venta: {str(e)}")
         return None
 
+@cache_consulta('producto')
 def obtener_productos_disponibles(id_empresa):
     """
-    Obtener productos disponibles para la venta (con stock > 0)
+    Obtener productos disponibles para la venta (con stock > 0). Cacheada:
+    copias sin sesión, solo columnas
     """
     try:
         productos = Producto.query.filter(
@@ -177,9 +238,10 @@ def buscar_producto_venta(id_empresa, termino_busqueda):
         print(f"Error en búsqueda: {str(e)}")
         return []
 
-def calcular_venta(items, descuento=0):
+def calcular_venta(items, descuento=0, id_empresa=None):
     """
-    Calcular totales de una venta sin crearla
+    Calcular totales de una venta sin crearla.
+    Los precios salen del catálogo, no de los que envía el navegador.
     """
     try:
         subtotal = 0
@@ -188,7 +250,10 @@ def calcular_venta(items, descuento=0):
         
         for item in items:
             cantidad = int(item.get('cantidad', 0))
-            precio = float(item.get('precio', 0))
+            catalogo = obtener_precio_catalogo(id_empresa, item.get('id_producto'))
+            if not catalogo:
+                return {'error': f"Producto {item.get('id_producto')} no encontrado"}
+            precio = catalogo[1]
             subtotal_item = precio * cantidad
             
             subtotal += subtotal_item
@@ -216,92 +281,344 @@ def calcular_venta(items, descuento=0):
     except Exception as e:
         return {'error': str(e)}
 
-def obtener_metodos_pago(id_empresa):
+def _clave_metodos(id_empresa):
+    return f"metodo_pago:{id_empresa}"
+
+def _cargar_metodos_pago(id_empresa):
+    metodos = MetodoPago.query.filter_by(id_empresa=id_empresa).order_by(MetodoPago.id_metodo).all()
+
+    if not metodos:
+        # Primera vez de la empresa: crear los métodos básicos
+        try:
+            db.session.add_all([
+                MetodoPago(nombre=nombre, descripcion=descripcion, activo=True,
+                           predeterminado=True, id_empresa=id_empresa)
+                for nombre, descripcion in METODOS_PAGO_PREDETERMINADOS
+            ])
+            incrementar_version(_clave_metodos(id_empresa))
+            db.session.commit()
+        except IntegrityError:
+            # Otro proceso los creó al mismo tiempo
+            db.session.rollback()
+        metodos = MetodoPago.query.filter_by(id_empresa=id_empresa).order_by(MetodoPago.id_metodo).all()
+
+    return [
+        MetodoPagoLectura(m.id_metodo, m.nombre, m.descripcion or "", m.activo, m.predeterminado)
+        for m in metodos
+    ]
+
+def obtener_metodos_pago(id_empresa, solo_activos=True):
+    """
+    Obtener los métodos de pago de la empresa.
+
+    Se sirven desde la memoria del proceso mientras la versión guardada en
+    la BD no cambie; la versión se consulta una vez por request.
+    """
+    try:
+        version = obtener_version(_clave_metodos(id_empresa))
+        en_cache = _metodos_cache.get(id_empresa)
+
+        if en_cache and en_cache[0] == version:
+            metodos = en_cache[1]
+        else:
+            metodos = _cargar_metodos_pago(id_empresa)
+            # Si se sembraron los básicos la versión cambió
+            version = obtener_version(_clave_metodos(id_empresa))
+            _metodos_cache[id_empresa] = (version, metodos)
+
+        return [m for m in metodos if m.activo] if solo_activos else list(metodos)
+
+    except Exception as e:
+        print(f"Error al obtener métodos de pago: {str(e)}")
+        return []
+
+def metodo_pago_valido(id_empresa, nombre):
     """
-    Obtener métodos de pago disponibles
+    Verificar que el método de pago exista y esté activo en la empresa
     """
-    # Por ahora devolvemos los métodos predeterminados
-    # En el futuro se pueden personalizar por empresa
-    return [metodo for metodo in METODOS_PAGO_DEFAULT.values() if metodo.activo]
+    return any(m.nombre == nombre for m in obtener_metodos_pago(id_empresa))
+
+def _guardar_metodos(id_empresa):
+    """Confirmar un cambio de métodos de pago e invalidar su caché en todos los procesos"""
+    incrementar_version(_clave_metodos(id_empresa))
+    db.session.commit()
+    _metodos_cache.pop(id_empresa, None)
 
 def crear_metodo_pago(nombre, descripcion="", activo=True, id_empresa=None):
     """
     Crear nuevo método de pago personalizado
     """
     try:
-        # Por ahora agregamos al diccionario temporal
-        # En el futuro se guardará en BD
-        nuevo_id = max(METODOS_PAGO_DEFAULT.keys()) + 1
-        nuevo_metodo = MetodoPago(nuevo_id, nombre, descripcion, activo)
-        METODOS_PAGO_DEFAULT[nuevo_id] = nuevo_metodo
-        
+        existe = MetodoPago.query.filter_by(id_empresa=id_empresa, nombre=nombre).first()
+        if existe:
+            return False, "Ya existe un método de pago con este nombre"
+
+        db.session.add(MetodoPago(
+            nombre=nombre,
+            descripcion=descripcion or None,
+            activo=activo,
+            predeterminado=False,
+            id_empresa=id_empresa
+        ))
+        _guardar_metodos(id_empresa)
         return True, None
+
+    except IntegrityError:
+        db.session.rollback()
+        return False, "Ya existe un método de pago con este nombre"
     except Exception as e:
+        db.session.rollback()
         return False, f"Error al crear método de pago: {str(e)}"
 
-def actualizar_metodo_pago(id_metodo, nombre, descripcion="", activo=True):
+def actualizar_metodo_pago(id_empresa, id_metodo, nombre, descripcion="", activo=True):
     """
     Actualizar método de pago existente
     """
     try:
-        if id_metodo in METODOS_PAGO_DEFAULT:
-            metodo = METODOS_PAGO_DEFAULT[id_metodo]
-            metodo.nombre = nombre
-            metodo.descripcion = descripcion
-            metodo.activo = activo
-            return True, None
-        else:
+        metodo = MetodoPago.query.filter_by(id_metodo=id_metodo, id_empresa=id_empresa).first()
+        if not metodo:
             return False, "Método de pago no encontrado"
+
+        metodo.nombre = nombre
+        metodo.descripcion = descripcion or None
+        metodo.activo = activo
+        _guardar_metodos(id_empresa)
+        return True, None
+
+    except IntegrityError:
+        db.session.rollback()
+        return False, "Ya existe un método de pago con este nombre"
     except Exception as e:
+        db.session.rollback()
         return False, f"Error al actualizar método de pago: {str(e)}"
 
-def eliminar_metodo_pago(id_metodo):
+def cambiar_estado_metodo_pago(id_empresa, id_metodo):
+    """
+    Activar o desactivar un método de pago
+    """
+    try:
+        metodo = MetodoPago.query.filter_by(id_metodo=id_metodo, id_empresa=id_empresa).first()
+        if not metodo:
+            return None, "Método de pago no encontrado"
+
+        metodo.activo = not metodo.activo
+        activo = metodo.activo
+        _guardar_metodos(id_empresa)
+        return activo, None
+
+    except Exception as e:
+        db.session.rollback()
+        return None, f"Error al cambiar estado del método de pago: {str(e)}"
+
+def eliminar_metodo_pago(id_empresa, id_metodo):
     """
     Eliminar método de pago
     """
     try:
-        if id_metodo in METODOS_PAGO_DEFAULT and id_metodo > 6:  # No eliminar los básicos
-            del METODOS_PAGO_DEFAULT[id_metodo]
-            return True, None
-        else:
+        metodo = MetodoPago.query.filter_by(id_metodo=id_metodo, id_empresa=id_empresa).first()
+        if not metodo or metodo.predeterminado:  # No eliminar los básicos
             return False, "No se puede eliminar este método de pago"
+
+        db.session.delete(metodo)
+        _guardar_metodos(id_empresa)
+        return True, None
+
     except Exception as e:
+        db.session.rollback()
         return False, f"Error al eliminar método de pago: {str(e)}"
 
-def anular_venta(id_venta, motivo, id_usuario):
+def devolver_venta(id_empresa, id_venta, cantidades, motivo, id_usuario, anular=False):
     """
-    Anular una venta y restaurar stock
+    Devolver unidades de una venta (o anularla completa) y restaurar stock.
+
+    cantidades: {id_detalle: cantidad a devolver}. Con anular=True se
+    devuelve todo lo que quede pendiente de cada línea. El stock se restaura
+    con un solo UPDATE ... FROM (VALUES ...), las entradas de inventario se
+    insertan con INSERT ... SELECT y los totales de la venta se ajustan en la
+    misma transacción.
+
+    Retorna (devolucion, error).
     """
     try:
-        venta = Venta.query.get(id_venta)
+        if not motivo:
+            return None, "Debe especificar un motivo"
+
+        # Bloquear la venta: dos devoluciones simultáneas no pueden devolver la misma unidad
+        venta = db.session.execute(
+            select(Venta)
+            .where(Venta.id_venta == id_venta, Venta.id_empresa == id_empresa)
+            .with_for_update()
+        ).scalar_one_or_none()
         if not venta:
-            return False, "Venta no encontrada"
-        
-        # Restaurar stock de todos los productos
-        for detalle in venta.detalles:
-            producto = detalle.producto
-            producto.stock += detalle.cantidad
-            
-            # Registrar movimiento de devolución
-            registrar_movimiento_inventario(
-                id_producto=producto.id_producto,
-                tipo_movimiento="ENTRADA",
-                cantidad=detalle.cantidad,
-                motivo=f"Anulación venta #{id_venta}: {motivo}",
-                id_usuario=id_usuario
+            return None, "Venta no encontrada"
+        if venta.metodo_pago.startswith('ANULADA'):
+            db.session.rollback()
+            return None, "La venta ya está anulada"
+
+        # Cantidad vendida y ya devuelta por línea, en una sola consulta
+        devuelto = select(
+            DetalleDevolucion.id_detalle,
+            func.sum(DetalleDevolucion.cantidad).label('cantidad')
+        ).group_by(DetalleDevolucion.id_detalle).subquery()
+
+        lineas = db.session.execute(
+            select(
+                DetalleVenta.id_detalle,
+                DetalleVenta.id_producto,
+                DetalleVenta.cantidad,
+                DetalleVenta.precio_unitario,
+                func.coalesce(devuelto.c.cantidad, 0).label('devuelto')
             )
-        
-        # Marcar venta como anulada (podrías agregar un campo 'estado' a la tabla)
-        # Por ahora, podrías cambiar el total a negativo o agregar un prefijo
-        venta.metodo_pago = f"ANULADA - {venta.metodo_pago}"
-        
+            .outerjoin(devuelto, devuelto.c.id_detalle == DetalleVenta.id_detalle)
+            .where(DetalleVenta.id_venta == id_venta)
+        ).all()
+
+        a_devolver = []
+        for linea in lineas:
+            pendiente = linea.cantidad - linea.devuelto
+            cantidad = pendiente if anular else int(cantidades.get(linea.id_detalle, 0) or 0)
+            if cantidad < 0:
+                db.session.rollback()
+                return None, "Las cantidades a devolver no pueden ser negativas"
+            if cantidad > pendiente:
+                db.session.rollback()
+                return None, f"Solo quedan {pendiente} unidades por devolver de {linea.id_producto}"
+            if cantidad > 0:
+                a_devolver.append((linea, cantidad))
+
+        if not anular and not a_devolver:
+            db.session.rollback()
+            return None, "No hay unidades para devolver"
+
+        ahora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        subtotal_devuelto = sum(linea.precio_unitario * cantidad for linea, cantidad in a_devolver)
+        cantidad_devuelta = sum(cantidad for _, cantidad in a_devolver)
+        # El reembolso conserva la proporción de descuento de la venta
+        total_devuelto = round(subtotal_devuelto * venta.total / venta.subtotal) if venta.subtotal else 0
+
+        devolucion = DevolucionVenta(
+            id_venta=id_venta,
+            tipo="ANULACION" if anular else "PARCIAL",
+            motivo=motivo[:255],
+            fecha_hora=ahora,
+            cantidad=cantidad_devuelta,
+            total=total_devuelto,
+            id_usuario=id_usuario,
+            id_empresa=id_empresa
+        )
+        db.session.add(devolucion)
+        db.session.flush()  # Para obtener el ID de la devolución
+
+        if a_devolver:
+            db.session.execute(insert(DetalleDevolucion), [
+                {
+                    'id_devolucion': devolucion.id_devolucion,
+                    'id_detalle': linea.id_detalle,
+                    'id_producto': linea.id_producto,
+                    'cantidad': cantidad,
+                    'subtotal': linea.precio_unitario * cantidad
+                }
+                for linea, cantidad in a_devolver
+            ])
+
+            # Entradas de inventario, una por línea devuelta
+            db.session.execute(
+                insert(MovimientoInventario).from_select(
+                    ['id_movimiento', 'tipo_movimiento', 'fecha_hora', 'cantidad', 'id_producto', 'id_usuario'],
+                    select(
+                        literal("DEV_") + cast(DetalleDevolucion.id_detalle_devolucion, String),
+                        literal("ENTRADA"),
+                        literal(ahora),
+                        DetalleDevolucion.cantidad,
+                        DetalleDevolucion.id_producto,
+                        literal(id_usuario)
+                    ).where(DetalleDevolucion.id_devolucion == devolucion.id_devolucion)
+                )
+            )
+
+            # Restaurar stock con un solo UPDATE ... FROM (VALUES ...)
+            por_producto = {}
+            for linea, cantidad in a_devolver:
+                por_producto[linea.id_producto] = por_producto.get(linea.id_producto, 0) + cantidad
+
+            devueltos = values(
+                column('id_producto', String),
+                column('cantidad', Integer),
+                name='devueltos'
+            ).data(list(por_producto.items())).cte('devueltos')
+
+            db.session.execute(
+                update(Producto)
+                .where(
+                    Producto.id_empresa == id_empresa,
+                    Producto.id_producto == devueltos.c.id_producto
+                )
+                .values(stock=Producto.stock + devueltos.c.cantidad)
+                .execution_options(synchronize_session=False)
+            )
+
+        # Totales de la venta: las anulaciones se excluyen de los reportes por
+        # metodo_pago; las devoluciones parciales descuentan lo reembolsado
+        if anular:
+            venta.metodo_pago = f"ANULADA - {venta.metodo_pago}"[:100]
+        else:
+            venta.total -= total_devuelto
+            venta.subtotal -= subtotal_devuelto
+            venta.cantidad -= cantidad_devuelta
+
         db.session.commit()
-        return True, None
-        
+
+        # Los productos cargados en la sesión tienen el stock anterior
+        db.session.expire_all()
+
+        return devolucion, None
+
+    except ValueError:
+        db.session.rollback()
+        return None, "Las cantidades deben ser números enteros"
     except Exception as e:
         db.session.rollback()
-        return False, f"Error al anular venta: {str(e)}"
+        return None, f"Error al registrar devolución: {str(e)}"
+
+def anular_venta(id_empresa, id_venta, motivo, id_usuario):
+    """
+    Anular una venta y restaurar el stock que no se haya devuelto
+    """
+    devolucion, error = devolver_venta(id_empresa, id_venta, {}, motivo, id_usuario, anular=True)
+    if error:
+        return False, error
+    return True, None
 
+@solo_lectura
+def obtener_devoluciones_venta(id_empresa, id_venta):
+    """
+    Devoluciones de una venta y unidades devueltas por línea
+    """
+    try:
+        devoluciones = DevolucionVenta.query.options(
+            joinedload(DevolucionVenta.usuario)
+        ).filter_by(
+            id_venta=id_venta,
+            id_empresa=id_empresa
+        ).order_by(DevolucionVenta.id_devolucion).all()
+
+        devuelto = dict(db.session.execute(
+            select(DetalleDevolucion.id_detalle, func.sum(DetalleDevolucion.cantidad))
+            .join(DevolucionVenta)
+            .where(
+                DevolucionVenta.id_venta == id_venta,
+                DevolucionVenta.id_empresa == id_empresa
+            )
+            .group_by(DetalleDevolucion.id_detalle)
+        ).all())
+
+        return devoluciones, devuelto
+    except Exception as e:
+        print(f"Error al obtener devoluciones: {str(e)}")
+        return [], {}
+
+@consulta_compartida
+@solo_lectura
 def obtener_resumen_ventas_hoy(id_empresa):
     """
     Obtener resumen de ventas del día actual
@@ -309,7 +626,9 @@ def obtener_resumen_ventas_hoy(id_empresa):
     try:
         hoy = date.today()
         
-        query = Venta.query.filter(
+        # El resultado se comparte como copia sin sesión: el cajero de las
+        # ventas recientes se carga aquí
+        query = Venta.query.options(joinedload(Venta.usuario)).filter(
             Venta.id_empresa == id_empresa,
             func.date(Venta.fecha_hora) == hoy,
             ~Venta.metodo_pago.like('ANULADA%')  # Excluir anuladas
@@ -354,8 +673,9 @@ def registrar_movimiento_inventario(id_producto, tipo_movimiento, cantidad, moti
     Registrar movimiento de inventario
     """
     try:
+        # Sufijo aleatorio: varios movimientos del mismo producto pueden caer en el mismo segundo
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        id_movimiento = f"MOV_{id_producto}_{timestamp}"
+        id_movimiento = f"MOV_{timestamp}_{uuid4().hex[:12]}"
         
         movimiento = MovimientoInventario(
             id_movimiento=id_movimiento,
@@ -373,6 +693,8 @@ def registrar_movimiento_inventario(id_producto, tipo_movimiento, cantidad, moti
         print(f"Error al registrar movimiento: {str(e)}")
         return False
 
+@consulta_compartida
+@solo_lectura
 def obtener_productos_mas_vendidos(id_empresa, dias=30, limit=10):
     """
     Obtener productos más vendidos en los últimos días
@@ -404,6 +726,8 @@ def obtener_productos_mas_vendidos(id_empresa, dias=30, limit=10):
         print(f"Error al obtener productos más vendidos: {str(e)}")
         return []
 
+@consulta_compartida
+@solo_lectura
 def obtener_estadisticas_ventas(id_empresa, fecha_desde=None, fecha_hasta=None):
     """
     Obtener estadísticas detalladas de ventas
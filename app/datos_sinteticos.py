@@ -0,0 +1,286 @@
+import bisect
+import csv
+import io
+import random
+import time
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, select, text
+from app.models import db, Empresa, Rol, Usuario, Venta
+from app.contrasenas import generar_hash
+
+# ----------------------------------------------------------------------
+# Datos sintéticos para pruebas de escala (`flask datos generar`)
+#
+# Con la misma semilla y la misma fecha final se generan exactamente los
+# mismos datos. Cada empresa tiene un tamaño distinto (lognormal), sus
+# productos siguen una popularidad tipo Zipf y las ventas siguen la
+# estacionalidad del comercio: más los viernes y sábados, picos al medio
+# día y al final de la tarde, diciembre alto y enero bajo.
+#
+# Las filas se cargan por lotes con COPY en PostgreSQL y executemany en
+# las demás bases, sin pasar por el ORM. Los id se asignan aquí (máximo
+# actual + 1), así que no se debe generar mientras la app escribe ventas.
+# ----------------------------------------------------------------------
+LOTE = 20000
+
+ROLES = (("1", "Admin"), ("2", "Empleado"))
+CATEGORIAS = ("Arroz", "Café", "Cable", "Mouse", "Teclado", "Monitor", "Audífonos", "Cuaderno", "Jabón", "Gaseosa")
+METODOS_PAGO = ("💵 Efectivo", "💳 Tarjeta de Débito", "💳 Tarjeta de Crédito", "📱 Transferencia")
+PESOS_METODOS = (55, 20, 10, 15)
+
+# Lunes a domingo
+FACTOR_DIA_SEMANA = (0.85, 0.9, 0.95, 1.0, 1.25, 1.45, 0.7)
+FACTOR_MES = {1: 0.8, 2: 0.9, 6: 1.05, 11: 1.1, 12: 1.35}
+# Hora de apertura a cierre -> peso
+PESO_HORA = {7: 1, 8: 3, 9: 5, 10: 6, 11: 8, 12: 10, 13: 9, 14: 6, 15: 5, 16: 6, 17: 8, 18: 10, 19: 9, 20: 5, 21: 2}
+# Líneas por ticket: 1 a 8
+PESO_LINEAS = (35, 25, 15, 10, 6, 4, 3, 2)
+
+COLUMNAS = {
+    'venta': ('id_venta', 'fecha_hora', 'metodo_pago', 'total', 'id_usuario', 'id_empresa', 'cantidad', 'subtotal'),
+    'detalle_venta': ('id_detalle', 'id_venta', 'id_producto', 'cantidad', 'precio_unitario', 'subtotal'),
+    'movimiento_inventario': ('id_movimiento', 'tipo_movimiento', 'fecha_hora', 'cantidad', 'id_producto', 'id_usuario'),
+    'producto': ('id_producto', 'nombre', 'descripcion', 'precio', 'stock', 'id_empresa'),
+}
+
+def nit_sintetico(semilla, n):
+    return f"SIM{semilla}-{n:05d}"
+
+def _acumulados(pesos):
+    total, acumulados = 0, []
+    for peso in pesos:
+        total += peso
+        acumulados.append(total)
+    return acumulados
+
+def _elegir(azar, acumulados):
+    return bisect.bisect(acumulados, azar.random() * acumulados[-1])
+
+class _Cargador:
+    """
+    Buffers por tabla que se vacían cada LOTE filas en una transacción
+    """
+
+    def __init__(self, conexion):
+        self.conexion = conexion
+        self.dialecto = conexion.dialect.name
+        self.filas = {tabla: [] for tabla in COLUMNAS}
+        self.totales = {tabla: 0 for tabla in COLUMNAS}
+        if self.dialecto == "sqlite":
+            self.conexion.exec_driver_sql("PRAGMA synchronous=OFF")
+
+    def agregar(self, tabla, fila):
+        filas = self.filas[tabla]
+        filas.append(fila)
+        if len(filas) >= LOTE:
+            self.vaciar()
+
+    def _insertar(self, tabla, filas):
+        columnas = COLUMNAS[tabla]
+        if self.dialecto == "postgresql":
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(filas)
+            buffer.seek(0)
+            with self.conexion.connection.dbapi_connection.cursor() as cursor:
+                cursor.copy_expert(f"COPY {tabla} ({', '.join(columnas)}) FROM STDIN WITH (FORMAT csv)", buffer)
+            return
+
+        marca = "?" if self.conexion.dialect.paramstyle == "qmark" else "%s"
+        self.conexion.exec_driver_sql(
+            f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES ({', '.join([marca] * len(columnas))})",
+            filas
+        )
+
+    def actualizar_stock(self, stocks):
+        marca = "?" if self.conexion.dialect.paramstyle == "qmark" else "%s"
+        self.conexion.exec_driver_sql(f"UPDATE producto SET stock = {marca} WHERE id_producto = {marca}", stocks)
+        self.conexion.commit()
+
+    def vaciar(self):
+        # Primero los padres: ventas antes que sus detalles
+        for tabla in ('producto', 'venta', 'detalle_venta', 'movimiento_inventario'):
+            filas = self.filas[tabla]
+            if filas:
+                self._insertar(tabla, filas)
+                self.totales[tabla] += len(filas)
+                self.filas[tabla] = []
+        self.conexion.commit()
+
+def _dias(desde, hasta):
+    dia = desde
+    while dia <= hasta:
+        yield dia
+        dia += timedelta(days=1)
+
+def _siguiente_id(conexion, columna):
+    return (conexion.execute(select(func.max(columna))).scalar() or 0) + 1
+
+def _generar_empresa(cargador, azar, empresa, opciones, ids):
+    """Catálogo, ventas con sus detalles y movimientos de una empresa"""
+    desde, hasta = opciones['desde'], opciones['hasta']
+    id_empresa, nit = empresa['id_empresa'], empresa['nit']
+
+    # Catálogo con popularidad Zipf: el producto de rango r pesa 1 / r^sesgo
+    productos = []
+    for i in range(opciones['productos']):
+        productos.append({
+            'id_producto': f"{nit}-{i:06d}",
+            'nombre': f"{azar.choice(CATEGORIAS)} {i}",
+            'precio': max(100, int(round(azar.lognormvariate(9.6, 0.9), -2))),
+        })
+    for indice, producto in enumerate(productos):
+        cargador.agregar('producto', (
+            producto['id_producto'], producto['nombre'], f"Producto sintético {indice}",
+            producto['precio'], 0, id_empresa
+        ))
+    rangos = list(range(1, len(productos) + 1))
+    azar.shuffle(rangos)
+    popularidad = _acumulados(1 / rango ** opciones['sesgo'] for rango in rangos)
+
+    horas = list(PESO_HORA)
+    pesos_horas = _acumulados(PESO_HORA.values())
+    pesos_lineas = _acumulados(PESO_LINEAS)
+    pesos_metodos = _acumulados(PESOS_METODOS)
+    cajeros = empresa['usuarios']
+    vendidos = [0] * len(productos)
+
+    tamano = azar.lognormvariate(0, 0.6)
+    total_dias = (hasta - desde).days + 1
+    for numero_dia, dia in enumerate(_dias(desde, hasta)):
+        # Crecimiento suave de 0.8 a 1.0 a lo largo del periodo
+        tendencia = 0.8 + 0.2 * numero_dia / max(total_dias - 1, 1)
+        media = opciones['ventas_dia'] * tamano * tendencia * FACTOR_DIA_SEMANA[dia.weekday()] * FACTOR_MES.get(dia.month, 1.0)
+        cantidad_ventas = max(0, int(round(media * azar.uniform(0.8, 1.2))))
+
+        segundos = sorted(
+            horas[_elegir(azar, pesos_horas)] * 3600 + azar.randrange(3600)
+            for _ in range(cantidad_ventas)
+        )
+        inicio_dia = datetime(dia.year, dia.month, dia.day)
+        for segundo in segundos:
+            id_venta = ids['venta']
+            ids['venta'] += 1
+            fecha = (inicio_dia + timedelta(seconds=segundo)).strftime("%Y-%m-%d %H:%M:%S")
+            id_usuario = cajeros[azar.randrange(len(cajeros))]
+
+            cantidad_lineas = min(_elegir(azar, pesos_lineas) + 1, len(productos))
+            elegidos = set()
+            while len(elegidos) < cantidad_lineas:
+                elegidos.add(_elegir(azar, popularidad))
+
+            lineas = [(indice, 1 if azar.random() < 0.7 else azar.randint(2, 6)) for indice in sorted(elegidos)]
+            subtotal = sum(productos[indice]['precio'] * unidades for indice, unidades in lineas)
+            # La venta antes que sus detalles, por si el lote se vacía en medio
+            cargador.agregar('venta', (
+                id_venta, fecha, METODOS_PAGO[_elegir(azar, pesos_metodos)], subtotal,
+                id_usuario, id_empresa, sum(unidades for _, unidades in lineas), subtotal
+            ))
+
+            for indice, unidades in lineas:
+                producto = productos[indice]
+                importe = producto['precio'] * unidades
+                vendidos[indice] += unidades
+                cargador.agregar('detalle_venta', (
+                    f"DET_{id_venta}_{producto['id_producto']}", id_venta, producto['id_producto'],
+                    unidades, producto['precio'], importe
+                ))
+                cargador.agregar('movimiento_inventario', (
+                    f"VTA_{id_venta}_{producto['id_producto']}", "SALIDA", fecha,
+                    unidades, producto['id_producto'], id_usuario
+                ))
+
+    # Stock inicial: lo vendido más un sobrante, para que el libro cuadre
+    # con producto.stock (`flask inventario conciliar`)
+    apertura = datetime(desde.year, desde.month, desde.day, 6).strftime("%Y-%m-%d %H:%M:%S")
+    stocks = []
+    for indice, producto in enumerate(productos):
+        sobrante = azar.randint(0, 200)
+        stocks.append((sobrante, producto['id_producto']))
+        cargador.agregar('movimiento_inventario', (
+            f"INI_{producto['id_producto']}", "ENTRADA", apertura,
+            vendidos[indice] + sobrante, producto['id_producto'], cajeros[0]
+        ))
+    cargador.vaciar()
+    cargador.actualizar_stock(stocks)
+
+def generar_datos_sinteticos(empresas, usuarios=5, productos=200, meses=6, ventas_dia=80,
+                             sesgo=1.1, semilla=1, hasta=None, contrasena="clave123", progreso=None):
+    """
+    Generar empresas con usuarios, catálogo y meses de ventas y movimientos
+    hasta `hasta` (hoy por defecto). Devuelve (resumen, error)
+    """
+    try:
+        hasta = hasta or date.today()
+        desde = hasta - timedelta(days=int(meses * 30.44) - 1)
+        azar = random.Random(semilla)
+
+        nits = [nit_sintetico(semilla, n) for n in range(empresas)]
+        if Empresa.query.filter(Empresa.nit.in_(nits[:1000])).first():
+            return None, f"Ya hay empresas generadas con la semilla {semilla}"
+
+        for id_rol, nombre in ROLES:
+            if not db.session.get(Rol, id_rol):
+                db.session.add(Rol(id_rol=id_rol, nombre_rol=nombre))
+        db.session.commit()
+
+        # PostgreSQL: las filas de movimientos van a sus particiones mensuales
+        from app.controllers.inventario_controller import asegurar_particiones
+        _, error = asegurar_particiones(meses_adelante=1, desde=desde)
+        if error:
+            return None, error
+
+        hash_comun = generar_hash(contrasena)
+        inicio = time.perf_counter()
+        with db.engine.connect() as conexion:
+            ids = {
+                'empresa': _siguiente_id(conexion, Empresa.id_empresa),
+                'usuario': _siguiente_id(conexion, Usuario.id_usuario),
+                'venta': _siguiente_id(conexion, Venta.id_venta),
+            }
+            cargador = _Cargador(conexion)
+            opciones = {'desde': desde, 'hasta': hasta, 'productos': productos, 'ventas_dia': ventas_dia, 'sesgo': sesgo}
+
+            for n, nit in enumerate(nits):
+                id_empresa = ids['empresa']
+                ids['empresa'] += 1
+                conexion.execute(Empresa.__table__.insert(), {
+                    'id_empresa': id_empresa, 'nit': nit, 'nombre': f"Empresa sintética {n}",
+                    'correo_electronico': f"empresa{n}@sintetica.co", 'telefono_contacto': f"300{n:07d}"
+                })
+                filas_usuarios = [
+                    {'id_usuario': ids['usuario'] + i, 'nom_usuario': "admin" if i == 0 else f"cajero{i}",
+                     'contrasena': hash_comun, 'rol': "1" if i == 0 else "2", 'id_empresa': id_empresa}
+                    for i in range(max(usuarios, 1))
+                ]
+                ids['usuario'] += len(filas_usuarios)
+                conexion.execute(Usuario.__table__.insert(), filas_usuarios)
+
+                empresa = {'id_empresa': id_empresa, 'nit': nit, 'usuarios': [u['id_usuario'] for u in filas_usuarios]}
+                _generar_empresa(cargador, azar, empresa, opciones, ids)
+                if progreso:
+                    progreso(n + 1, empresas, cargador.totales, time.perf_counter() - inicio)
+
+            # Con los id explícitos las secuencias no avanzaron
+            if conexion.dialect.name == "postgresql":
+                for tabla, columna in (('empresa', 'id_empresa'), ('usuario', 'id_usuario'), ('venta', 'id_venta')):
+                    conexion.execute(text(
+                        f"SELECT setval(pg_get_serial_sequence('{tabla}', '{columna}'), (SELECT max({columna}) FROM {tabla}))"
+                    ))
+                conexion.commit()
+
+        return {
+            'empresas': empresas,
+            'usuarios': empresas * max(usuarios, 1),
+            'productos': cargador.totales['producto'],
+            'ventas': cargador.totales['venta'],
+            'detalles': cargador.totales['detalle_venta'],
+            'movimientos': cargador.totales['movimiento_inventario'],
+            'desde': desde.isoformat(),
+            'hasta': hasta.isoformat(),
+            'nits': nits,
+            'segundos': round(time.perf_counter() - inicio, 2),
+        }, None
+
+    except Exception as e:
+        db.session.rollback()
+        return None, f"Error al generar datos sintéticos: {str(e)}"
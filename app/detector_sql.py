@@ -0,0 +1,201 @@
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# ----------------------------------------------------------------------
+# Detector de N+1 y consultas lentas (desarrollo y pruebas)
+#
+# Con DETECTOR_SQL activo, cada request cuenta sus sentencias por forma
+# (el SQL con los parámetros y las listas IN colapsados). Al terminar avisa
+# en el log de la app:
+#   - N+1: la misma forma DETECTOR_SQL_REPETICIONES veces o más, p. ej. una
+#     relación lazy recorrida dentro de un {% for %};
+#   - lentas: sentencias de más de DETECTOR_SQL_LENTA_MS;
+#   - presupuesto: más sentencias que las permitidas al endpoint.
+# Cada aviso indica la línea de plantilla y/o de código de app/ que lanzó
+# la consulta.
+#
+# Presupuesto por endpoint: @presupuesto_sql(n) en la vista, o
+# DETECTOR_SQL_PRESUPUESTOS = {'venta.historial': n}. Con
+# DETECTOR_SQL_ESTRICTO el request que se pasa falla con
+# PresupuestoSQLExcedido (en pruebas, el test falla). Fuera de un request:
+# `with limite_consultas(n): ...`.
+# ----------------------------------------------------------------------
+_PROPIO = os.path.abspath(__file__)
+_RAIZ_APP = os.path.dirname(_PROPIO) + os.sep
+_RAIZ = os.path.dirname(os.path.dirname(_PROPIO)) + os.sep
+# Envolturas de la app que no son el origen de una consulta
+_INFRAESTRUCTURA = {
+    os.path.join(_RAIZ_APP, nombre)
+    for nombre in ("detector_sql.py", "trazas.py", "cache.py", "replica.py", "metricas.py", "perfilador.py")
+}
+
+_limites = threading.local()
+
+class PresupuestoSQLExcedido(AssertionError):
+    """Un request o bloque ejecutó más sentencias SQL que su presupuesto"""
+
+def presupuesto_sql(maximo):
+    """
+    Máximo de sentencias SQL que puede ejecutar la vista (va justo debajo
+    de @bp.route)
+    """
+    def decorador(funcion):
+        funcion.presupuesto_sql = maximo
+        return funcion
+    return decorador
+
+# ----------------------------------------------------------------------
+# Forma y origen de cada sentencia
+# ----------------------------------------------------------------------
+_LISTA_PARAMETROS = re.compile(r"\((?:\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*,)+\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*\)")
+_LITERALES = re.compile(r"\b\d+\b|'(?:[^']|'')*'")
+_ESPACIOS = re.compile(r"\s+")
+
+def forma_sentencia(sentencia):
+    """SQL sin literales ni listas de parámetros, para agrupar repeticiones"""
+    forma = _LISTA_PARAMETROS.sub("(?)", sentencia)
+    forma = _LITERALES.sub("?", forma)
+    return _ESPACIOS.sub(" ", forma).strip()
+
+def _origen():
+    """Línea de plantilla y primera línea de código de app/ en la pila actual"""
+    plantilla = codigo = None
+    marco = sys._getframe(2)
+    while marco is not None and (plantilla is None or codigo is None):
+        archivo = marco.f_code.co_filename
+        template = marco.f_globals.get("__jinja_template__")
+        if template is not None:
+            if plantilla is None:
+                plantilla = f"{template.name}:{template.get_corresponding_lineno(marco.f_lineno)}"
+        elif codigo is None and archivo.startswith(_RAIZ_APP) and archivo not in _INFRAESTRUCTURA:
+            codigo = f"{archivo[len(_RAIZ):]}:{marco.f_lineno} ({marco.f_code.co_name})"
+        marco = marco.f_back
+    return " <- ".join(parte for parte in (plantilla, codigo) if parte) or "desconocido"
+
+# ----------------------------------------------------------------------
+# Captura
+# ----------------------------------------------------------------------
+def _activo():
+    return has_request_context() and current_app.config.get('DETECTOR_SQL') and '_detector_sql' in g
+
+def _antes_request():
+    if current_app.config.get('DETECTOR_SQL'):
+        g._detector_sql = {'total': 0, 'formas': {}, 'lentas': []}
+
+def _antes_sql(conexion, cursor, sentencia, parametros, contexto, varias):
+    if _activo() or getattr(_limites, 'activos', None):
+        contexto._detector_inicio = time.perf_counter()
+
+def _despues_sql(conexion, cursor, sentencia, parametros, contexto, varias):
+    inicio = getattr(contexto, '_detector_inicio', None)
+    if inicio is None:
+        return
+    duracion = time.perf_counter() - inicio
+
+    for bloque in getattr(_limites, 'activos', None) or ():
+        bloque.registrar(sentencia)
+
+    if not _activo():
+        return
+    datos = g._detector_sql
+    datos['total'] += 1
+    forma = forma_sentencia(sentencia)
+    entrada = datos['formas'].get(forma)
+    if entrada is None:
+        # El origen de la primera ocurrencia es el mismo del resto en un N+1
+        datos['formas'][forma] = [1, _origen()]
+    else:
+        entrada[0] += 1
+
+    if duracion * 1000 >= current_app.config['DETECTOR_SQL_LENTA_MS']:
+        datos['lentas'].append((duracion, sentencia, _origen()))
+
+def _presupuesto_endpoint():
+    vista = current_app.view_functions.get(request.endpoint)
+    presupuesto = getattr(vista, 'presupuesto_sql', None)
+    if presupuesto is None:
+        presupuesto = current_app.config['DETECTOR_SQL_PRESUPUESTOS'].get(request.endpoint)
+    return presupuesto
+
+def _despues_request(respuesta):
+    datos = g.pop('_detector_sql', None)
+    if datos is None:
+        return respuesta
+
+    config = current_app.config
+    log = current_app.logger
+    destino = f"{request.method} {request.path} ({request.endpoint})"
+    respuesta.headers['X-SQL-Consultas'] = str(datos['total'])
+
+    for forma, (cantidad, origen) in datos['formas'].items():
+        if cantidad >= config['DETECTOR_SQL_REPETICIONES']:
+            log.warning("N+1 en %s: %d veces desde %s\n    %s", destino, cantidad, origen, forma[:300])
+
+    for duracion, sentencia, origen in datos['lentas']:
+        log.warning("Consulta lenta en %s: %.1f ms desde %s\n    %s", destino, duracion * 1000, origen, sentencia[:300])
+
+    presupuesto = _presupuesto_endpoint()
+    if presupuesto is not None and datos['total'] > presupuesto:
+        mensaje = f"{destino} ejecutó {datos['total']} sentencias SQL (presupuesto {presupuesto})"
+        log.warning(mensaje)
+        if config['DETECTOR_SQL_ESTRICTO']:
+            raise PresupuestoSQLExcedido(mensaje)
+
+    return respuesta
+
+# ----------------------------------------------------------------------
+# Presupuesto fuera de un request (scripts y pruebas)
+# ----------------------------------------------------------------------
+class _Bloque:
+
+    def __init__(self, maximo):
+        self.maximo = maximo
+        self.sentencias = []
+
+    def registrar(self, sentencia):
+        self.sentencias.append(sentencia)
+
+@contextmanager
+def limite_consultas(maximo):
+    """
+    Falla con PresupuestoSQLExcedido si el bloque ejecuta más de `maximo`
+    sentencias en este hilo (incluye las de requests del cliente de pruebas)
+    """
+    bloque = _Bloque(maximo)
+    activos = getattr(_limites, 'activos', None)
+    if activos is None:
+        activos = _limites.activos = []
+    activos.append(bloque)
+    try:
+        yield bloque
+    finally:
+        activos.remove(bloque)
+    if len(bloque.sentencias) > maximo:
+        detalle = "\n".join(f"    {s[:200]}" for s in bloque.sentencias)
+        raise PresupuestoSQLExcedido(f"{len(bloque.sentencias)} sentencias SQL (presupuesto {maximo}):\n{detalle}")
+
+def iniciar_detector_sql(app):
+    """
+    Configuración del detector (DETECTOR_SQL=1, activo por defecto con
+    FLASK_DEBUG) y eventos de SQL de todos los engines
+    """
+    por_defecto = "1" if os.getenv("FLASK_DEBUG") == "1" else "0"
+    app.config.setdefault('DETECTOR_SQL', os.getenv("DETECTOR_SQL", por_defecto) != "0")
+    app.config.setdefault('DETECTOR_SQL_REPETICIONES', int(os.getenv("DETECTOR_SQL_REPETICIONES", 5)))
+    app.config.setdefault('DETECTOR_SQL_LENTA_MS', float(os.getenv("DETECTOR_SQL_LENTA_MS", 100)))
+    app.config.setdefault('DETECTOR_SQL_ESTRICTO', os.getenv("DETECTOR_SQL_ESTRICTO", "0") != "0")
+    app.config.setdefault('DETECTOR_SQL_PRESUPUESTOS', {})
+
+    app.before_request(_antes_request)
+    app.after_request(_despues_request)
+
+    if not event.contains(Engine, "before_cursor_execute", _antes_sql):
+        event.listen(Engine, "before_cursor_execute", _antes_sql)
+        event.listen(Engine, "after_cursor_execute", _despues_sql)
@@ -0,0 +1,289 @@
+import json
+import os
+import select
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from uuid import uuid4
+from flask import has_request_context, session as sesion_flask
+from sqlalchemy import event, inspect, select as sql_select, insert, delete, func, or_
+from sqlalchemy.orm import Session
+from app.models import db, EventoInvalidacion
+
+# ----------------------------------------------------------------------
+# Bus de invalidación de cachés entre procesos
+#
+# Cada commit publica eventos (tabla, id_empresa, llave, columnas) de las
+# filas que escribió. Los procesos que tienen cachés en memoria se suscriben
+# por tabla y descartan solo las entradas afectadas.
+#
+# Entrega: en PostgreSQL con NOTIFY dentro de la misma transacción (solo
+# llega si el commit se confirma) y un hilo por proceso que hace LISTEN. En
+# otros motores los eventos se escriben en la tabla evento_invalidacion y
+# cada proceso la consulta al inicio de los requests.
+# ----------------------------------------------------------------------
+CANAL = "invalidacion"
+ORIGEN = uuid4().hex  # Identifica al proceso; no se procesa el eco de sus propios eventos
+MAX_EVENTOS_NOTIFY = 40  # NOTIFY admite hasta 8000 bytes por mensaje
+
+_suscriptores = defaultdict(list)
+_estado = {'pid': None, 'ultimo_evento': None, 'ultima_consulta': 0.0, 'ultima_limpieza': 0.0, 'notify': True}
+_vistos = {}  # id_evento -> fecha_hora de los eventos ya procesados dentro del margen
+_candado = threading.Lock()
+
+def suscribir(tabla, funcion):
+    """
+    Registrar funcion(id_empresa, llave, columnas) para los cambios de una
+    tabla. id_empresa o llave en None significan "todas".
+    """
+    _suscriptores[tabla].append(funcion)
+
+def _despachar(eventos):
+    for tabla, id_empresa, llave, columnas in eventos:
+        for funcion in _suscriptores.get(tabla, ()):
+            try:
+                funcion(id_empresa, llave, columnas)
+            except Exception as e:
+                print(f"Error al invalidar caché de {tabla}: {str(e)}")
+
+def _usa_notify(engine):
+    """NOTIFY/LISTEN solo con PostgreSQL y conexión directa (PgBouncer en modo transacción pierde el LISTEN)"""
+    return _estado['notify'] and engine.dialect.name == 'postgresql'
+
+def _invalidar_todo():
+    """Si se pudieron perder eventos (reconexión), se vacían todas las cachés"""
+    _despachar([(tabla, None, None, None) for tabla in list(_suscriptores)])
+
+# ----------------------------------------------------------------------
+# Captura de cambios en la sesión
+# ----------------------------------------------------------------------
+def _pendientes(sesion):
+    return sesion.info.setdefault('eventos_invalidacion', set())
+
+def _empresa_actual():
+    """Empresa del usuario que hace el request (las rutas verifican que solo escriba en la suya)"""
+    if has_request_context():
+        return sesion_flask.get('empresa_id')
+    return None
+
+def _evento_objeto(obj, columnas=None):
+    tabla = obj.__table__.name
+    if tabla not in _suscriptores:
+        return None
+    llave = inspect(obj).identity
+    llave = str(llave[0]) if llave and len(llave) == 1 else None
+    return (tabla, getattr(obj, 'id_empresa', None), llave, columnas)
+
+def _despues_flush(sesion, contexto):
+    pendientes = _pendientes(sesion)
+
+    for obj in list(sesion.new) + list(sesion.deleted):
+        evento = _evento_objeto(obj)
+        if evento:
+            pendientes.add(evento)
+
+    for obj in sesion.dirty:
+        if not sesion.is_modified(obj, include_collections=False):
+            continue
+        estado = inspect(obj)
+        columnas = tuple(sorted(
+            a.key for a in estado.mapper.column_attrs
+            if estado.attrs[a.key].history.has_changes()
+        ))
+        evento = _evento_objeto(obj, columnas or None)
+        if evento:
+            pendientes.add(evento)
+
+def _sentencia_orm(estado):
+    """UPDATE/DELETE/INSERT masivos: no pasan por el flush"""
+    if not (estado.is_update or estado.is_delete or estado.is_insert) or estado.bind_mapper is None:
+        return
+
+    tabla = estado.bind_mapper.local_table.name
+    if tabla not in _suscriptores:
+        return
+
+    columnas = None
+    if estado.is_update:
+        valores = getattr(estado.statement, '_values', None) or {}
+        nombres = [getattr(c, 'key', str(c)) for c in valores]
+        columnas = tuple(sorted(nombres)) or None
+
+    _pendientes(estado.session).add((tabla, _empresa_actual(), None, columnas))
+
+# ----------------------------------------------------------------------
+# Publicación
+# ----------------------------------------------------------------------
+def _antes_commit(sesion):
+    # Los cambios sin enviar todavía no pasaron por after_flush
+    sesion.flush()
+
+    pendientes = sesion.info.get('eventos_invalidacion')
+    if not pendientes:
+        return
+
+    eventos = list(pendientes)
+    if _usa_notify(sesion.get_bind()):
+        for inicio in range(0, len(eventos), MAX_EVENTOS_NOTIFY):
+            sesion.execute(
+                sql_select(func.pg_notify(CANAL, json.dumps({
+                    'origen': ORIGEN,
+                    'eventos': eventos[inicio:inicio + MAX_EVENTOS_NOTIFY]
+                })))
+            )
+    else:
+        ahora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        sesion.execute(insert(EventoInvalidacion), [
+            {
+                'tabla': tabla,
+                'id_empresa': id_empresa,
+                'llave': llave,
+                'columnas': ",".join(columnas) if columnas else None,
+                'origen': ORIGEN,
+                'fecha_hora': ahora
+            }
+            for tabla, id_empresa, llave, columnas in eventos
+        ])
+
+def _despues_commit(sesion):
+    pendientes = sesion.info.pop('eventos_invalidacion', None)
+    if pendientes:
+        _despachar(pendientes)
+
+def _despues_rollback(sesion):
+    sesion.info.pop('eventos_invalidacion', None)
+
+# ----------------------------------------------------------------------
+# Recepción
+# ----------------------------------------------------------------------
+def _escuchar_postgres(engine):
+    """Hilo del proceso: LISTEN sobre una conexión propia fuera del pool"""
+    while True:
+        try:
+            conexion = engine.raw_connection()
+            conexion.detach()
+            pg = conexion.driver_connection
+            pg.autocommit = True
+            pg.cursor().execute(f"LISTEN {CANAL}")
+
+            # Pudo haber commits mientras no se escuchaba
+            _invalidar_todo()
+
+            while True:
+                if select.select([pg], [], [], 30) == ([], [], []):
+                    continue
+                pg.poll()
+                while pg.notifies:
+                    aviso = pg.notifies.pop(0)
+                    datos = json.loads(aviso.payload)
+                    if datos.get('origen') != ORIGEN:
+                        _despachar([tuple(e[:3]) + (tuple(e[3]) if e[3] else None,) for e in datos['eventos']])
+        except Exception as e:
+            print(f"Error en el canal de invalidación: {str(e)}")
+            time.sleep(5)
+
+def _consultar_tabla(app):
+    """
+    Leer los eventos nuevos de la tabla (como mucho cada INVALIDACION_POLL_SEGUNDOS).
+
+    id_evento se asigna al insertar pero la fila se ve al confirmar: con
+    transacciones concurrentes un id menor puede aparecer después de uno
+    mayor ya leído. Por eso además de los id nuevos se relee la ventana de
+    los últimos INVALIDACION_MARGEN_SEGUNDOS y se descartan los ya vistos.
+    """
+    ahora = time.monotonic()
+    if ahora - _estado['ultima_consulta'] < app.config['INVALIDACION_POLL_SEGUNDOS']:
+        return
+    _estado['ultima_consulta'] = ahora
+
+    try:
+        if _estado['ultimo_evento'] is None:
+            # Proceso nuevo: sus cachés están vacías, no hay nada que reprocesar
+            _estado['ultimo_evento'] = db.session.execute(
+                sql_select(func.coalesce(func.max(EventoInvalidacion.id_evento), 0))
+            ).scalar()
+            return
+
+        margen = (datetime.now() - timedelta(seconds=app.config['INVALIDACION_MARGEN_SEGUNDOS'])).strftime("%Y-%m-%d %H:%M:%S")
+        filas = db.session.execute(
+            sql_select(
+                EventoInvalidacion.id_evento,
+                EventoInvalidacion.tabla,
+                EventoInvalidacion.id_empresa,
+                EventoInvalidacion.llave,
+                EventoInvalidacion.columnas,
+                EventoInvalidacion.origen,
+                EventoInvalidacion.fecha_hora
+            )
+            .where(or_(
+                EventoInvalidacion.id_evento > _estado['ultimo_evento'],
+                EventoInvalidacion.fecha_hora >= margen
+            ))
+            .order_by(EventoInvalidacion.id_evento)
+        ).all()
+
+        nuevas = [f for f in filas if f.id_evento not in _vistos]
+        for f in nuevas:
+            _vistos[f.id_evento] = f.fecha_hora
+        for id_evento in [i for i, fecha in _vistos.items() if fecha < margen]:
+            del _vistos[id_evento]
+
+        if nuevas:
+            _estado['ultimo_evento'] = max(_estado['ultimo_evento'], nuevas[-1].id_evento)
+            _despachar([
+                (f.tabla, f.id_empresa, f.llave, tuple(f.columnas.split(",")) if f.columnas else None)
+                for f in nuevas if f.origen != ORIGEN
+            ])
+
+        retencion = app.config['INVALIDACION_RETENCION_SEGUNDOS']
+        if ahora - _estado['ultima_limpieza'] > retencion:
+            _estado['ultima_limpieza'] = ahora
+            limite = (datetime.now() - timedelta(seconds=retencion)).strftime("%Y-%m-%d %H:%M:%S")
+            db.session.execute(delete(EventoInvalidacion).where(EventoInvalidacion.fecha_hora < limite))
+            db.session.commit()
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error al leer eventos de invalidación: {str(e)}")
+
+def _recibir_eventos(app):
+    def recibir():
+        if not _usa_notify(db.engine):
+            _consultar_tabla(app)
+            return
+
+        # Con gunicorn el hilo se arranca en cada worker, después del fork
+        if _estado['pid'] != os.getpid():
+            with _candado:
+                if _estado['pid'] != os.getpid():
+                    _estado['pid'] = os.getpid()
+                    threading.Thread(
+                        target=_escuchar_postgres,
+                        args=(db.engine,),
+                        name="escucha-invalidacion",
+                        daemon=True
+                    ).start()
+    return recibir
+
+def iniciar_invalidacion(app):
+    """
+    Conectar el bus a la sesión de SQLAlchemy y a los requests de la app
+    """
+    app.config.setdefault('INVALIDACION_POLL_SEGUNDOS', float(os.getenv("INVALIDACION_POLL_SEGUNDOS", 1)))
+    app.config.setdefault('INVALIDACION_RETENCION_SEGUNDOS', int(os.getenv("INVALIDACION_RETENCION_SEGUNDOS", 600)))
+    # Cuánto puede tardar en verse un evento ya numerado (commit lento,
+    # relojes de distintos servidores); debe ser menor que la retención
+    app.config.setdefault('INVALIDACION_MARGEN_SEGUNDOS', int(os.getenv("INVALIDACION_MARGEN_SEGUNDOS", 60)))
+    # Detrás de PgBouncer (DB_POOL_PERFIL=pgbouncer) los eventos van por la tabla
+    app.config.setdefault('INVALIDACION_NOTIFY', os.getenv("DB_POOL_PERFIL", "directo") != "pgbouncer")
+    _estado['notify'] = app.config['INVALIDACION_NOTIFY']
+
+    if not event.contains(Session, "after_flush", _despues_flush):
+        event.listen(Session, "after_flush", _despues_flush)
+        event.listen(Session, "do_orm_execute", _sentencia_orm)
+        event.listen(Session, "before_commit", _antes_commit)
+        event.listen(Session, "after_commit", _despues_commit)
+        event.listen(Session, "after_rollback", _despues_rollback)
+
+    app.before_request(_recibir_eventos(app))
@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+from flask import current_app, request
+from sqlalchemy.exc import IntegrityError
+from app.models import db, LimiteIntento
+
+# ----------------------------------------------------------------------
+# Límite de intentos de login (token bucket)
+#
+# Cada usuario y cada IP tiene una cubeta de N intentos que se recarga a
+# ritmo constante. El intento se descuenta antes de buscar el usuario y de
+# calcular bcrypt, así que una inundación de intentos se corta sin gastar
+# CPU ni consultas.
+#
+# Backend "memoria": un diccionario por proceso (con varios workers el
+# límite real es N por worker). Backend "tabla": limite_intento en la BD,
+# compartido por todos los procesos.
+# ----------------------------------------------------------------------
+_cubetas = {}  # llave -> (tokens, actualizado)
+_candado = threading.Lock()
+
+def iniciar_limites(app):
+    """
+    Capacidad y recarga de las cubetas de usuario e IP
+    """
+    app.config.setdefault('LOGIN_LIMITE_BACKEND', os.getenv("LOGIN_LIMITE_BACKEND", "memoria"))
+    app.config.setdefault('LOGIN_INTENTOS_USUARIO', int(os.getenv("LOGIN_INTENTOS_USUARIO", 5)))
+    app.config.setdefault('LOGIN_RECARGA_USUARIO', float(os.getenv("LOGIN_RECARGA_USUARIO", 12)))
+    app.config.setdefault('LOGIN_INTENTOS_IP', int(os.getenv("LOGIN_INTENTOS_IP", 30)))
+    app.config.setdefault('LOGIN_RECARGA_IP', float(os.getenv("LOGIN_RECARGA_IP", 2)))
+    # Proxies delante de la app (Render agrega uno); 0 = usar la IP de la conexión
+    app.config.setdefault('LOGIN_PROXIES', int(os.getenv("LOGIN_PROXIES", 0)))
+    app.config.setdefault('LOGIN_LIMITE_MAX_LLAVES', int(os.getenv("LOGIN_LIMITE_MAX_LLAVES", 50000)))
+
+def _recarga_completa():
+    """Segundos que tarda en llenarse la cubeta más lenta"""
+    config = current_app.config
+    return max(
+        config['LOGIN_INTENTOS_USUARIO'] * config['LOGIN_RECARGA_USUARIO'],
+        config['LOGIN_INTENTOS_IP'] * config['LOGIN_RECARGA_IP']
+    )
+
+def _recargar(tokens, actualizado, ahora, capacidad, segundos_por_token):
+    return min(capacidad, tokens + (ahora - actualizado) / segundos_por_token)
+
+def _consumir_memoria(llave, capacidad, segundos_por_token, ahora):
+    with _candado:
+        tokens, actualizado = _cubetas.get(llave, (capacidad, ahora))
+        tokens = _recargar(tokens, actualizado, ahora, capacidad, segundos_por_token)
+
+        if tokens < 1:
+            _cubetas[llave] = (tokens, ahora)
+            return (1 - tokens) * segundos_por_token
+        _cubetas[llave] = (tokens - 1, ahora)
+
+        maximo = current_app.config['LOGIN_LIMITE_MAX_LLAVES']
+        if len(_cubetas) > maximo:
+            # Las cubetas ya recargadas equivalen a no tener entrada; si aún
+            # sobran, se descartan las más antiguas
+            vencidas = ahora - _recarga_completa()
+            for l in [l for l, (_, a) in _cubetas.items() if a < vencidas]:
+                del _cubetas[l]
+            if len(_cubetas) > maximo:
+                antiguas = sorted(_cubetas, key=lambda l: _cubetas[l][1])
+                for l in antiguas[:len(_cubetas) - maximo * 9 // 10]:
+                    del _cubetas[l]
+        return 0
+
+def _consumir_tabla(llave, capacidad, segundos_por_token, ahora):
+    for _ in range(2):
+        try:
+            cubeta = db.session.get(LimiteIntento, llave, with_for_update=True)
+            if cubeta is None:
+                db.session.add(LimiteIntento(llave=llave, tokens=capacidad - 1, actualizado=ahora))
+                db.session.commit()
+                return 0
+
+            tokens = _recargar(cubeta.tokens, cubeta.actualizado, ahora, capacidad, segundos_por_token)
+            espera = 0
+            if tokens < 1:
+                espera = (1 - tokens) * segundos_por_token
+            else:
+                tokens -= 1
+            cubeta.tokens = tokens
+            cubeta.actualizado = ahora
+            db.session.commit()
+            return espera
+
+        except IntegrityError:
+            # Otro proceso creó la cubeta al mismo tiempo
+            db.session.rollback()
+    return 0
+
+def ip_cliente():
+    proxies = current_app.config['LOGIN_PROXIES']
+    if proxies:
+        reenviadas = [ip.strip() for ip in request.headers.get("X-Forwarded-For", "").split(",") if ip.strip()]
+        if len(reenviadas) >= proxies:
+            return reenviadas[-proxies]
+    return request.remote_addr or "desconocida"
+
+def consumir_intento_login(nit, nom_usuario):
+    """
+    Descontar un intento de la cubeta del usuario (en su empresa) y de la
+    IP del request.
+    Retorna (permitido, segundos_de_espera).
+    """
+    config = current_app.config
+    consumir = _consumir_tabla if config['LOGIN_LIMITE_BACKEND'] == "tabla" else _consumir_memoria
+    ahora = time.time()
+
+    try:
+        # Primero la IP: una IP bloqueada no gasta la cubeta del usuario
+        espera = consumir(f"ip:{ip_cliente()}", config['LOGIN_INTENTOS_IP'], config['LOGIN_RECARGA_IP'], ahora)
+        if not espera:
+            usuario = f"{(nit or '').strip()[:20]}:{(nom_usuario or '').strip().lower()[:150]}"
+            espera = consumir(f"usuario:{usuario}", config['LOGIN_INTENTOS_USUARIO'], config['LOGIN_RECARGA_USUARIO'], ahora)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error al verificar límite de intentos: {str(e)}")
+        return True, 0
+
+    return not espera, int(espera + 0.999)
+
+def purgar_limites():
+    """
+    Borrar las cubetas de la tabla que ya se recargaron por completo
+    """
+    limite = time.time() - _recarga_completa()
+    try:
+        borradas = LimiteIntento.query.filter(LimiteIntento.actualizado < limite).delete(synchronize_session=False)
+        db.session.commit()
+        return borradas, None
+    except Exception as e:
+        db.session.rollback()
+        return 0, f"Error al purgar límites de intentos: {str(e)}"
@@ -0,0 +1,274 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from flask import g, request, has_request_context, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.conexiones import metricas_pool
+
+# ----------------------------------------------------------------------
+# Métricas por endpoint en formato Prometheus
+#
+# Cada request registra latencia, código de estado, cantidad de sentencias
+# SQL y tiempo en SQL, con etiquetas blueprint y endpoint. Los contadores
+# son por proceso; con METRICAS_DIR cada worker guarda una copia en
+# <METRICAS_DIR>/<pid>.json y /metrics suma las de todos los workers.
+#
+# Un hilo por worker reescribe su copia cada INTERVALO_VOLCADO segundos,
+# aunque no reciba requests. /metrics borra las copias de procesos que ya
+# no existen o que no se renovaron en VIGENCIA_COPIA segundos (workers
+# reciclados o caídos), para no sumar para siempre contadores muertos.
+# METRICAS_DIR debe ser local al servidor: los pid son de esta máquina.
+# ----------------------------------------------------------------------
+PREFIJO = "compuspace"
+LIMITES_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LIMITES_SQL = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+INTERVALO_VOLCADO = 2.0  # segundos entre copias al directorio compartido
+VIGENCIA_COPIA = 5 * INTERVALO_VOLCADO  # copia sin renovar: su worker ya no está
+
+_candado = threading.Lock()
+_estado = {'pid': None, 'pid_hilo': None}
+_datos = {}
+
+def _reiniciar():
+    _datos.clear()
+    _datos.update({
+        'requests': defaultdict(int),          # (blueprint, endpoint, metodo, estado) -> n
+        'latencia': {},                        # (blueprint, endpoint) -> [buckets..., suma, n]
+        'sql_por_request': {},                 # (blueprint, endpoint) -> [buckets..., suma, n]
+        'sql_segundos': defaultdict(float),    # (blueprint, endpoint) -> s
+    })
+    _estado['pid'] = os.getpid()
+
+def _observar(tabla, llave, limites, valor):
+    fila = tabla.get(llave)
+    if fila is None:
+        fila = tabla[llave] = [0] * (len(limites) + 2)
+    for i, limite in enumerate(limites):
+        if valor <= limite:
+            fila[i] += 1
+    fila[-2] += valor
+    fila[-1] += 1
+
+# ----------------------------------------------------------------------
+# Captura
+# ----------------------------------------------------------------------
+def _antes_request():
+    g._metricas_inicio = time.perf_counter()
+    g._metricas_sql = 0
+    g._metricas_sql_segundos = 0.0
+
+def _despues_request(respuesta):
+    inicio = g.pop('_metricas_inicio', None)
+    if inicio is None:
+        return respuesta
+
+    duracion = time.perf_counter() - inicio
+    endpoint = request.endpoint or "sin_ruta"
+    blueprint = request.blueprint or "app"
+    llave = (blueprint, endpoint)
+
+    with _candado:
+        if _estado['pid'] != os.getpid():
+            _reiniciar()
+        _datos['requests'][(blueprint, endpoint, request.method, str(respuesta.status_code))] += 1
+        _observar(_datos['latencia'], llave, LIMITES_LATENCIA, duracion)
+        _observar(_datos['sql_por_request'], llave, LIMITES_SQL, g.get('_metricas_sql', 0))
+        _datos['sql_segundos'][llave] += g.get('_metricas_sql_segundos', 0.0)
+
+    _iniciar_volcado(current_app.config.get('METRICAS_DIR'))
+    return respuesta
+
+def _antes_sql(conexion, cursor, sentencia, parametros, contexto, varias):
+    if has_request_context() and '_metricas_inicio' in g:
+        contexto._metricas_inicio_sql = time.perf_counter()
+
+def _despues_sql(conexion, cursor, sentencia, parametros, contexto, varias):
+    inicio = getattr(contexto, '_metricas_inicio_sql', None)
+    if inicio is not None and has_request_context():
+        g._metricas_sql = g.get('_metricas_sql', 0) + 1
+        g._metricas_sql_segundos = g.get('_metricas_sql_segundos', 0.0) + time.perf_counter() - inicio
+
+# ----------------------------------------------------------------------
+# Agregación entre workers
+# ----------------------------------------------------------------------
+def _serializar():
+    return {
+        'requests': [list(k) + [v] for k, v in _datos['requests'].items()],
+        'latencia': [list(k) + [v] for k, v in _datos['latencia'].items()],
+        'sql_por_request': [list(k) + [v] for k, v in _datos['sql_por_request'].items()],
+        'sql_segundos': [list(k) + [v] for k, v in _datos['sql_segundos'].items()],
+    }
+
+def _volcar(directorio):
+    try:
+        with _candado:
+            contenido = json.dumps(_serializar())
+        os.makedirs(directorio, exist_ok=True)
+        destino = os.path.join(directorio, f"{os.getpid()}.json")
+        temporal = f"{destino}.tmp"
+        with open(temporal, "w") as archivo:
+            archivo.write(contenido)
+        os.replace(temporal, destino)
+    except OSError as e:
+        print(f"Error al guardar métricas: {str(e)}")
+
+def _volcar_periodicamente(directorio):
+    while True:
+        _volcar(directorio)
+        time.sleep(INTERVALO_VOLCADO)
+
+def _iniciar_volcado(directorio):
+    """Arranca el hilo de copias del worker (los hilos no sobreviven al fork)"""
+    if not directorio or _estado['pid_hilo'] == os.getpid():
+        return
+    with _candado:
+        if _estado['pid_hilo'] == os.getpid():
+            return
+        _estado['pid_hilo'] = os.getpid()
+    threading.Thread(target=_volcar_periodicamente, args=(directorio,),
+                     name="metricas-volcado", daemon=True).start()
+
+def _proceso_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _copia_vencida(ruta, nombre, ahora):
+    """Copia de un worker que terminó (pid inexistente o sin renovar)"""
+    try:
+        pid = int(nombre.split(".", 1)[0])
+    except ValueError:
+        return False
+    try:
+        vieja = ahora - os.path.getmtime(ruta) > VIGENCIA_COPIA
+    except OSError:
+        return False
+    return vieja or not _proceso_vivo(pid)
+
+def _sumar(destino, origen):
+    for fila in origen['requests']:
+        destino['requests'][tuple(fila[:4])] += fila[4]
+    for nombre in ('latencia', 'sql_por_request'):
+        for fila in origen[nombre]:
+            actual = destino[nombre].setdefault(tuple(fila[:2]), [0] * len(fila[2]))
+            for i, valor in enumerate(fila[2]):
+                actual[i] += valor
+    for fila in origen['sql_segundos']:
+        destino['sql_segundos'][tuple(fila[:2])] += fila[2]
+
+def _recolectar(directorio):
+    """Suma de los workers; el proceso actual usa sus datos en memoria"""
+    total = {
+        'requests': defaultdict(int),
+        'latencia': {},
+        'sql_por_request': {},
+        'sql_segundos': defaultdict(float),
+    }
+    with _candado:
+        _sumar(total, _serializar())
+
+    if directorio and os.path.isdir(directorio):
+        propio = f"{os.getpid()}.json"
+        ahora = time.time()
+        for nombre in os.listdir(directorio):
+            if not nombre.endswith((".json", ".json.tmp")) or nombre.startswith(propio):
+                continue
+            ruta = os.path.join(directorio, nombre)
+            if _copia_vencida(ruta, nombre, ahora):
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    pass
+                continue
+            if nombre.endswith(".tmp"):
+                continue
+            try:
+                with open(ruta) as archivo:
+                    _sumar(total, json.load(archivo))
+            except (OSError, ValueError):
+                continue
+    return total
+
+# ----------------------------------------------------------------------
+# Formato de texto de Prometheus
+# ----------------------------------------------------------------------
+def _etiquetas(**valores):
+    partes = []
+    for clave, valor in valores.items():
+        valor = str(valor).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        partes.append(f'{clave}="{valor}"')
+    return "{" + ",".join(partes) + "}"
+
+def _histograma(lineas, nombre, ayuda, tabla, limites):
+    lineas.append(f"# HELP {nombre} {ayuda}")
+    lineas.append(f"# TYPE {nombre} histogram")
+    for (blueprint, endpoint), fila in sorted(tabla.items()):
+        for limite, cantidad in zip(limites, fila):
+            lineas.append(f"{nombre}_bucket{_etiquetas(blueprint=blueprint, endpoint=endpoint, le=limite)} {cantidad}")
+        lineas.append(f"{nombre}_bucket{_etiquetas(blueprint=blueprint, endpoint=endpoint, le='+Inf')} {fila[-1]}")
+        lineas.append(f"{nombre}_sum{_etiquetas(blueprint=blueprint, endpoint=endpoint)} {fila[-2]}")
+        lineas.append(f"{nombre}_count{_etiquetas(blueprint=blueprint, endpoint=endpoint)} {fila[-1]}")
+
+def exportar_metricas(directorio=None):
+    """
+    Métricas de requests, SQL y pool en formato de texto de Prometheus
+    """
+    datos = _recolectar(directorio)
+    lineas = []
+
+    nombre = f"{PREFIJO}_http_requests_total"
+    lineas.append(f"# HELP {nombre} Requests atendidos por endpoint, método y código de estado")
+    lineas.append(f"# TYPE {nombre} counter")
+    for (blueprint, endpoint, metodo, estado), cantidad in sorted(datos['requests'].items()):
+        lineas.append(f"{nombre}{_etiquetas(blueprint=blueprint, endpoint=endpoint, metodo=metodo, estado=estado)} {cantidad}")
+
+    _histograma(lineas, f"{PREFIJO}_http_request_duration_seconds",
+                "Latencia de los requests por endpoint", datos['latencia'], LIMITES_LATENCIA)
+    _histograma(lineas, f"{PREFIJO}_sql_statements_per_request",
+                "Sentencias SQL ejecutadas por request", datos['sql_por_request'], LIMITES_SQL)
+
+    nombre = f"{PREFIJO}_sql_duration_seconds_total"
+    lineas.append(f"# HELP {nombre} Tiempo total en SQL por endpoint")
+    lineas.append(f"# TYPE {nombre} counter")
+    for (blueprint, endpoint), segundos in sorted(datos['sql_segundos'].items()):
+        lineas.append(f"{nombre}{_etiquetas(blueprint=blueprint, endpoint=endpoint)} {segundos:.6f}")
+
+    # Pool: solo del worker que responde
+    pool = metricas_pool()
+    etiquetas = _etiquetas(pid=pool['pid'])
+    for clave, tipo, ayuda in (
+        ('checkouts', 'counter', 'Conexiones entregadas por el pool'),
+        ('timeouts', 'counter', 'Checkouts que vencieron esperando conexión'),
+        ('conexiones_nuevas', 'counter', 'Conexiones abiertas a la BD'),
+    ):
+        lineas.append(f"# HELP {PREFIJO}_db_pool_{clave}_total {ayuda}")
+        lineas.append(f"# TYPE {PREFIJO}_db_pool_{clave}_total {tipo}")
+        lineas.append(f"{PREFIJO}_db_pool_{clave}_total{etiquetas} {pool[clave]}")
+    if 'en_uso' in pool.get('estado', {}):
+        lineas.append(f"# HELP {PREFIJO}_db_pool_en_uso Conexiones prestadas en este momento")
+        lineas.append(f"# TYPE {PREFIJO}_db_pool_en_uso gauge")
+        lineas.append(f"{PREFIJO}_db_pool_en_uso{etiquetas} {pool['estado']['en_uso']}")
+
+    return "\n".join(lineas) + "\n"
+
+def iniciar_metricas(app):
+    """
+    Medir todos los requests de la app (todos los blueprints) y el SQL de
+    todos los engines
+    """
+    app.config.setdefault('METRICAS_DIR', os.getenv("METRICAS_DIR"))
+    _reiniciar()
+
+    app.before_request(_antes_request)
+    app.after_request(_despues_request)
+
+    if not event.contains(Engine, "before_cursor_execute", _antes_sql):
+        event.listen(Engine, "before_cursor_execute", _antes_sql)
+        event.listen(Engine, "after_cursor_execute", _despues_sql)
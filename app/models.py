@@ -1,11 +1,17 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, DDL
 from datetime import datetime
+from app.replica import SesionEnrutada
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": SesionEnrutada})
 
 
 class Empresa(db.Model):
     __tablename__ = "empresa"
+    __table_args__ = (
+        # Login: la empresa se identifica por NIT
+        db.UniqueConstraint("nit", name="uq_empresa_nit"),
+    )
 
     id_empresa = db.Column(db.Integer, primary_key=True, autoincrement=True)
     nit = db.Column(db.String(20), nullable=False)
@@ -31,6 +37,10 @@ class Rol(db.Model):
 
 class Usuario(db.Model):
     __tablename__ = "usuario"
+    __table_args__ = (
+        # Login: (empresa, usuario) identifica a una sola persona
+        db.UniqueConstraint("id_empresa", "nom_usuario", name="uq_usuario_empresa_nom_usuario"),
+    )
 
     id_usuario = db.Column(db.Integer, primary_key=True, autoincrement=True)
     nom_usuario = db.Column(db.String(100), nullable=False)
@@ -61,6 +71,7 @@ class Proveedor(db.Model):
     id_empresa = db.Column(db.Integer, db.ForeignKey("empresa.id_empresa"), nullable=False)
 
     empresa = db.relationship("Empresa", back_populates="proveedores")
+    compras = db.relationship("Compra", back_populates="proveedor", lazy="dynamic")
 
 
 class Producto(db.Model):
@@ -110,14 +121,31 @@ class DetalleVenta(db.Model):
 
 
 class MovimientoInventario(db.Model):
+    """
+    Libro de movimientos de inventario (solo se agregan filas).
+
+    En PostgreSQL la tabla se particiona por mes sobre fecha_hora, por eso
+    fecha_hora forma parte de la llave primaria.
+
+    `secuencia` crece con cada inserción y ordena los movimientos del mismo
+    segundo en el kardex: en PostgreSQL sale de una secuencia (también es el
+    DEFAULT de la columna, para las cargas con COPY) y en SQLite la llena un
+    trigger con el rowid.
+    """
     __tablename__ = "movimiento_inventario"
+    __table_args__ = (
+        # Kardex: movimientos de un producto en orden cronológico
+        db.Index("ix_movimiento_producto_fecha", "id_producto", "fecha_hora", "secuencia"),
+        {"postgresql_partition_by": "RANGE (fecha_hora)"},
+    )
 
     id_movimiento = db.Column(db.String(100), primary_key=True)
     tipo_movimiento = db.Column(db.String(100), nullable=False)
-    fecha_hora = db.Column(db.String(100), nullable=False)
+    fecha_hora = db.Column(db.String(100), primary_key=True)
     cantidad = db.Column(db.Integer, nullable=False)
     id_producto = db.Column(db.String(100), db.ForeignKey("producto.id_producto"), nullable=False)
     id_usuario = db.Column(db.Integer, db.ForeignKey("usuario.id_usuario"), nullable=False)
+    secuencia = db.Column(db.BigInteger, db.Sequence("movimiento_inventario_secuencia_seq"))
 
     producto = db.relationship("Producto", back_populates="movimientos")
     usuario = db.relationship("Usuario", back_populates="movimientos")
@@ -138,3 +166,273 @@ class DesactivacionUsuario(db.Model):
         foreign_keys=[id_usuario]
     )
     admin = db.relationship("Usuario", foreign_keys=[id_admin])
+
+
+class MetodoPago(db.Model):
+    __tablename__ = "metodo_pago"
+    __table_args__ = (
+        db.UniqueConstraint("id_empresa", "nombre", name="uq_metodo_pago_empresa_nombre"),
+    )
+
+    id_metodo = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    nombre = db.Column(db.String(100), nullable=False)
+    descripcion = db.Column(db.String(200))
+    activo = db.Column(db.Boolean, nullable=False, default=True)
+    # Los métodos básicos se pueden desactivar pero no eliminar
+    predeterminado = db.Column(db.Boolean, nullable=False, default=False)
+    id_empresa = db.Column(db.Integer, db.ForeignKey("empresa.id_empresa"), nullable=False)
+
+    empresa = db.relationship("Empresa")
+
+
+class VersionCache(db.Model):
+    """
+    Contador de versión por clave de caché (p. ej. 'metodo_pago:3'). Cada
+    escritura lo incrementa y cada proceso compara su copia en memoria.
+    """
+    __tablename__ = "version_cache"
+
+    clave = db.Column(db.String(100), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class LimiteIntento(db.Model):
+    """
+    Cubeta de intentos de login compartida entre procesos
+    (LOGIN_LIMITE_BACKEND=tabla). La llave es 'usuario:<nit>:<nombre>' o 'ip:<dirección>'.
+    """
+    __tablename__ = "limite_intento"
+
+    llave = db.Column(db.String(200), primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    actualizado = db.Column(db.Float, nullable=False)  # segundos epoch
+
+
+class EventoInvalidacion(db.Model):
+    """
+    Eventos de invalidación de caché para motores sin LISTEN/NOTIFY. Cada
+    proceso lee los posteriores al último que vio; se borran al poco tiempo.
+    """
+    __tablename__ = "evento_invalidacion"
+
+    id_evento = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    tabla = db.Column(db.String(100), nullable=False)
+    id_empresa = db.Column(db.Integer)
+    llave = db.Column(db.String(100))
+    columnas = db.Column(db.String(255))
+    origen = db.Column(db.String(32), nullable=False)
+    fecha_hora = db.Column(db.String(100), nullable=False, index=True)
+
+
+class ConteoInventario(db.Model):
+    __tablename__ = "conteo_inventario"
+
+    id_conteo = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    descripcion = db.Column(db.String(255))
+    estado = db.Column(db.String(20), nullable=False, default="ABIERTO")  # ABIERTO, CERRADO, CANCELADO
+    fecha_inicio = db.Column(db.String(100), nullable=False)
+    fecha_cierre = db.Column(db.String(100))
+    id_usuario = db.Column(db.Integer, db.ForeignKey("usuario.id_usuario"), nullable=False)
+    id_empresa = db.Column(db.Integer, db.ForeignKey("empresa.id_empresa"), nullable=False)
+
+    usuario = db.relationship("Usuario")
+    empresa = db.relationship("Empresa")
+    detalles = db.relationship("DetalleConteo", back_populates="conteo", lazy="dynamic")
+
+
+class DetalleConteo(db.Model):
+    __tablename__ = "detalle_conteo"
+    __table_args__ = (
+        db.UniqueConstraint("id_conteo", "id_producto", name="uq_detalle_conteo_producto"),
+    )
+
+    id_detalle_conteo = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    id_conteo = db.Column(db.Integer, db.ForeignKey("conteo_inventario.id_conteo"), nullable=False)
+    id_producto = db.Column(db.String(100), db.ForeignKey("producto.id_producto"), nullable=False)
+    cantidad_contada = db.Column(db.Integer, nullable=False)
+    # Stock del sistema al momento de cerrar el conteo (diferencia = contada - stock_sistema)
+    stock_sistema = db.Column(db.Integer)
+
+    conteo = db.relationship("ConteoInventario", back_populates="detalles")
+    producto = db.relationship("Producto")
+
+
+class Compra(db.Model):
+    __tablename__ = "compra"
+    __table_args__ = (
+        # Historial de compras por proveedor ordenado por fecha
+        db.Index("ix_compra_empresa_proveedor_fecha", "id_empresa", "id_proveedor", "fecha_hora"),
+    )
+
+    id_compra = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    numero_factura = db.Column(db.String(100))
+    fecha_hora = db.Column(db.String(100), nullable=False)
+    cantidad = db.Column(db.Integer, nullable=False)
+    total = db.Column(db.Integer, nullable=False)
+    id_proveedor = db.Column(db.String(100), db.ForeignKey("proveedor.id_proveedores"), nullable=False)
+    id_usuario = db.Column(db.Integer, db.ForeignKey("usuario.id_usuario"), nullable=False)
+    id_empresa = db.Column(db.Integer, db.ForeignKey("empresa.id_empresa"), nullable=False)
+
+    proveedor = db.relationship("Proveedor", back_populates="compras")
+    usuario = db.relationship("Usuario")
+    detalles = db.relationship("DetalleCompra", back_populates="compra")
+
+
+class DetalleCompra(db.Model):
+    __tablename__ = "detalle_compra"
+
+    id_detalle_compra = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    id_compra = db.Column(db.Integer, db.ForeignKey("compra.id_compra"), nullable=False, index=True)
+    id_producto = db.Column(db.String(100), db.ForeignKey("producto.id_producto"), nullable=False)
+    cantidad = db.Column(db.Integer, nullable=False)
+    costo_unitario = db.Column(db.Integer, nullable=False)
+    subtotal = db.Column(db.Integer, nullable=False)
+
+    compra = db.relationship("Compra", back_populates="detalles")
+    producto = db.relationship("Producto")
+
+
+class SnapshotStock(db.Model):
+    """
+    Stock de cada producto en una fecha de corte: incluye todos los
+    movimientos con fecha_hora anterior a fecha_corte.
+    """
+    __tablename__ = "snapshot_stock"
+
+    id_producto = db.Column(db.String(100), db.ForeignKey("producto.id_producto"), primary_key=True)
+    fecha_corte = db.Column(db.String(100), primary_key=True)
+    stock = db.Column(db.Integer, nullable=False)
+    id_empresa = db.Column(db.Integer, db.ForeignKey("empresa.id_empresa"), nullable=False, index=True)
+
+    producto = db.relationship("Producto")
+
+
+class DevolucionVenta(db.Model):
+    """
+    Devolución (parcial) o anulación de una venta. Las cantidades devueltas
+    por línea quedan en DetalleDevolucion.
+    """
+    __tablename__ = "devolucion_venta"
+
+    id_devolucion = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    id_venta = db.Column(db.Integer, db.ForeignKey("venta.id_venta"), nullable=False, index=True)
+    tipo = db.Column(db.String(20), nullable=False)  # PARCIAL, ANULACION
+    motivo = db.Column(db.String(255), nullable=False)
+    fecha_hora = db.Column(db.String(100), nullable=False)
+    cantidad = db.Column(db.Integer, nullable=False)
+    total = db.Column(db.Integer, nullable=False)
+    id_usuario = db.Column(db.Integer, db.ForeignKey("usuario.id_usuario"), nullable=False)
+    id_empresa = db.Column(db.Integer, db.ForeignKey("empresa.id_empresa"), nullable=False)
+
+    venta = db.relationship("Venta")
+    usuario = db.relationship("Usuario")
+    detalles = db.relationship("DetalleDevolucion", back_populates="devolucion")
+
+
+class DetalleDevolucion(db.Model):
+    __tablename__ = "detalle_devolucion"
+
+    id_detalle_devolucion = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    id_devolucion = db.Column(db.Integer, db.ForeignKey("devolucion_venta.id_devolucion"), nullable=False, index=True)
+    id_detalle = db.Column(db.String(100), db.ForeignKey("detalle_venta.id_detalle"), nullable=False, index=True)
+    id_producto = db.Column(db.String(100), db.ForeignKey("producto.id_producto"), nullable=False)
+    cantidad = db.Column(db.Integer, nullable=False)
+    subtotal = db.Column(db.Integer, nullable=False)
+
+    devolucion = db.relationship("DevolucionVenta", back_populates="detalles")
+    producto = db.relationship("Producto")
+
+
+class ReservaStock(db.Model):
+    """
+    Unidades apartadas por un carrito abierto del punto de venta. La reserva
+    vence sola en expira_en si el carrito no se confirma ni se renueva.
+    """
+    __tablename__ = "reserva_stock"
+    __table_args__ = (
+        # Suma de reservas vigentes por producto
+        db.Index("ix_reserva_producto_expira", "id_producto", "expira_en"),
+    )
+
+    id_carrito = db.Column(db.String(64), primary_key=True)
+    id_producto = db.Column(db.String(100), db.ForeignKey("producto.id_producto"), primary_key=True)
+    cantidad = db.Column(db.Integer, nullable=False)
+    expira_en = db.Column(db.String(100), nullable=False)
+    id_usuario = db.Column(db.Integer, db.ForeignKey("usuario.id_usuario"), nullable=False)
+    id_empresa = db.Column(db.Integer, db.ForeignKey("empresa.id_empresa"), nullable=False)
+
+
+class Carrito(db.Model):
+    """
+    Carrito abierto del punto de venta. Los totales se mantienen al día con
+    cada cambio de línea, sin recorrer el carrito completo.
+    """
+    __tablename__ = "carrito"
+
+    id_carrito = db.Column(db.String(64), primary_key=True)
+    descuento = db.Column(db.Float, nullable=False, default=0)
+    subtotal = db.Column(db.Integer, nullable=False, default=0)
+    cantidad = db.Column(db.Integer, nullable=False, default=0)
+    actualizado_en = db.Column(db.String(100), nullable=False)
+    id_usuario = db.Column(db.Integer, db.ForeignKey("usuario.id_usuario"), nullable=False)
+    id_empresa = db.Column(db.Integer, db.ForeignKey("empresa.id_empresa"), nullable=False, index=True)
+
+    items = db.relationship("ItemCarrito", back_populates="carrito")
+
+
+class ItemCarrito(db.Model):
+    __tablename__ = "item_carrito"
+
+    id_carrito = db.Column(db.String(64), db.ForeignKey("carrito.id_carrito"), primary_key=True)
+    id_producto = db.Column(db.String(100), db.ForeignKey("producto.id_producto"), primary_key=True)
+    cantidad = db.Column(db.Integer, nullable=False)
+    # Precio tomado del catálogo al agregar la línea; es el que se cobra
+    precio_unitario = db.Column(db.Integer, nullable=False)
+    subtotal = db.Column(db.Integer, nullable=False)
+
+    carrito = db.relationship("Carrito", back_populates="items")
+    producto = db.relationship("Producto")
+
+
+# ----------------------------------------------------------------------
+# El libro de movimientos solo admite inserciones
+# ----------------------------------------------------------------------
+# En PostgreSQL la tabla particionada necesita una partición DEFAULT para
+# aceptar filas de meses cuya partición aún no se ha creado
+event.listen(
+    MovimientoInventario.__table__,
+    "after_create",
+    DDL(
+        "CREATE TABLE IF NOT EXISTS movimiento_inventario_pdefault "
+        "PARTITION OF movimiento_inventario DEFAULT"
+    ).execute_if(dialect="postgresql")
+)
+
+# Inserciones sin el ORM (COPY, INSERT ... SELECT) también reciben secuencia
+event.listen(
+    MovimientoInventario.__table__,
+    "after_create",
+    DDL(
+        "ALTER TABLE movimiento_inventario ALTER COLUMN secuencia "
+        "SET DEFAULT nextval('movimiento_inventario_secuencia_seq')"
+    ).execute_if(dialect="postgresql")
+)
+event.listen(
+    MovimientoInventario.__table__,
+    "after_create",
+    DDL(
+        "CREATE TRIGGER IF NOT EXISTS movimiento_inventario_secuencia "
+        "AFTER INSERT ON movimiento_inventario WHEN NEW.secuencia IS NULL "
+        "BEGIN UPDATE movimiento_inventario SET secuencia = NEW.rowid WHERE rowid = NEW.rowid; END"
+    ).execute_if(dialect="sqlite")
+)
+
+
+@event.listens_for(MovimientoInventario, "before_update")
+def _bloquear_actualizacion_movimiento(mapper, connection, target):
+    raise ValueError("Los movimientos de inventario no se pueden modificar; registra un movimiento de ajuste")
+
+
+@event.listens_for(MovimientoInventario, "before_delete")
+def _bloquear_eliminacion_movimiento(mapper, connection, target):
+    raise ValueError("Los movimientos de inventario no se pueden eliminar; registra un movimiento de ajuste")
@@ -0,0 +1,325 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from flask import current_app, g, request, session
+
+# ----------------------------------------------------------------------
+# Perfilador por muestreo para requests en producción
+#
+# El operador lo activa (POST /interno/perfilador con INTERNO_TOKEN o
+# `flask perfilador activar`) para 1 de cada N requests, opcionalmente solo de un endpoint o
+# ruta y de una empresa. La activación se guarda en
+# <PERFILADOR_DIR>/activacion.json, así la ven todos los workers, y vence
+# sola (por tiempo y por cantidad de requests por worker).
+#
+# Un hilo por worker toma la pila del hilo de cada request perfilado cada
+# PERFILADOR_INTERVALO_MS y las acumula por endpoint. El resultado queda en
+# <PERFILADOR_DIR>/<endpoint>.<pid>.folded, en formato de pilas colapsadas
+# ("a;b;c cantidad") listo para flamegraph.pl o speedscope.
+#
+# Límites: requests perfilados a la vez por worker, segundos muestreados
+# por request, fracción de CPU del hilo de muestreo, pilas distintas por
+# endpoint y bytes totales en el directorio.
+# ----------------------------------------------------------------------
+ARCHIVO_ACTIVACION = "activacion.json"
+MAX_ACTIVACION_SEGUNDOS = 3600
+PROFUNDIDAD_MAXIMA = 200
+
+_candado = threading.Lock()
+_estado = {
+    'pid': None,
+    'activacion': None,        # contenido de activacion.json
+    'mtime': None,             # del archivo leído
+    'revisado': 0.0,           # último stat del archivo
+    'contador': 0,             # requests vistos que cumplen el filtro
+    'perfilados': 0,           # requests perfilados por este worker
+    'hilos': {},               # id de hilo -> [endpoint, inicio, muestras]
+    'pilas': {},               # endpoint -> Counter de pilas colapsadas
+    'descartadas': 0,          # muestras que no entraron por PERFILADOR_MAX_PILAS
+    'segundos_muestreo': 0.0,  # CPU del hilo de muestreo
+    'muestreador': None,
+    'hay_trabajo': None,
+    'omitidos_por_tamano': 0,
+}
+
+def _reiniciar_proceso():
+    """Después de un fork el hilo de muestreo y los datos no son de este worker"""
+    _estado.update({
+        'pid': os.getpid(), 'contador': 0, 'perfilados': 0, 'hilos': {}, 'pilas': {},
+        'descartadas': 0, 'segundos_muestreo': 0.0, 'muestreador': None,
+        'hay_trabajo': threading.Event(), 'omitidos_por_tamano': 0,
+    })
+
+# ----------------------------------------------------------------------
+# Activación (compartida entre workers por archivo)
+# ----------------------------------------------------------------------
+def _ruta_activacion(config):
+    return os.path.join(config['PERFILADOR_DIR'], ARCHIVO_ACTIVACION)
+
+def activar_perfilador(cada=1, endpoint=None, ruta=None, id_empresa=None, segundos=600, max_requests=200):
+    """
+    Activar el perfilador para todos los workers. Devuelve (activacion, error)
+    """
+    try:
+        cada = int(cada)
+        segundos = int(segundos)
+        max_requests = int(max_requests)
+        id_empresa = int(id_empresa) if id_empresa not in (None, "") else None
+    except (TypeError, ValueError):
+        return None, "cada, segundos, max_requests e id_empresa deben ser enteros"
+    if cada < 1 or max_requests < 1 or not 0 < segundos <= MAX_ACTIVACION_SEGUNDOS:
+        return None, f"cada y max_requests deben ser >= 1 y segundos entre 1 y {MAX_ACTIVACION_SEGUNDOS}"
+
+    activacion = {
+        'cada': cada,
+        'endpoint': endpoint or None,
+        'ruta': ruta or None,
+        'id_empresa': id_empresa,
+        'max_requests': max_requests,
+        'desde': time.time(),
+        'hasta': time.time() + segundos,
+    }
+    try:
+        directorio = current_app.config['PERFILADOR_DIR']
+        os.makedirs(directorio, exist_ok=True)
+        destino = _ruta_activacion(current_app.config)
+        temporal = f"{destino}.{os.getpid()}.tmp"
+        with open(temporal, "w") as archivo:
+            json.dump(activacion, archivo)
+        os.replace(temporal, destino)
+        return activacion, None
+    except OSError as e:
+        return None, f"Error al activar el perfilador: {str(e)}"
+
+def desactivar_perfilador():
+    """
+    Desactivar el perfilador en todos los workers. Devuelve (desactivado, error)
+    """
+    try:
+        os.remove(_ruta_activacion(current_app.config))
+        return True, None
+    except FileNotFoundError:
+        return False, None
+    except OSError as e:
+        return False, f"Error al desactivar el perfilador: {str(e)}"
+
+def _activacion_vigente(config):
+    """Lee activacion.json como mucho una vez por segundo"""
+    ahora = time.time()
+    if ahora - _estado['revisado'] >= 1.0:
+        _estado['revisado'] = ahora
+        ruta = _ruta_activacion(config)
+        try:
+            mtime = os.stat(ruta).st_mtime
+        except OSError:
+            mtime = None
+
+        if mtime is None:
+            _estado['activacion'] = _estado['mtime'] = None
+        elif mtime != _estado['mtime']:
+            try:
+                with open(ruta) as archivo:
+                    _estado['activacion'] = json.load(archivo)
+            except (OSError, ValueError):
+                _estado['activacion'] = None
+            _estado['mtime'] = mtime
+            # Nueva activación: se reinicia la cuenta de este worker
+            _estado['contador'] = _estado['perfilados'] = 0
+
+    activacion = _estado['activacion']
+    if activacion and ahora < activacion['hasta'] and _estado['perfilados'] < activacion['max_requests']:
+        return activacion
+    return None
+
+def _empresa_del_request():
+    id_empresa = (request.view_args or {}).get('id_empresa')
+    if id_empresa is None:
+        id_empresa = session.get('empresa_id')
+    return id_empresa
+
+def _corresponde(activacion):
+    if activacion['endpoint'] and request.endpoint != activacion['endpoint']:
+        return False
+    if activacion['ruta'] and not request.path.startswith(activacion['ruta']):
+        return False
+    if activacion['id_empresa'] is not None and _empresa_del_request() != activacion['id_empresa']:
+        return False
+    return True
+
+# ----------------------------------------------------------------------
+# Muestreo
+# ----------------------------------------------------------------------
+_RAICES = sorted({os.path.dirname(os.path.dirname(os.path.abspath(__file__)))} | {p for p in sys.path if p}, key=len, reverse=True)
+
+def _nombre_marco(codigo):
+    archivo = codigo.co_filename
+    for raiz in _RAICES:
+        if archivo.startswith(raiz + os.sep):
+            archivo = archivo[len(raiz) + 1:]
+            break
+    # ';' separa marcos en el formato colapsado
+    return f"{codigo.co_name} ({archivo}:{codigo.co_firstlineno})".replace(";", ":")
+
+def _pila(marco):
+    nombres = []
+    while marco is not None and len(nombres) < PROFUNDIDAD_MAXIMA:
+        nombres.append(_nombre_marco(marco.f_code))
+        marco = marco.f_back
+    return ";".join(reversed(nombres))
+
+def _muestrear(intervalo, max_segundos, max_fraccion, max_pilas):
+    hay_trabajo = _estado['hay_trabajo']
+    propio = threading.get_ident()
+    while True:
+        hay_trabajo.wait()
+        inicio_cpu = time.thread_time()
+        ahora = time.monotonic()
+
+        marcos = sys._current_frames()
+        with _candado:
+            for id_hilo, datos in list(_estado['hilos'].items()):
+                endpoint, inicio, _ = datos
+                marco = marcos.get(id_hilo)
+                if marco is None or id_hilo == propio or ahora - inicio > max_segundos:
+                    continue
+                pila = _pila(marco)
+                pilas = _estado['pilas'].setdefault(endpoint, Counter())
+                if pila in pilas or len(pilas) < max_pilas:
+                    pilas[pila] += 1
+                    datos[2] += 1
+                else:
+                    _estado['descartadas'] += 1
+            if not _estado['hilos']:
+                hay_trabajo.clear()
+        del marcos
+
+        # Si muestrear cuesta más que max_fraccion del tiempo, se espacia
+        costo = time.thread_time() - inicio_cpu
+        _estado['segundos_muestreo'] += costo
+        time.sleep(max(intervalo, costo / max_fraccion - costo))
+
+def _asegurar_muestreador(config):
+    if _estado['muestreador'] is None or not _estado['muestreador'].is_alive():
+        hilo = threading.Thread(
+            target=_muestrear,
+            args=(
+                config['PERFILADOR_INTERVALO_MS'] / 1000,
+                config['PERFILADOR_MAX_SEGUNDOS'],
+                config['PERFILADOR_MAX_FRACCION_CPU'],
+                config['PERFILADOR_MAX_PILAS'],
+            ),
+            name="perfilador",
+            daemon=True,
+        )
+        hilo.start()
+        _estado['muestreador'] = hilo
+
+# ----------------------------------------------------------------------
+# Hooks del request
+# ----------------------------------------------------------------------
+def _antes_request():
+    config = current_app.config
+    if _estado['pid'] != os.getpid():
+        _reiniciar_proceso()
+
+    activacion = _activacion_vigente(config)
+    if activacion is None or not _corresponde(activacion):
+        return
+
+    with _candado:
+        _estado['contador'] += 1
+        if (_estado['contador'] - 1) % activacion['cada']:
+            return
+        if len(_estado['hilos']) >= config['PERFILADOR_MAX_SIMULTANEOS']:
+            return
+        _estado['perfilados'] += 1
+        _estado['hilos'][threading.get_ident()] = [request.endpoint or "sin_ruta", time.monotonic(), 0]
+
+    g._perfilado = True
+    _asegurar_muestreador(config)
+    _estado['hay_trabajo'].set()
+
+def _fin_request(excepcion):
+    if not g.pop('_perfilado', False):
+        return
+    with _candado:
+        datos = _estado['hilos'].pop(threading.get_ident(), None)
+    if datos and datos[2]:
+        _guardar(datos[0])
+
+def _nombre_archivo(endpoint):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", endpoint) + f".{os.getpid()}.folded"
+
+def _tamano_directorio(directorio):
+    total = 0
+    for nombre in os.listdir(directorio):
+        if nombre.endswith(".folded"):
+            try:
+                total += os.path.getsize(os.path.join(directorio, nombre))
+            except OSError:
+                continue
+    return total
+
+def _guardar(endpoint):
+    """Reescribir el archivo del endpoint con las pilas acumuladas por este worker"""
+    config = current_app.config
+    directorio = config['PERFILADOR_DIR']
+    with _candado:
+        pilas = dict(_estado['pilas'].get(endpoint, {}))
+    contenido = "".join(f"{pila} {cantidad}\n" for pila, cantidad in pilas.items())
+
+    try:
+        os.makedirs(directorio, exist_ok=True)
+        destino = os.path.join(directorio, _nombre_archivo(endpoint))
+        anterior = os.path.getsize(destino) if os.path.exists(destino) else 0
+        if _tamano_directorio(directorio) - anterior + len(contenido.encode("utf-8")) > config['PERFILADOR_MAX_BYTES']:
+            _estado['omitidos_por_tamano'] += 1
+            return
+        temporal = f"{destino}.tmp"
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            archivo.write(contenido)
+        os.replace(temporal, destino)
+    except OSError as e:
+        print(f"Error al guardar el perfil: {str(e)}")
+
+def estado_perfilador():
+    """
+    Activación vigente y contadores del perfilador en este worker
+    """
+    config = current_app.config
+    if _estado['pid'] != os.getpid():
+        _reiniciar_proceso()
+    _estado['revisado'] = 0.0
+    activacion = _activacion_vigente(config)
+    with _candado:
+        return {
+            'pid': _estado['pid'],
+            'activacion': activacion,
+            'perfilados': _estado['perfilados'],
+            'en_curso': len(_estado['hilos']),
+            'muestras': {endpoint: sum(pilas.values()) for endpoint, pilas in _estado['pilas'].items()},
+            'muestras_descartadas': _estado['descartadas'],
+            'guardados_omitidos_por_tamano': _estado['omitidos_por_tamano'],
+            'cpu_muestreo_segundos': round(_estado['segundos_muestreo'], 3),
+            'directorio': config['PERFILADOR_DIR'],
+        }
+
+def iniciar_perfilador(app):
+    """
+    Configuración del perfilador y hooks de request (inactivo hasta que el
+    operador lo activa)
+    """
+    app.config.setdefault('PERFILADOR_DIR', os.getenv("PERFILADOR_DIR", "perfiles"))
+    app.config.setdefault('PERFILADOR_INTERVALO_MS', float(os.getenv("PERFILADOR_INTERVALO_MS", 5)))
+    app.config.setdefault('PERFILADOR_MAX_SIMULTANEOS', int(os.getenv("PERFILADOR_MAX_SIMULTANEOS", 1)))
+    app.config.setdefault('PERFILADOR_MAX_SEGUNDOS', float(os.getenv("PERFILADOR_MAX_SEGUNDOS", 10)))
+    app.config.setdefault('PERFILADOR_MAX_FRACCION_CPU', float(os.getenv("PERFILADOR_MAX_FRACCION_CPU", 0.05)))
+    app.config.setdefault('PERFILADOR_MAX_PILAS', int(os.getenv("PERFILADOR_MAX_PILAS", 5000)))
+    app.config.setdefault('PERFILADOR_MAX_BYTES', int(os.getenv("PERFILADOR_MAX_BYTES", 20 * 1024 * 1024)))
+
+    app.before_request(_antes_request)
+    app.teardown_request(_fin_request)
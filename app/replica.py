@@ -0,0 +1,100 @@
+import os
+import time
+from contextvars import ContextVar
+from functools import wraps
+from flask import current_app, has_request_context, session as sesion_flask
+from flask_sqlalchemy.session import Session as SesionFlask
+from sqlalchemy import event
+
+# ----------------------------------------------------------------------
+# Réplica de lectura
+#
+# Con DATABASE_REPLICA_URL se registra el bind 'replica'. Las funciones
+# marcadas con @solo_lectura (reportes, historial, factura) leen de la
+# réplica; todo lo demás, y cualquier escritura, va al primario.
+#
+# Leer lo propio: después de que un usuario confirma escrituras, durante
+# REPLICA_VENTANA_SEGUNDOS sus lecturas siguen yendo al primario, para que
+# no vea la réplica atrasada (p. ej. el historial justo después de vender).
+# La marca va en la sesión de Flask, así que vale entre workers.
+# ----------------------------------------------------------------------
+BIND_REPLICA = "replica"
+
+_solo_lectura = ContextVar("solo_lectura", default=False)
+
+def configurar_replica(app, opciones_motor):
+    """
+    Registrar el bind de la réplica si DATABASE_REPLICA_URL está definida
+    """
+    uri = os.getenv("DATABASE_REPLICA_URL")
+    if uri and uri.startswith("postgres://"):
+        uri = uri.replace("postgres://", "postgresql+psycopg2://", 1)
+
+    app.config.setdefault('REPLICA_VENTANA_SEGUNDOS', float(os.getenv("REPLICA_VENTANA_SEGUNDOS", 5)))
+    if uri:
+        binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+        binds[BIND_REPLICA] = dict(opciones_motor(uri), url=uri)
+
+def _escritura_reciente():
+    if not has_request_context():
+        return False
+    ultima = sesion_flask.get('ultima_escritura')
+    return bool(ultima) and time.time() - ultima < current_app.config['REPLICA_VENTANA_SEGUNDOS']
+
+def solo_lectura(funcion):
+    """
+    Ejecutar la función contra la réplica (si hay una y el usuario no
+    escribió hace poco). No debe escribir ni bloquear filas.
+    """
+    @wraps(funcion)
+    def envoltura(*args, **kwargs):
+        token = _solo_lectura.set(not _escritura_reciente())
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            _solo_lectura.reset(token)
+    return envoltura
+
+def leyendo_replica():
+    """True dentro de @solo_lectura cuando hay réplica configurada"""
+    return _solo_lectura.get() and BIND_REPLICA in current_app.config.get('SQLALCHEMY_BINDS', {})
+
+class SesionEnrutada(SesionFlask):
+    """
+    Sesión que manda las consultas de @solo_lectura al bind 'replica'
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and _solo_lectura.get()
+            and not self._flushing
+            and not (self.new or self.dirty or self.deleted)
+            and not getattr(clause, "is_dml", False)
+            and getattr(clause, "_for_update_arg", None) is None
+        ):
+            replica = self._db.engines.get(BIND_REPLICA)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+# ----------------------------------------------------------------------
+# Marca de escritura reciente
+# ----------------------------------------------------------------------
+@event.listens_for(SesionEnrutada, "after_flush")
+def _marcar_escritura(sesion, contexto):
+    sesion.info['escribio'] = True
+
+@event.listens_for(SesionEnrutada, "do_orm_execute")
+def _marcar_escritura_masiva(estado):
+    if estado.is_update or estado.is_delete or estado.is_insert:
+        estado.session.info['escribio'] = True
+
+@event.listens_for(SesionEnrutada, "after_commit")
+def _registrar_escritura(sesion):
+    if sesion.info.pop('escribio', False) and has_request_context():
+        sesion_flask['ultima_escritura'] = time.time()
+
+@event.listens_for(SesionEnrutada, "after_rollback")
+def _descartar_escritura(sesion):
+    sesion.info.pop('escribio', None)
@@ -0,0 +1,149 @@
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session
+from functools import wraps
+from app.schemas.compra_schema import ProveedorForm, CompraForm
+from app.controllers.compra_controller import (
+    crear_proveedor,
+    listar_proveedores,
+    obtener_proveedor,
+    registrar_compra,
+    listar_compras,
+    obtener_compra,
+    obtener_resumen_proveedor
+)
+
+compra_bp = Blueprint("compra", __name__, url_prefix="/compra")
+
+# ----------------------------------------------------------------------
+# Decoradores de autenticación
+# ----------------------------------------------------------------------
+def login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'usuario_id' not in session:
+            flash("Debes iniciar sesión para acceder a esta página", "warning")
+            return redirect(url_for('usuario.login'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+def verificar_acceso_empresa(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        id_empresa = kwargs.get('id_empresa')
+        if id_empresa and session.get('empresa_id') != id_empresa:
+            flash("No tienes permisos para acceder a esta empresa", "danger")
+            return redirect(url_for('compra.listar', id_empresa=session.get('empresa_id')))
+        return f(*args, **kwargs)
+    return decorated_function
+
+# ----------------------------------------------------------------------
+# Proveedores
+# ----------------------------------------------------------------------
+@compra_bp.route("/proveedores/<int:id_empresa>", methods=["GET", "POST"])
+@login_required
+@verificar_acceso_empresa
+def proveedores(id_empresa):
+    """Listar y registrar proveedores"""
+    form = ProveedorForm()
+
+    if form.validate_on_submit():
+        proveedor, error = crear_proveedor(
+            id_proveedores=form.id_proveedores.data.strip(),
+            nombre=form.nombre.data,
+            telefono=form.telefono.data,
+            correo=form.correo.data,
+            direccion=form.direccion.data,
+            id_empresa=id_empresa
+        )
+        if error:
+            flash(error, "danger")
+        else:
+            flash(f"Proveedor '{proveedor.nombre}' registrado ✅", "success")
+            return redirect(url_for("compra.proveedores", id_empresa=id_empresa))
+    elif form.is_submitted():
+        flash("Por favor corrige los errores en el formulario ❌", "danger")
+
+    return render_template("compras/proveedores.html",
+                         form=form,
+                         proveedores=listar_proveedores(id_empresa),
+                         id_empresa=id_empresa)
+
+# ----------------------------------------------------------------------
+# Historial de compras
+# ----------------------------------------------------------------------
+@compra_bp.route("/listar/<int:id_empresa>")
+@login_required
+@verificar_acceso_empresa
+def listar(id_empresa):
+    """Historial de compras, opcionalmente filtrado por proveedor"""
+    id_proveedor = request.args.get('proveedor', '').strip() or None
+    fecha_desde = request.args.get('desde')
+    fecha_hasta = request.args.get('hasta')
+
+    proveedor = obtener_proveedor(id_empresa, id_proveedor) if id_proveedor else None
+    resumen = obtener_resumen_proveedor(id_empresa, id_proveedor) if proveedor else None
+
+    compras = listar_compras(id_empresa, id_proveedor, fecha_desde, fecha_hasta)
+
+    return render_template("compras/listar.html",
+                         compras=compras,
+                         proveedores=listar_proveedores(id_empresa),
+                         proveedor=proveedor,
+                         resumen=resumen,
+                         fecha_desde=fecha_desde,
+                         fecha_hasta=fecha_hasta,
+                         id_empresa=id_empresa)
+
+# ----------------------------------------------------------------------
+# Registrar compra
+# ----------------------------------------------------------------------
+@compra_bp.route("/crear/<int:id_empresa>", methods=["GET", "POST"])
+@login_required
+@verificar_acceso_empresa
+def crear(id_empresa):
+    """Registrar la recepción de mercancía de un proveedor"""
+    form = CompraForm()
+    form.id_proveedor.choices = [(p.id_proveedores, p.nombre) for p in listar_proveedores(id_empresa)]
+
+    if form.validate_on_submit():
+        items = []
+        for linea in form.lineas.data.splitlines():
+            partes = [p.strip() for p in linea.replace(';', ',').split(',')]
+            if not partes[0]:
+                continue
+            items.append({
+                'id_producto': partes[0],
+                'cantidad': partes[1] if len(partes) > 1 else 0,
+                'costo_unitario': partes[2] if len(partes) > 2 else 0
+            })
+
+        compra, error = registrar_compra(
+            id_empresa=id_empresa,
+            id_proveedor=form.id_proveedor.data,
+            items=items,
+            id_usuario=session['usuario_id'],
+            numero_factura=form.numero_factura.data
+        )
+        if error:
+            flash(error, "danger")
+        else:
+            flash(f"Compra #{compra.id_compra} registrada: {compra.cantidad} unidades ingresadas ✅", "success")
+            return redirect(url_for("compra.detalle", id_empresa=id_empresa, id_compra=compra.id_compra))
+    elif form.is_submitted():
+        flash("Por favor corrige los errores en el formulario ❌", "danger")
+
+    return render_template("compras/crear.html", form=form, id_empresa=id_empresa)
+
+# ----------------------------------------------------------------------
+# Detalle de compra
+# ----------------------------------------------------------------------
+@compra_bp.route("/detalle/<int:id_empresa>/<int:id_compra>")
+@login_required
+@verificar_acceso_empresa
+def detalle(id_empresa, id_compra):
+    """Ver detalle de una compra"""
+    compra = obtener_compra(id_empresa, id_compra)
+    if not compra:
+        flash("Compra no encontrada", "danger")
+        return redirect(url_for("compra.listar", id_empresa=id_empresa))
+
+    return render_template("compras/detalle.html", compra=compra, id_empresa=id_empresa)
@@ -0,0 +1,99 @@
+import hmac
+from functools import wraps
+from flask import Blueprint, Response, jsonify, request, current_app
+from app.conexiones import metricas_pool
+from app.metricas import exportar_metricas
+from app.cache import estadisticas_cache, estadisticas_consultas_compartidas
+from app.perfilador import activar_perfilador, desactivar_perfilador, estado_perfilador
+
+interno_bp = Blueprint("interno", __name__, url_prefix="/interno")
+metricas_bp = Blueprint("metricas", __name__)
+
+# ----------------------------------------------------------------------
+# Acceso: solo con token (cabecera X-Interno-Token o Authorization:
+# Bearer). Los datos son de todo el servidor, no de una empresa, así que
+# una sesión de administrador de empresa no basta. /interno/... pide el
+# token de operación (INTERNO_TOKEN); /metrics acepta además el de
+# Prometheus (METRICAS_TOKEN), que no sirve para nada más. Sin tokens
+# configurados los endpoints responden 403.
+# ----------------------------------------------------------------------
+def _token_enviado():
+    enviado = request.headers.get("X-Interno-Token", "")
+    autorizacion = request.headers.get("Authorization", "")
+    if not enviado and autorizacion.startswith("Bearer "):
+        enviado = autorizacion[len("Bearer "):]
+    return enviado
+
+def _token_valido(*claves):
+    enviado = _token_enviado()
+    for clave in claves:
+        token = current_app.config.get(clave)
+        if token and hmac.compare_digest(enviado, token):
+            return True
+    return False
+
+def acceso_interno(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if _token_valido('INTERNO_TOKEN'):
+            return f(*args, **kwargs)
+        return jsonify({'error': 'No autorizado'}), 403
+    return decorated_function
+
+def acceso_metricas(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if _token_valido('METRICAS_TOKEN', 'INTERNO_TOKEN'):
+            return f(*args, **kwargs)
+        return jsonify({'error': 'No autorizado'}), 403
+    return decorated_function
+
+# Los datos de /interno son del worker que atiende el request
+@interno_bp.route("/pool")
+@acceso_interno
+def pool():
+    return jsonify(metricas_pool())
+
+@interno_bp.route("/cache")
+@acceso_interno
+def cache():
+    return jsonify({
+        'consultas': estadisticas_cache(),
+        'compartidas': estadisticas_consultas_compartidas()
+    })
+
+@interno_bp.route("/perfilador", methods=["GET", "POST", "DELETE"])
+@acceso_interno
+def perfilador():
+    """
+    POST activa el perfilador en todos los workers (cada, endpoint, ruta,
+    id_empresa, segundos, max_requests); DELETE lo apaga. Solo con el token
+    de operación: el perfil incluye requests de cualquier empresa, así que
+    un administrador de empresa no puede activarlo.
+    """
+    if request.method == "POST":
+        datos = request.get_json(silent=True) or request.form
+        _, error = activar_perfilador(
+            cada=datos.get('cada', 1),
+            endpoint=datos.get('endpoint'),
+            ruta=datos.get('ruta'),
+            id_empresa=datos.get('id_empresa'),
+            segundos=datos.get('segundos', 600),
+            max_requests=datos.get('max_requests', 200),
+        )
+        if error:
+            return jsonify({'error': error}), 400
+    elif request.method == "DELETE":
+        _, error = desactivar_perfilador()
+        if error:
+            return jsonify({'error': error}), 500
+    return jsonify(estado_perfilador())
+
+@metricas_bp.route("/metrics")
+@acceso_metricas
+def metrics():
+    """Formato de texto de Prometheus (suma de los workers si hay METRICAS_DIR)"""
+    return Response(
+        exportar_metricas(current_app.config.get('METRICAS_DIR')),
+        content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,306 @@
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session, jsonify, Response, stream_with_context
+from functools import wraps
+from datetime import datetime, timedelta
+import json
+from app.controllers.inventario_controller import (
+    crear_conteo,
+    listar_conteos,
+    obtener_conteo,
+    registrar_conteos,
+    obtener_diferencias_conteo,
+    cerrar_conteo,
+    cancelar_conteo,
+    obtener_kardex_producto,
+    obtener_kardex_empresa,
+    obtener_stock_en_fecha
+)
+
+inventario_bp = Blueprint("inventario", __name__, url_prefix="/inventario")
+
+# ----------------------------------------------------------------------
+# Decoradores de autenticación
+# ----------------------------------------------------------------------
+def login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'usuario_id' not in session:
+            flash("Debes iniciar sesión para acceder a esta página", "warning")
+            return redirect(url_for('usuario.login'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+def verificar_acceso_empresa(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        id_empresa = kwargs.get('id_empresa')
+        if id_empresa and session.get('empresa_id') != id_empresa:
+            flash("No tienes permisos para acceder a esta empresa", "danger")
+            return redirect(url_for('inventario.conteos', id_empresa=session.get('empresa_id')))
+        return f(*args, **kwargs)
+    return decorated_function
+
+def _leer_items_conteo():
+    """Leer las cantidades contadas desde JSON o desde el formulario (una línea 'ID,cantidad' por producto)"""
+    if request.is_json:
+        data = request.get_json() or {}
+        return data.get('items', []), bool(data.get('acumular', False))
+
+    items = []
+    for linea in request.form.get('lineas', '').splitlines():
+        linea = linea.strip()
+        if not linea:
+            continue
+        partes = [p.strip() for p in linea.replace(';', ',').split(',')]
+        items.append({
+            'id_producto': partes[0],
+            'cantidad': partes[1] if len(partes) > 1 and partes[1] else 1
+        })
+    return items, request.form.get('acumular') == 'on'
+
+# ----------------------------------------------------------------------
+# Conteos físicos
+# ----------------------------------------------------------------------
+@inventario_bp.route("/conteos/<int:id_empresa>", methods=["GET", "POST"])
+@login_required
+@verificar_acceso_empresa
+def conteos(id_empresa):
+    """Listar conteos y abrir uno nuevo"""
+    if request.method == "POST":
+        conteo, error = crear_conteo(
+            id_empresa=id_empresa,
+            id_usuario=session['usuario_id'],
+            descripcion=request.form.get('descripcion', '').strip()
+        )
+        if error:
+            flash(error, "danger")
+        else:
+            flash(f"Conteo #{conteo.id_conteo} abierto ✅", "success")
+            return redirect(url_for("inventario.conteo", id_empresa=id_empresa, id_conteo=conteo.id_conteo))
+
+    return render_template("inventario/conteos.html",
+                         conteos=listar_conteos(id_empresa),
+                         id_empresa=id_empresa)
+
+@inventario_bp.route("/conteo/<int:id_empresa>/<int:id_conteo>")
+@login_required
+@verificar_acceso_empresa
+def conteo(id_empresa, id_conteo):
+    """Ver un conteo con sus diferencias contra el stock del sistema"""
+    conteo = obtener_conteo(id_empresa, id_conteo)
+    if not conteo:
+        flash("Conteo no encontrado", "danger")
+        return redirect(url_for("inventario.conteos", id_empresa=id_empresa))
+
+    solo_diferencias = request.args.get('diferencias') == '1'
+    lineas = obtener_diferencias_conteo(conteo, solo_diferencias=solo_diferencias)
+
+    return render_template("inventario/conteo.html",
+                         conteo=conteo,
+                         lineas=lineas,
+                         solo_diferencias=solo_diferencias,
+                         id_empresa=id_empresa)
+
+@inventario_bp.route("/conteo/<int:id_empresa>/<int:id_conteo>/registrar", methods=["POST"])
+@login_required
+@verificar_acceso_empresa
+def registrar(id_empresa, id_conteo):
+    """Registrar un lote de cantidades contadas (formulario o JSON)"""
+    conteo = obtener_conteo(id_empresa, id_conteo)
+    if not conteo:
+        if request.is_json:
+            return jsonify({'success': False, 'message': 'Conteo no encontrado'}), 404
+        flash("Conteo no encontrado", "danger")
+        return redirect(url_for("inventario.conteos", id_empresa=id_empresa))
+
+    items, acumular = _leer_items_conteo()
+    registrados, error = registrar_conteos(conteo, items, acumular=acumular)
+
+    if request.is_json:
+        if error:
+            return jsonify({'success': False, 'message': error})
+        return jsonify({'success': True, 'registrados': registrados})
+
+    if error:
+        flash(error, "danger")
+    else:
+        flash(f"{registrados} productos registrados en el conteo ✅", "success")
+    return redirect(url_for("inventario.conteo", id_empresa=id_empresa, id_conteo=id_conteo))
+
+@inventario_bp.route("/conteo/<int:id_empresa>/<int:id_conteo>/cerrar", methods=["POST"])
+@login_required
+@verificar_acceso_empresa
+def cerrar(id_empresa, id_conteo):
+    """Conciliar el conteo y ajustar el stock"""
+    conteo = obtener_conteo(id_empresa, id_conteo)
+    if not conteo:
+        flash("Conteo no encontrado", "danger")
+        return redirect(url_for("inventario.conteos", id_empresa=id_empresa))
+
+    resumen, error = cerrar_conteo(conteo, session['usuario_id'])
+
+    if error:
+        flash(error, "danger")
+    else:
+        flash(
+            f"Conteo #{id_conteo} cerrado: {resumen['productos_ajustados']} de "
+            f"{resumen['productos_contados']} productos ajustados "
+            f"(+{resumen['unidades_entrada']} / -{resumen['unidades_salida']} unidades) ✅",
+            "success"
+        )
+    return redirect(url_for("inventario.conteo", id_empresa=id_empresa, id_conteo=id_conteo))
+
+@inventario_bp.route("/conteo/<int:id_empresa>/<int:id_conteo>/cancelar", methods=["POST"])
+@login_required
+@verificar_acceso_empresa
+def cancelar(id_empresa, id_conteo):
+    """Cancelar un conteo abierto"""
+    conteo = obtener_conteo(id_empresa, id_conteo)
+    if not conteo:
+        flash("Conteo no encontrado", "danger")
+        return redirect(url_for("inventario.conteos", id_empresa=id_empresa))
+
+    exito, error = cancelar_conteo(conteo)
+
+    if error:
+        flash(error, "danger")
+    else:
+        flash(f"Conteo #{id_conteo} cancelado", "info")
+    return redirect(url_for("inventario.conteos", id_empresa=id_empresa))
+
+# ----------------------------------------------------------------------
+# Kardex
+# ----------------------------------------------------------------------
+def _limite_pagina():
+    return max(1, min(request.args.get('limit', 100, type=int), 1000))
+
+@inventario_bp.route("/kardex/<int:id_empresa>")
+@login_required
+@verificar_acceso_empresa
+def kardex_empresa(id_empresa):
+    """Movimientos de todos los productos con su saldo"""
+    fecha_desde = request.args.get('desde')
+    fecha_hasta = request.args.get('hasta')
+
+    kardex, error = obtener_kardex_empresa(
+        id_empresa, fecha_desde, fecha_hasta,
+        cursor=request.args.get('cursor'),
+        limit=_limite_pagina()
+    )
+    if error:
+        flash(error, "danger")
+        kardex = {'movimientos': [], 'siguiente': None}
+
+    return render_template("inventario/kardex.html",
+                         kardex=kardex,
+                         producto=None,
+                         fecha_desde=fecha_desde,
+                         fecha_hasta=fecha_hasta,
+                         id_empresa=id_empresa)
+
+@inventario_bp.route("/kardex/<int:id_empresa>/<string:id_producto>")
+@login_required
+@verificar_acceso_empresa
+def kardex_producto(id_empresa, id_producto):
+    """Kardex de un producto"""
+    kardex, error = obtener_kardex_producto(
+        id_empresa, id_producto,
+        cursor=request.args.get('cursor'),
+        limit=_limite_pagina()
+    )
+    if error:
+        flash(error, "danger")
+        return redirect(url_for("producto.listar", id_empresa=id_empresa))
+
+    return render_template("inventario/kardex.html",
+                         kardex=kardex,
+                         producto=kardex['producto'],
+                         fecha_desde=None,
+                         fecha_hasta=None,
+                         id_empresa=id_empresa)
+
+@inventario_bp.route("/api/kardex/<int:id_empresa>")
+@login_required
+@verificar_acceso_empresa
+def api_kardex_empresa(id_empresa):
+    """Página del kardex de la empresa en JSON"""
+    kardex, error = obtener_kardex_empresa(
+        id_empresa,
+        request.args.get('desde'),
+        request.args.get('hasta'),
+        cursor=request.args.get('cursor'),
+        limit=_limite_pagina()
+    )
+    if error:
+        return jsonify({'error': error}), 400
+    return jsonify(kardex)
+
+@inventario_bp.route("/api/kardex/<int:id_empresa>/<string:id_producto>")
+@login_required
+@verificar_acceso_empresa
+def api_kardex_producto(id_empresa, id_producto):
+    """Página del kardex de un producto en JSON"""
+    kardex, error = obtener_kardex_producto(
+        id_empresa, id_producto,
+        cursor=request.args.get('cursor'),
+        limit=_limite_pagina()
+    )
+    if error:
+        return jsonify({'error': error}), 404
+    return jsonify({
+        'id_producto': kardex['producto'].id_producto,
+        'movimientos': kardex['movimientos'],
+        'siguiente': kardex['siguiente']
+    })
+
+@inventario_bp.route("/api/kardex/<int:id_empresa>/<string:id_producto>/exportar")
+@login_required
+@verificar_acceso_empresa
+def exportar_kardex_producto(id_empresa, id_producto):
+    """Kardex completo del producto en JSON Lines, transmitido página por página"""
+    def generar():
+        cursor = None
+        while True:
+            kardex, error = obtener_kardex_producto(id_empresa, id_producto, cursor=cursor, limit=1000)
+            if error:
+                yield json.dumps({'error': error}) + "\n"
+                return
+            for movimiento in kardex['movimientos']:
+                yield json.dumps(movimiento) + "\n"
+            cursor = kardex['siguiente']
+            if not cursor:
+                return
+
+    return Response(stream_with_context(generar()), mimetype="application/x-ndjson")
+
+# ----------------------------------------------------------------------
+# Stock histórico
+# ----------------------------------------------------------------------
+@inventario_bp.route("/api/stock_historico/<int:id_empresa>")
+@login_required
+@verificar_acceso_empresa
+def api_stock_historico(id_empresa):
+    """Stock de los productos en una fecha pasada (?fecha=AAAA-MM-DD[ HH:MM:SS]&producto=ID)"""
+    fecha = request.args.get('fecha', '').strip()
+    if not fecha:
+        return jsonify({'error': 'Debe indicar la fecha'}), 400
+    try:
+        if len(fecha) == 10:
+            # Stock al final del día: movimientos anteriores al día siguiente
+            fecha = (datetime.strptime(fecha, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d 00:00:00")
+        else:
+            fecha = datetime.strptime(fecha, "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return jsonify({'error': 'Formato de fecha inválido'}), 400
+
+    filas, error = obtener_stock_en_fecha(id_empresa, fecha, request.args.get('producto'))
+    if error:
+        return jsonify({'error': error}), 400
+
+    return jsonify({
+        'fecha': fecha,
+        'productos': [{
+            'id_producto': f.id_producto,
+            'nombre': f.nombre,
+            'stock': int(f.stock)
+        } for f in filas]
+    })
@@ -7,8 +7,10 @@ from app.controllers.producto_controller import (
     obtener_producto,
     actualizar_producto,
     eliminar_producto,
-    buscar_productos
+    buscar_productos,
+    actualizar_stock
 )
+from app.controllers.inventario_controller import obtener_movimientos_recientes
 
 producto_bp = Blueprint("producto", __name__, url_prefix="/producto")
 
@@ -97,7 +99,8 @@ def ver(id_empresa, id_producto):
         flash("Producto no encontrado", "danger")
         return redirect(url_for("producto.listar", id_empresa=id_empresa))
 
-    return render_template("productos/ver.html", producto=producto, id_empresa=id_empresa)
+    movimientos = obtener_movimientos_recientes(id_producto, limit=10)
+    return render_template("productos/ver.html", producto=producto, movimientos=movimientos, id_empresa=id_empresa)
 
 # ----------------------------------------------------------------------
 # Editar producto
@@ -163,6 +166,8 @@ def ajustar_stock(id_empresa, id_producto):
         flash("Producto no encontrado", "danger")
         return redirect(url_for("producto.listar", id_empresa=id_empresa))
 
+    movimientos = obtener_movimientos_recientes(id_producto, limit=5)
+
     if request.method == "POST":
         try:
             nuevo_stock = int(request.form.get("nuevo_stock", 0))
@@ -170,19 +175,18 @@ def ajustar_stock(id_empresa, id_producto):
             
             if nuevo_stock < 0:
                 flash("El stock no puede ser negativo", "danger")
-                return render_template("productos/ajustar_stock.html", producto=producto, id_empresa=id_empresa)
+                return render_template("productos/ajustar_stock.html", producto=producto, movimientos=movimientos, id_empresa=id_empresa)
             
             if not motivo:
                 flash("Debes especificar un motivo para el ajuste", "danger")
-                return render_template("productos/ajustar_stock.html", producto=producto, id_empresa=id_empresa)
+                return render_template("productos/ajustar_stock.html", producto=producto, movimientos=movimientos, id_empresa=id_empresa)
             
-            # Aquí podrías registrar el movimiento de inventario
             stock_anterior = producto.stock
-            producto.stock = nuevo_stock
+            exito, error = actualizar_stock(id_empresa, id_producto, nuevo_stock, motivo)
             
-            # Guardar cambios (esto debería estar en el controller)
-            from app.models import db
-            db.session.commit()
+            if error:
+                flash(error, "danger")
+                return render_template("productos/ajustar_stock.html", producto=producto, movimientos=movimientos, id_empresa=id_empresa)
             
             flash(f"Stock ajustado: {stock_anterior} → {nuevo_stock}. Motivo: {motivo} ✅", "success")
             return redirect(url_for("producto.ver", id_empresa=id_empresa, id_producto=id_producto))
@@ -192,7 +196,7 @@ def ajustar_stock(id_empresa, id_producto):
         except Exception as e:
             flash(f"Error al ajustar stock: {str(e)}", "danger")
 
-    return render_template("productos/ajustar_stock.html", producto=producto, id_empresa=id_empresa)
+    return render_template("productos/ajustar_stock.html", producto=producto, movimientos=movimientos, id_empresa=id_empresa)
 
 # ----------------------------------------------------------------------
 # Productos con stock bajo
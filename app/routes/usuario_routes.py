@@ -1,5 +1,6 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, session
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session, make_response
 from app.schemas.usuario_schema import UsuarioForm
+from app.limites import consumir_intento_login
 from app.controllers.usuario_controller import (
     crear_usuario,
     autenticar_usuario,
@@ -30,7 +31,7 @@ def registrar_usuario(id_empresa):
         if error:
             flash(error, "danger")
         else:
-            flash("Usuario registrado con éxito ✅", "success")
+            flash("Usuario registrado con éxito ✅ Inicia sesión con el NIT de tu empresa", "success")
             return redirect(url_for("usuario.login"))
 
     else:
@@ -45,15 +46,24 @@ def registrar_usuario(id_empresa):
 # ----------------------------------------------------------------------
 @usuario_bp.route("/login", methods=["GET", "POST"])
 def login():
+    # El NIT de la empresa se recuerda en el equipo para no escribirlo cada vez
+    nit = request.form.get("nit") or request.cookies.get("nit_empresa", "")
+
     if request.method == "POST":
         nom_usuario = request.form.get("nom_usuario")
         contrasena = request.form.get("contrasena")
 
-        usuario, error = autenticar_usuario(nom_usuario, contrasena)
+        # Se descuenta el intento antes de consultar la BD o calcular bcrypt
+        permitido, espera = consumir_intento_login(nit, nom_usuario)
+        if not permitido:
+            flash(f"Demasiados intentos de inicio de sesión. Intenta de nuevo en {espera} segundos ⏳", "warning")
+            return render_template("login.html", nit=nit), 429
+
+        usuario, error = autenticar_usuario(nit, nom_usuario, contrasena)
 
         if error:  
             flash(error, "danger")  # ← Usa el mensaje que viene de tu controller ("Usuario no encontrado" o "Contraseña incorrecta")
-            return render_template("login.html")
+            return render_template("login.html", nit=nit)
 
         # Si todo bien → guardar sesión
         session["usuario_id"] = usuario.id_usuario
@@ -62,9 +72,11 @@ def login():
         session["nom_usuario"] = usuario.nom_usuario 
 
         flash("Inicio de sesión exitoso ✅", "success")
-        return redirect(url_for("usuario.listar", id_empresa=session["empresa_id"]))
+        respuesta = make_response(redirect(url_for("usuario.listar", id_empresa=session["empresa_id"])))
+        respuesta.set_cookie("nit_empresa", nit.strip(), max_age=60 * 60 * 24 * 365, httponly=True, samesite="Lax")
+        return respuesta
 
-    return render_template("login.html")
+    return render_template("login.html", nit=nit)
 
 
 # ----------------------------------------------------------------------
@@ -96,13 +108,17 @@ def editar(id_empresa, id_usuario):
     form = UsuarioForm(obj=usuario)
 
     if form.validate_on_submit():
-        actualizar_usuario(
+        _, error = actualizar_usuario(
             usuario,
             nom_usuario=form.nom_usuario.data,
             contrasena=form.contrasena.data,
             correo_recuperacion=form.correo_recuperacion.data,
             rol=form.rol.data
         )
+        if error:
+            flash(error, "danger")
+            return render_template("usuarios/editar.html", form=form, usuario=usuario, id_empresa=id_empresa)
+
         flash("Usuario actualizado con éxito ✅", "success")
         return redirect(url_for("usuario.listar", id_empresa=id_empresa))
 
@@ -158,13 +174,16 @@ def editar_perfil():
     form = UsuarioForm(obj=usuario)
     
     if form.validate_on_submit():
-        actualizar_usuario(
+        _, error = actualizar_usuario(
             usuario,
             nom_usuario=form.nom_usuario.data,
             contrasena=form.contrasena.data if form.contrasena.data else None,
             correo_recuperacion=form.correo_recuperacion.data,
             rol=form.rol.data
         )
+        if error:
+            flash(error, "danger")
+            return render_template("usuarios/editar_perfil.html", form=form, usuario=usuario)
         
         # Actualizar session si cambió el nombre
         session['nom_usuario'] = form.nom_usuario.data
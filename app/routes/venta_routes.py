@@ -6,15 +6,30 @@ from app.controllers.venta_controller import (
     listar_ventas,
     obtener_venta,
     anular_venta,
+    devolver_venta,
+    obtener_devoluciones_venta,
     obtener_productos_disponibles,
     buscar_producto_venta,
     calcular_venta,
     obtener_metodos_pago,
+    metodo_pago_valido,
     crear_metodo_pago,
     actualizar_metodo_pago,
+    cambiar_estado_metodo_pago,
     eliminar_metodo_pago,
     obtener_resumen_ventas_hoy
 )
+from app.controllers.reserva_controller import obtener_reservas_activas
+from app.controllers.empresa_controller import obtener_empresa
+from app.replica import solo_lectura
+from app.detector_sql import presupuesto_sql
+from app.controllers.carrito_controller import (
+    obtener_carrito,
+    actualizar_item_carrito,
+    fijar_descuento_carrito,
+    vaciar_carrito,
+    cobrar_carrito
+)
 
 venta_bp = Blueprint("venta", __name__, url_prefix="/venta")
 
@@ -72,20 +87,38 @@ def procesar_venta(id_empresa):
         items = data.get('items', [])
         metodo_pago = data.get('metodo_pago')
         descuento = float(data.get('descuento', 0))
+        id_carrito = data.get('carrito')
+        
+        # Un carrito de otra empresa se ignora: sus reservas no se tocan
+        if id_carrito and not obtener_carrito(id_empresa, id_carrito):
+            id_carrito = None
         
-        if not items:
+        if not items and not id_carrito:
             return jsonify({'success': False, 'message': 'No hay productos en la venta'})
         
         if not metodo_pago:
             return jsonify({'success': False, 'message': 'Debe seleccionar un método de pago'})
         
-        venta, error = crear_venta(
-            items=items,
-            metodo_pago=metodo_pago,
-            descuento=descuento,
-            id_empresa=id_empresa,
-            id_usuario=session['usuario_id']
-        )
+        if not metodo_pago_valido(id_empresa, metodo_pago):
+            return jsonify({'success': False, 'message': 'El método de pago no está disponible'})
+        
+        if items:
+            venta, error = crear_venta(
+                items=items,
+                metodo_pago=metodo_pago,
+                descuento=descuento,
+                id_empresa=id_empresa,
+                id_usuario=session['usuario_id'],
+                id_carrito=id_carrito
+            )
+        else:
+            # Carrito armado en el servidor: se cobra tal cual está
+            venta, error = cobrar_carrito(
+                id_empresa=id_empresa,
+                id_carrito=id_carrito,
+                metodo_pago=metodo_pago,
+                id_usuario=session['usuario_id']
+            )
         
         if error:
             return jsonify({'success': False, 'message': error})
@@ -115,20 +148,130 @@ def buscar_producto(id_empresa):
     
     productos = buscar_producto_venta(id_empresa, termino)
     
-    return jsonify([{
-        'id_producto': p.id_producto,
-        'nombre': p.nombre,
-        'precio': p.precio,
-        'stock': p.stock,
-        'disponible': p.stock > 0
-    } for p in productos])
+    # El stock mostrado descuenta lo apartado por otros carritos abiertos
+    reservadas = obtener_reservas_activas(
+        [p.id_producto for p in productos],
+        excluir_carrito=request.args.get('carrito')
+    )
+    
+    resultado = []
+    for p in productos:
+        stock = p.stock - reservadas.get(p.id_producto, 0)
+        resultado.append({
+            'id_producto': p.id_producto,
+            'nombre': p.nombre,
+            'precio': p.precio,
+            'stock': max(stock, 0),
+            'stock_total': p.stock,
+            'disponible': stock > 0
+        })
+    return jsonify(resultado)
+
+# ----------------------------------------------------------------------
+# Carrito del POS (precios y totales en el servidor)
+# ----------------------------------------------------------------------
+@venta_bp.route("/api/carrito/<int:id_empresa>")
+@login_required
+@verificar_acceso_empresa
+def api_carrito(id_empresa):
+    """Líneas y totales del carrito abierto"""
+    id_carrito = request.args.get('carrito', '')
+    carrito = obtener_carrito(id_empresa, id_carrito)
+    
+    if not carrito:
+        return jsonify({
+            'items': [],
+            'totales': {'cantidad_total': 0, 'subtotal': 0, 'descuento_porcentaje': 0, 'descuento_valor': 0, 'total': 0}
+        })
+    
+    reservadas = obtener_reservas_activas(
+        [item.id_producto for item in carrito.items],
+        excluir_carrito=id_carrito
+    )
+    
+    descuento_valor = (carrito.subtotal * carrito.descuento / 100) if carrito.descuento > 0 else 0
+    return jsonify({
+        'items': [{
+            'id_producto': item.id_producto,
+            'nombre': item.producto.nombre,
+            'cantidad': item.cantidad,
+            'precio_unitario': item.precio_unitario,
+            'subtotal': item.subtotal,
+            'stock_disponible': item.producto.stock - reservadas.get(item.id_producto, 0)
+        } for item in carrito.items],
+        'totales': {
+            'cantidad_total': carrito.cantidad,
+            'subtotal': carrito.subtotal,
+            'descuento_porcentaje': carrito.descuento,
+            'descuento_valor': descuento_valor,
+            'total': int(carrito.subtotal - descuento_valor)
+        }
+    })
+
+@venta_bp.route("/api/carrito/<int:id_empresa>/item", methods=["POST"])
+@login_required
+@verificar_acceso_empresa
+def api_carrito_item(id_empresa):
+    """Cambiar una línea del carrito: {carrito, id_producto, delta} o {carrito, id_producto, cantidad}"""
+    data = request.get_json() or {}
+    
+    resultado, error = actualizar_item_carrito(
+        id_empresa=id_empresa,
+        id_carrito=data.get('carrito'),
+        id_producto=data.get('id_producto'),
+        id_usuario=session['usuario_id'],
+        cantidad=data.get('cantidad'),
+        delta=data.get('delta')
+    )
+    
+    if error:
+        respuesta = {'success': False, 'message': error}
+        if resultado:
+            respuesta['disponible'] = resultado['disponible']
+        return jsonify(respuesta)
+    
+    resultado['success'] = True
+    return jsonify(resultado)
+
+@venta_bp.route("/api/carrito/<int:id_empresa>/descuento", methods=["POST"])
+@login_required
+@verificar_acceso_empresa
+def api_carrito_descuento(id_empresa):
+    """Cambiar el descuento del carrito"""
+    data = request.get_json() or {}
+    
+    totales, error = fijar_descuento_carrito(
+        id_empresa=id_empresa,
+        id_carrito=data.get('carrito'),
+        descuento=data.get('descuento', 0),
+        id_usuario=session['usuario_id']
+    )
+    
+    if error:
+        return jsonify({'success': False, 'message': error})
+    return jsonify({'success': True, 'totales': totales})
+
+@venta_bp.route("/api/carrito/<int:id_empresa>/vaciar", methods=["POST"])
+@login_required
+@verificar_acceso_empresa
+def api_carrito_vaciar(id_empresa):
+    """Vaciar el carrito y liberar sus reservas"""
+    data = request.get_json() or {}
+    
+    exito, error = vaciar_carrito(id_empresa, data.get('carrito'))
+    
+    if error:
+        return jsonify({'success': False, 'message': error})
+    return jsonify({'success': True})
 
 # ----------------------------------------------------------------------
 # Historial de Ventas
 # ----------------------------------------------------------------------
 @venta_bp.route("/historial/<int:id_empresa>")
+@presupuesto_sql(6)
 @login_required
 @verificar_acceso_empresa
+@solo_lectura
 def historial(id_empresa):
     """Ver historial de ventas"""
     fecha_desde = request.args.get('desde')
@@ -146,6 +289,7 @@ def historial(id_empresa):
 # Ver Detalle de Venta
 # ----------------------------------------------------------------------
 @venta_bp.route("/detalle/<int:id_empresa>/<int:id_venta>")
+@presupuesto_sql(8)
 @login_required
 @verificar_acceso_empresa
 def detalle(id_empresa, id_venta):
@@ -156,8 +300,12 @@ def detalle(id_empresa, id_venta):
         flash("Venta no encontrada", "danger")
         return redirect(url_for("venta.historial", id_empresa=id_empresa))
     
+    devoluciones, devuelto = obtener_devoluciones_venta(id_empresa, id_venta)
+    
     return render_template("ventas/detalle.html", 
                          venta=venta, 
+                         devoluciones=devoluciones,
+                         devuelto=devuelto,
                          id_empresa=id_empresa)
 
 # ----------------------------------------------------------------------
@@ -174,7 +322,7 @@ def anular(id_empresa, id_venta):
         flash("Debe especificar un motivo para anular la venta", "danger")
         return redirect(url_for("venta.detalle", id_empresa=id_empresa, id_venta=id_venta))
     
-    exito, error = anular_venta(id_venta, motivo, session['usuario_id'])
+    exito, error = anular_venta(id_empresa, id_venta, motivo, session['usuario_id'])
     
     if error:
         flash(error, "danger")
@@ -183,6 +331,36 @@ def anular(id_empresa, id_venta):
     
     return redirect(url_for("venta.historial", id_empresa=id_empresa))
 
+# ----------------------------------------------------------------------
+# Devolución parcial
+# ----------------------------------------------------------------------
+@venta_bp.route("/devolver/<int:id_empresa>/<int:id_venta>", methods=["POST"])
+@login_required
+@verificar_acceso_empresa
+def devolver(id_empresa, id_venta):
+    """Devolver parte de las unidades de una venta"""
+    motivo = request.form.get('motivo', '').strip()
+    
+    if not motivo:
+        flash("Debe especificar un motivo para la devolución", "danger")
+        return redirect(url_for("venta.detalle", id_empresa=id_empresa, id_venta=id_venta))
+    
+    # Un campo devolver_<id_detalle> por línea de la venta
+    cantidades = {
+        campo[len('devolver_'):]: valor
+        for campo, valor in request.form.items()
+        if campo.startswith('devolver_') and valor.strip()
+    }
+    
+    devolucion, error = devolver_venta(id_empresa, id_venta, cantidades, motivo, session['usuario_id'])
+    
+    if error:
+        flash(error, "danger")
+    else:
+        flash(f"Devolución registrada: {devolucion.cantidad} unidades, ${devolucion.total:,} reembolsados ✅", "success")
+    
+    return redirect(url_for("venta.detalle", id_empresa=id_empresa, id_venta=id_venta))
+
 # ----------------------------------------------------------------------
 # Gestión de Métodos de Pago
 # ----------------------------------------------------------------------
@@ -191,7 +369,16 @@ def anular(id_empresa, id_venta):
 @verificar_acceso_empresa
 def metodos_pago(id_empresa):
     """Gestionar métodos de pago"""
-    metodos = obtener_metodos_pago(id_empresa)
+    id_toggle = request.args.get('toggle', type=int)
+    if id_toggle:
+        activo, error = cambiar_estado_metodo_pago(id_empresa, id_toggle)
+        if error:
+            flash(error, "danger")
+        else:
+            flash(f"Método de pago {'activado' if activo else 'desactivado'} ✅", "success")
+        return redirect(url_for("venta.metodos_pago", id_empresa=id_empresa))
+    
+    metodos = obtener_metodos_pago(id_empresa, solo_activos=False)
     
     return render_template("ventas/metodos_pago.html", 
                          metodos=metodos, 
@@ -233,7 +420,7 @@ def crear_metodo(id_empresa):
 @verificar_acceso_empresa
 def editar_metodo(id_empresa, id_metodo):
     """Editar método de pago existente"""
-    metodo = next((m for m in obtener_metodos_pago(id_empresa) if m.id == id_metodo), None)
+    metodo = next((m for m in obtener_metodos_pago(id_empresa, solo_activos=False) if m.id == id_metodo), None)
     
     if not metodo:
         flash("Método de pago no encontrado", "danger")
@@ -243,6 +430,7 @@ def editar_metodo(id_empresa, id_metodo):
     
     if form.validate_on_submit():
         exito, error = actualizar_metodo_pago(
+            id_empresa,
             id_metodo,
             nombre=form.nombre.data,
             descripcion=form.descripcion.data,
@@ -255,7 +443,7 @@ def editar_metodo(id_empresa, id_metodo):
             flash("Método de pago actualizado exitosamente ✅", "success")
             return redirect(url_for("venta.metodos_pago", id_empresa=id_empresa))
     
-    return render_template("ventas/editar_metodo.html", 
+    return render_template("ventas/crear_metodo.html", 
                          form=form, 
                          metodo=metodo,
                          id_empresa=id_empresa)
@@ -268,7 +456,7 @@ def editar_metodo(id_empresa, id_metodo):
 @verificar_acceso_empresa
 def eliminar_metodo(id_empresa, id_metodo):
     """Eliminar método de pago"""
-    exito, error = eliminar_metodo_pago(id_metodo)
+    exito, error = eliminar_metodo_pago(id_empresa, id_metodo)
     
     if error:
         flash(error, "danger")
@@ -290,7 +478,7 @@ def api_calcular(id_empresa):
         items = data.get('items', [])
         descuento = float(data.get('descuento', 0))
         
-        resultado = calcular_venta(items, descuento)
+        resultado = calcular_venta(items, descuento, id_empresa)
         
         return jsonify(resultado)
         
@@ -301,8 +489,10 @@ def api_calcular(id_empresa):
 # Generar Factura
 # ----------------------------------------------------------------------
 @venta_bp.route("/factura/<int:id_empresa>/<int:id_venta>")
+@presupuesto_sql(8)
 @login_required
 @verificar_acceso_empresa
+@solo_lectura
 def generar_factura(id_empresa, id_venta):
     """Generar factura tipo POS"""
     venta = obtener_venta(id_empresa, id_venta)
@@ -311,13 +501,14 @@ def generar_factura(id_empresa, id_venta):
         flash("Venta no encontrada", "danger")
         return redirect(url_for("venta.historial", id_empresa=id_empresa))
     
-    # Información de la empresa (esto debería venir de la BD)
+    # Información de la empresa (nombre, NIT y teléfono desde la BD)
+    empresa = obtener_empresa(id_empresa)
     empresa_info = {
-        'nombre': 'SIIGO S.A.S',  # Cambiar por datos reales
-        'nit': '800200100-0',
+        'nombre': empresa.nombre if empresa else 'SIIGO S.A.S',
+        'nit': empresa.nit if empresa else '800200100-0',
         'direccion': 'Call 54 32 71',
         'ciudad': 'Bogotá',
-        'telefono': '41512108',
+        'telefono': empresa.telefono_contacto if empresa else '41512108',
         'resolucion': '191816549/8156',
         'fecha_autorizacion': '2019/01/22',
         'prefijo_desde': '1',
@@ -350,6 +541,7 @@ def generar_factura(id_empresa, id_venta):
 @venta_bp.route("/dashboard/<int:id_empresa>")
 @login_required
 @verificar_acceso_empresa
+@solo_lectura
 def dashboard(id_empresa):
     """Dashboard con estadísticas de ventas"""
     resumen_hoy = obtener_resumen_ventas_hoy(id_empresa)
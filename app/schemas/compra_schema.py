@@ -0,0 +1,52 @@
+from flask_wtf import FlaskForm
+from wtforms import StringField, IntegerField, SelectField, TextAreaField
+from wtforms.validators import DataRequired, Length, Optional, Email
+
+class ProveedorForm(FlaskForm):
+    id_proveedores = StringField(
+        'Código del Proveedor',
+        validators=[
+            DataRequired(message="El código del proveedor es obligatorio"),
+            Length(min=1, max=100, message="El código debe tener entre 1 y 100 caracteres")
+        ],
+        render_kw={"placeholder": "Ej: NIT o código interno"}
+    )
+
+    nombre = StringField(
+        'Nombre',
+        validators=[
+            DataRequired(message="El nombre es obligatorio"),
+            Length(min=2, max=100, message="El nombre debe tener entre 2 y 100 caracteres")
+        ]
+    )
+
+    telefono = IntegerField('Teléfono', validators=[Optional()])
+
+    correo = StringField(
+        'Correo',
+        validators=[Optional(), Email(message="Correo no válido"), Length(max=100)]
+    )
+
+    direccion = StringField('Dirección', validators=[Optional(), Length(max=100)])
+
+class CompraForm(FlaskForm):
+    id_proveedor = SelectField(
+        'Proveedor',
+        validators=[DataRequired(message="Debe seleccionar un proveedor")],
+        coerce=str
+    )
+
+    numero_factura = StringField(
+        'Número de Factura',
+        validators=[Optional(), Length(max=100)],
+        render_kw={"placeholder": "Factura o remisión del proveedor"}
+    )
+
+    lineas = TextAreaField(
+        'Productos Recibidos',
+        validators=[DataRequired(message="Debe indicar al menos un producto")],
+        render_kw={
+            "rows": 8,
+            "placeholder": "Una línea por producto: ID,cantidad,costo unitario\nPROD001,24,3500\nPROD002,12,8000"
+        }
+    )
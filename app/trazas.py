@@ -0,0 +1,401 @@
+import hmac
+import importlib
+import ipaddress
+import json
+import logging
+import os
+import pkgutil
+import queue
+import random
+import sys
+import threading
+import time
+import urllib.request
+from contextvars import ContextVar
+from functools import wraps
+from logging.handlers import RotatingFileHandler
+from flask import g, request, current_app, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# ----------------------------------------------------------------------
+# Trazas de requests: ruta -> controladores -> plantilla / SQL
+#
+# Un request muestreado genera un span por la ruta, uno por cada función
+# pública de app/controllers que se llame, uno por la plantilla y uno por
+# cada sentencia SQL. Los requests no muestreados solo pagan una lectura de
+# ContextVar por llamada.
+#
+# Muestreo: TRAZAS_MUESTREO (0 a 1) al inicio del request. Si llega la
+# cabecera `traceparent` (W3C) se conserva su trace_id, pero su marca de
+# muestreo solo se obedece si el request viene de un origen confiable: una
+# IP o red de TRAZAS_ORIGENES_CONFIABLES (la conexión directa, no
+# X-Forwarded-For) o la cabecera X-Trazas-Token igual a TRAZAS_TOKEN. Así
+# un cliente cualquiera no puede forzar trazas completas en cada request.
+# La respuesta devuelve `traceparent` y `X-Trace-Id` para ubicar la traza.
+#
+# Salida (TRAZAS_SALIDA): "archivo" escribe una línea JSON por span en
+# TRAZAS_ARCHIVO (un archivo por worker, con rotación); "otlp" envía lotes
+# OTLP/HTTP JSON a TRAZAS_OTLP_URL desde un hilo aparte (ver
+# `flask trazas colector`).
+# ----------------------------------------------------------------------
+SERVICIO = "compuspace"
+MAX_SQL = 500           # caracteres de cada sentencia que se guardan
+MAX_SPANS = 2000        # por traza; el resto se cuenta pero no se guarda
+
+_traza = ContextVar("traza", default=None)        # spans del request muestreado
+_span_actual = ContextVar("span_actual", default=None)
+
+_salida = {'tipo': None, 'url': None, 'archivo': None, 'logger': None, 'cola': None, 'pid': None}
+_candado = threading.Lock()
+
+def _nuevo_id(bytes_):
+    return "%0*x" % (bytes_ * 2, random.getrandbits(bytes_ * 8))
+
+class Span:
+    __slots__ = ("traza", "id", "padre", "nombre", "tipo", "inicio", "fin", "atributos", "error")
+
+    def __init__(self, traza, nombre, tipo, padre, atributos=None):
+        self.traza = traza
+        self.id = _nuevo_id(8)
+        self.padre = padre
+        self.nombre = nombre
+        self.tipo = tipo
+        self.inicio = time.time_ns()
+        self.fin = None
+        self.atributos = atributos or {}
+        self.error = None
+
+    def a_dict(self):
+        return {
+            'trace_id': self.traza['id'],
+            'span_id': self.id,
+            'parent_id': self.padre,
+            'nombre': self.nombre,
+            'tipo': self.tipo,
+            'inicio_ns': self.inicio,
+            'duracion_ms': round((self.fin - self.inicio) / 1e6, 3),
+            'atributos': self.atributos,
+            'error': self.error,
+        }
+
+def _abrir(nombre, tipo, atributos=None):
+    traza = _traza.get()
+    if traza is None:
+        return None, None
+    padre = _span_actual.get()
+    span = Span(traza, nombre, tipo, padre.id if padre else traza['padre_remoto'], atributos)
+    return span, _span_actual.set(span)
+
+def _cerrar(span, token, error=None):
+    span.fin = time.time_ns()
+    if error is not None:
+        span.error = f"{type(error).__name__}: {error}"
+    _span_actual.reset(token)
+    traza = span.traza
+    if len(traza['spans']) < MAX_SPANS:
+        traza['spans'].append(span)
+    else:
+        traza['descartados'] += 1
+
+# ----------------------------------------------------------------------
+# Ruta
+# ----------------------------------------------------------------------
+def _leer_traceparent(valor):
+    """00-<trace_id 32 hex>-<span_id 16 hex>-<flags>"""
+    partes = (valor or "").strip().split("-")
+    if len(partes) != 4 or len(partes[1]) != 32 or len(partes[2]) != 16:
+        return None
+    try:
+        int(partes[1], 16), int(partes[2], 16), int(partes[3], 16)
+    except ValueError:
+        return None
+    return partes[1], partes[2], int(partes[3], 16) & 1
+
+def _leer_origenes(valor):
+    """Lista de IPs o redes separadas por coma ("10.0.0.0/8, 127.0.0.1")"""
+    redes = []
+    for parte in (valor or "").split(","):
+        if parte.strip():
+            redes.append(ipaddress.ip_network(parte.strip(), strict=False))
+    return redes
+
+def _origen_confiable():
+    token = current_app.config['TRAZAS_TOKEN']
+    if token and hmac.compare_digest(request.headers.get("X-Trazas-Token", ""), token):
+        return True
+    redes = current_app.config['TRAZAS_ORIGENES_CONFIABLES']
+    if not redes or not request.remote_addr:
+        return False
+    try:
+        ip = ipaddress.ip_address(request.remote_addr)
+    except ValueError:
+        return False
+    return any(ip in red for red in redes)
+
+def _antes_request():
+    remoto = _leer_traceparent(request.headers.get("traceparent"))
+    if remoto:
+        trace_id, padre_remoto, muestreado = remoto
+        if not _origen_confiable():
+            muestreado = random.random() < current_app.config['TRAZAS_MUESTREO']
+    else:
+        trace_id, padre_remoto = _nuevo_id(16), None
+        muestreado = random.random() < current_app.config['TRAZAS_MUESTREO']
+
+    g._traza_id = trace_id
+    if not muestreado:
+        return
+
+    traza = {'id': trace_id, 'padre_remoto': padre_remoto, 'spans': [], 'descartados': 0}
+    g._traza_tokens = (_traza.set(traza),)
+    span, token = _abrir(f"{request.method} {request.url_rule.rule if request.url_rule else request.path}", "ruta", {
+        'http.method': request.method,
+        'http.path': request.path,
+        'endpoint': request.endpoint,
+    })
+    g._traza_span = (span, token)
+
+def _despues_request(respuesta):
+    trace_id = g.get('_traza_id')
+    if trace_id:
+        span = g.get('_traza_span', (None, None))[0]
+        flags = "01" if span else "00"
+        span_id = span.id if span else _nuevo_id(8)
+        respuesta.headers["traceparent"] = f"00-{trace_id}-{span_id}-{flags}"
+        respuesta.headers["X-Trace-Id"] = trace_id
+        if span:
+            span.atributos['http.status_code'] = respuesta.status_code
+    return respuesta
+
+def _fin_request(excepcion):
+    span, token = g.pop('_traza_span', (None, None))
+    tokens = g.pop('_traza_tokens', None)
+    if span is None:
+        return
+
+    _cerrar(span, token, excepcion)
+    traza = span.traza
+    _traza.reset(tokens[0])
+
+    if traza['descartados']:
+        span.atributos['spans_descartados'] = traza['descartados']
+    _exportar(traza['spans'])
+
+# ----------------------------------------------------------------------
+# Controladores
+# ----------------------------------------------------------------------
+def trazar(nombre):
+    """
+    Decorador: span de tipo "controlador" si el request está muestreado
+    """
+    def decorador(funcion):
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if _traza.get() is None:
+                return funcion(*args, **kwargs)
+            span, token = _abrir(nombre, "controlador")
+            try:
+                resultado = funcion(*args, **kwargs)
+            except Exception as e:
+                _cerrar(span, token, e)
+                raise
+            # Los controladores informan errores como (None, "mensaje")
+            if isinstance(resultado, tuple) and len(resultado) == 2 and isinstance(resultado[1], str):
+                span.atributos['error_controlador'] = resultado[1][:200]
+            _cerrar(span, token)
+            return resultado
+        envoltura._trazada = True
+        return envoltura
+    return decorador
+
+def _instrumentar_controladores():
+    """
+    Envolver las funciones públicas de cada módulo de app/controllers y
+    reemplazarlas también en los módulos de la app que ya las importaron
+    """
+    import app.controllers as paquete
+
+    reemplazos = {}
+    for info in pkgutil.iter_modules(paquete.__path__):
+        modulo = importlib.import_module(f"{paquete.__name__}.{info.name}")
+        for nombre, valor in list(vars(modulo).items()):
+            if (
+                nombre.startswith("_")
+                or not callable(valor)
+                or isinstance(valor, type)
+                or getattr(valor, "__module__", None) != modulo.__name__
+                or getattr(valor, "_trazada", False)
+            ):
+                continue
+            envuelta = trazar(f"{info.name}.{nombre}")(valor)
+            setattr(modulo, nombre, envuelta)
+            reemplazos[id(valor)] = envuelta
+
+    for nombre_modulo, modulo in list(sys.modules.items()):
+        if modulo is None or not (nombre_modulo == "app" or nombre_modulo.startswith("app.")):
+            continue
+        for nombre, valor in list(vars(modulo).items()):
+            if id(valor) in reemplazos and reemplazos[id(valor)] is not valor:
+                setattr(modulo, nombre, reemplazos[id(valor)])
+
+# ----------------------------------------------------------------------
+# Plantillas y SQL
+# ----------------------------------------------------------------------
+def _antes_plantilla(app, template, context, **extra):
+    span, token = _abrir(f"render {template.name}", "plantilla")
+    if span is not None:
+        g._traza_plantilla = (span, token)
+
+def _plantilla_lista(app, template, context, **extra):
+    if has_request_context():
+        span, token = g.pop('_traza_plantilla', (None, None))
+        if span is not None:
+            _cerrar(span, token)
+
+def _antes_sql(conexion, cursor, sentencia, parametros, contexto, varias):
+    span, token = _abrir("sql", "sql", {'db.statement': sentencia[:MAX_SQL], 'db.system': conexion.dialect.name})
+    if span is not None:
+        contexto._traza_sql = (span, token)
+
+def _despues_sql(conexion, cursor, sentencia, parametros, contexto, varias):
+    span, token = getattr(contexto, '_traza_sql', (None, None))
+    if span is not None:
+        span.atributos['db.filas'] = cursor.rowcount
+        _cerrar(span, token)
+        contexto._traza_sql = (None, None)
+
+def _error_sql(contexto_excepcion):
+    contexto = contexto_excepcion.execution_context
+    span, token = getattr(contexto, '_traza_sql', (None, None)) if contexto else (None, None)
+    if span is not None:
+        _cerrar(span, token, contexto_excepcion.original_exception)
+        contexto._traza_sql = (None, None)
+
+# ----------------------------------------------------------------------
+# Salida
+# ----------------------------------------------------------------------
+def _a_otlp(spans):
+    tipos = {'ruta': 2, 'sql': 3}  # SERVER, CLIENT; el resto INTERNAL
+
+    def atributo(clave, valor):
+        if isinstance(valor, bool):
+            return {'key': clave, 'value': {'boolValue': valor}}
+        if isinstance(valor, int):
+            return {'key': clave, 'value': {'intValue': str(valor)}}
+        return {'key': clave, 'value': {'stringValue': str(valor)}}
+
+    return {'resourceSpans': [{
+        'resource': {'attributes': [atributo('service.name', SERVICIO)]},
+        'scopeSpans': [{
+            'scope': {'name': 'app.trazas'},
+            'spans': [{
+                'traceId': s.traza['id'],
+                'spanId': s.id,
+                'parentSpanId': s.padre or "",
+                'name': s.nombre,
+                'kind': tipos.get(s.tipo, 1),
+                'startTimeUnixNano': str(s.inicio),
+                'endTimeUnixNano': str(s.fin),
+                'attributes': [atributo('tipo', s.tipo)] + [atributo(k, v) for k, v in s.atributos.items() if v is not None],
+                'status': {'code': 2, 'message': s.error} if s.error else {'code': 0},
+            } for s in spans],
+        }],
+    }]}
+
+def _enviar_otlp(url, cola):
+    while True:
+        spans = cola.get()
+        lote = list(spans)
+        # Juntar lo que ya esté esperando en un solo envío
+        while len(lote) < 1000:
+            try:
+                lote.extend(cola.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            peticion = urllib.request.Request(
+                url, data=json.dumps(_a_otlp(lote)).encode("utf-8"),
+                headers={"Content-Type": "application/json"}, method="POST"
+            )
+            urllib.request.urlopen(peticion, timeout=5).read()
+        except Exception as e:
+            print(f"Error al enviar trazas: {str(e)}")
+
+def _preparar_salida():
+    """Hilo de envío o archivo propio de cada worker (después del fork)"""
+    if _salida['tipo'] == "otlp":
+        _salida['cola'] = queue.Queue(maxsize=1000)
+        threading.Thread(
+            target=_enviar_otlp, args=(_salida['url'], _salida['cola']),
+            name="envio-trazas", daemon=True
+        ).start()
+    else:
+        base, extension = os.path.splitext(_salida['archivo']['ruta'])
+        manejador = RotatingFileHandler(
+            f"{base}.{os.getpid()}{extension or '.jsonl'}",
+            maxBytes=_salida['archivo']['max_bytes'],
+            backupCount=_salida['archivo']['respaldos']
+        )
+        logger = logging.getLogger(f"app.trazas.{os.getpid()}")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        logger.handlers[:] = [manejador]
+        _salida['logger'] = logger
+
+def _exportar(spans):
+    if not spans:
+        return
+    if _salida['pid'] != os.getpid():
+        with _candado:
+            if _salida['pid'] != os.getpid():
+                _preparar_salida()
+                _salida['pid'] = os.getpid()
+
+    if _salida['tipo'] == "otlp":
+        try:
+            _salida['cola'].put_nowait(spans)
+        except queue.Full:
+            pass  # Si el colector no da abasto se pierden trazas, no requests
+    else:
+        for span in spans:
+            _salida['logger'].info(json.dumps(span.a_dict(), ensure_ascii=False))
+
+def iniciar_trazas(app):
+    """
+    Configurar muestreo y salida, y conectar rutas, controladores,
+    plantillas y SQL
+    """
+    app.config.setdefault('TRAZAS_MUESTREO', float(os.getenv("TRAZAS_MUESTREO", 0)))
+    app.config.setdefault('TRAZAS_SALIDA', os.getenv("TRAZAS_SALIDA", "archivo"))
+    app.config.setdefault('TRAZAS_ARCHIVO', os.getenv("TRAZAS_ARCHIVO", "trazas.jsonl"))
+    app.config.setdefault('TRAZAS_MAX_BYTES', int(os.getenv("TRAZAS_MAX_BYTES", 10 * 1024 * 1024)))
+    app.config.setdefault('TRAZAS_ARCHIVOS', int(os.getenv("TRAZAS_ARCHIVOS", 5)))
+    app.config.setdefault('TRAZAS_OTLP_URL', os.getenv("TRAZAS_OTLP_URL", "http://127.0.0.1:4318/v1/traces"))
+    # Quién puede decidir el muestreo con `traceparent`
+    app.config.setdefault('TRAZAS_ORIGENES_CONFIABLES', _leer_origenes(os.getenv("TRAZAS_ORIGENES_CONFIABLES")))
+    app.config.setdefault('TRAZAS_TOKEN', os.getenv("TRAZAS_TOKEN"))
+
+    # El archivo o el hilo de envío se crean con la primera traza del worker
+    _salida['tipo'] = app.config['TRAZAS_SALIDA']
+    _salida['url'] = app.config['TRAZAS_OTLP_URL']
+    _salida['archivo'] = {
+        'ruta': app.config['TRAZAS_ARCHIVO'],
+        'max_bytes': app.config['TRAZAS_MAX_BYTES'],
+        'respaldos': app.config['TRAZAS_ARCHIVOS'],
+    }
+    _salida['pid'] = None
+
+    app.before_request(_antes_request)
+    app.after_request(_despues_request)
+    app.teardown_request(_fin_request)
+
+    before_render_template.connect(_antes_plantilla, app)
+    template_rendered.connect(_plantilla_lista, app)
+
+    if not event.contains(Engine, "before_cursor_execute", _antes_sql):
+        event.listen(Engine, "before_cursor_execute", _antes_sql)
+        event.listen(Engine, "after_cursor_execute", _despues_sql)
+        event.listen(Engine, "handle_error", _error_sql)
+
+    _instrumentar_controladores()
@@ -0,0 +1,144 @@
+"""
+Benchmark de arranque de workers.
+
+Mide, en procesos nuevos:
+  - importación de main (create_app + blueprints) y conexiones a la BD que
+    se abren durante esa importación (deben ser 0 para usar preload_app);
+  - worker con preload_app: fork del proceso ya cargado hasta responder el
+    primer request;
+  - worker sin preload: proceso nuevo que importa la app y responde el
+    primer request;
+  - opcionalmente (--gunicorn) gunicorn real hasta que responde por HTTP.
+
+Uso:
+    python benchmarks/arranque.py --repeticiones 5
+    python benchmarks/arranque.py --gunicorn
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEDIR_IMPORTACION = """
+import json, sys, time
+sys.path.insert(0, {raiz!r})
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+conexiones = []
+event.listen(Pool, "connect", lambda *a: conexiones.append(1))
+inicio = time.perf_counter()
+import main
+print(json.dumps({{"importacion": time.perf_counter() - inicio, "conexiones": len(conexiones)}}))
+"""
+
+MEDIR_FORK = """
+import json, os, sys, time
+sys.path.insert(0, {raiz!r})
+import main
+lectura, escritura = os.pipe()
+inicio = time.perf_counter()
+pid = os.fork()
+if pid == 0:
+    os.close(lectura)
+    main.app.test_client().get("/usuario/login")
+    os.write(escritura, b"1")
+    os._exit(0)
+os.close(escritura)
+os.read(lectura, 1)
+listo = time.perf_counter() - inicio
+os.waitpid(pid, 0)
+print(json.dumps({{"fork_primer_request": listo}}))
+"""
+
+MEDIR_SIN_PRELOAD = """
+import json, sys, time
+inicio = time.perf_counter()
+sys.path.insert(0, {raiz!r})
+import main
+main.app.test_client().get("/usuario/login")
+print(json.dumps({{"proceso_primer_request": time.perf_counter() - inicio}}))
+"""
+
+
+def ejecutar(codigo, entorno):
+    salida = subprocess.run(
+        [sys.executable, "-c", codigo.format(raiz=RAIZ)],
+        env=entorno, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(salida.strip().splitlines()[-1])
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def medir_gunicorn(entorno):
+    puerto = puerto_libre()
+    entorno = dict(entorno, PORT=str(puerto), WEB_CONCURRENCY=entorno.get("WEB_CONCURRENCY", "2"))
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "main:app"],
+        cwd=RAIZ, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - inicio < 30:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{puerto}/usuario/login", timeout=1).read()
+                return time.perf_counter() - inicio
+            except OSError:
+                time.sleep(0.02)
+        return None
+    finally:
+        proceso.terminate()
+        proceso.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--gunicorn", action="store_true", help="medir también gunicorn real")
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    entorno = dict(os.environ)
+    entorno["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_arranque.db')}"
+
+    # El esquema sale de las migraciones, como en un despliegue
+    subprocess.run(
+        [sys.executable, "-m", "flask", "--app", "main", "db", "upgrade"],
+        cwd=RAIZ, env=entorno, capture_output=True, check=True
+    )
+
+    resultados = {"importacion": [], "fork_primer_request": [], "proceso_primer_request": []}
+    conexiones = 0
+    for _ in range(args.repeticiones):
+        datos = ejecutar(MEDIR_IMPORTACION, entorno)
+        resultados["importacion"].append(datos["importacion"])
+        conexiones = max(conexiones, datos["conexiones"])
+        if hasattr(os, "fork"):
+            resultados["fork_primer_request"].extend(ejecutar(MEDIR_FORK, entorno).values())
+        resultados["proceso_primer_request"].extend(ejecutar(MEDIR_SIN_PRELOAD, entorno).values())
+
+    for nombre, valores in resultados.items():
+        if valores:
+            print(f"{nombre:24s} mediana={statistics.median(valores) * 1000:7.1f} ms  "
+                  f"max={max(valores) * 1000:7.1f} ms  (n={len(valores)})")
+    print(f"conexiones a la BD al importar: {conexiones}")
+
+    if args.gunicorn:
+        listo = medir_gunicorn(entorno)
+        print(f"gunicorn hasta el primer 200: {listo * 1000:.0f} ms" if listo else "gunicorn no respondió en 30 s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+"""
+Prueba de carga del POS por HTTP.
+
+Simula cajeros y gerentes concurrentes contra las rutas reales:
+  - cajero: inicia sesión (usuario.login) y luego, venta tras venta, busca
+    cada producto (venta.buscar_producto), recalcula el ticket
+    (venta.api_calcular) y cobra (venta.procesar_venta);
+  - gerente: inicia sesión y recarga venta.historial y venta.dashboard.
+
+Informa, por ruta, requests/s, latencia p50/p95/p99 y tasa de errores
+(HTTP >= 400, fallas de conexión o ventas rechazadas), y el total de
+ventas por segundo.
+
+Sin --url levanta su propio servidor: base SQLite temporal, migraciones,
+`flask datos generar` y gunicorn con la configuración del repo
+(WEB_CONCURRENCY, GUNICORN_THREADS, DB_POOL_*... se toman del entorno).
+Con --url apunta a un servidor ya corriendo cuyos datos salieron de
+`flask datos generar` (mismas --semilla y --empresas); ese servidor debe
+tener LOGIN_INTENTOS_IP alto, porque todas las terminales salen de la
+misma IP.
+
+Uso:
+    python benchmarks/carga_pos.py --cajeros 20 --gerentes 2 --duracion 60
+    WEB_CONCURRENCY=4 GUNICORN_THREADS=4 python benchmarks/carga_pos.py --pausa 0
+    python benchmarks/carga_pos.py --url http://127.0.0.1:8000 --empresas 10 --semilla 1
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from http.cookies import SimpleCookie
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TERMINOS = ("Arroz", "Café", "Cable", "Mouse", "Teclado", "Monitor", "Audífonos", "Cuaderno", "Jabón", "Gaseosa")
+METODO_PAGO = "💵 Efectivo"
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+
+def nit_sintetico(semilla, n):
+    # Mismo formato que app.datos_sinteticos.nit_sintetico
+    return f"SIM{semilla}-{n:05d}"
+
+
+class Resultados:
+    """Latencias y errores por ruta, compartidos por todas las terminales"""
+
+    def __init__(self):
+        self.candado = threading.Lock()
+        self.latencias = {}
+        self.errores = {}
+        self.ventas = 0
+        self.midiendo = False
+
+    def registrar(self, ruta, segundos, error, siempre=False):
+        if not (self.midiendo or siempre):
+            return
+        with self.candado:
+            self.latencias.setdefault(ruta, []).append(segundos)
+            if error:
+                errores = self.errores.setdefault(ruta, {})
+                errores[error] = errores.get(error, 0) + 1
+
+    def rechazo(self, ruta, motivo):
+        """Error de negocio en un request ya registrado con estado 200"""
+        if self.midiendo:
+            with self.candado:
+                errores = self.errores.setdefault(ruta, {})
+                errores[motivo] = errores.get(motivo, 0) + 1
+
+    def venta(self):
+        if self.midiendo:
+            with self.candado:
+                self.ventas += 1
+
+
+class Terminal:
+    """Cliente HTTP con su propia sesión (cookies) y conexión keep-alive"""
+
+    def __init__(self, url, resultados, timeout):
+        partes = urllib.parse.urlsplit(url)
+        clase = http.client.HTTPSConnection if partes.scheme == "https" else http.client.HTTPConnection
+        self.conexion = clase(partes.hostname, partes.port, timeout=timeout)
+        self.prefijo = partes.path.rstrip("/")
+        self.cookies = {}
+        self.resultados = resultados
+
+    def pedir(self, ruta, metodo, camino, cuerpo=None, json_=None, siempre=False):
+        """
+        (estado, cabeceras, cuerpo) o (None, None, None) si falló la conexión.
+        Con siempre=True se registra aunque sea durante el calentamiento.
+        """
+        cabeceras = {}
+        if self.cookies:
+            cabeceras["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        if json_ is not None:
+            cuerpo = json.dumps(json_)
+            cabeceras["Content-Type"] = "application/json"
+        elif cuerpo is not None:
+            cuerpo = urllib.parse.urlencode(cuerpo)
+            cabeceras["Content-Type"] = "application/x-www-form-urlencoded"
+
+        inicio = time.perf_counter()
+        for intento in range(2):
+            try:
+                self.conexion.request(metodo, self.prefijo + camino, body=cuerpo, headers=cabeceras)
+                respuesta = self.conexion.getresponse()
+                datos = respuesta.read()
+                break
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                # El worker cerró la conexión keep-alive: se reintenta una vez
+                self.conexion.close()
+                if intento:
+                    self.resultados.registrar(ruta, time.perf_counter() - inicio, "conexion", siempre)
+                    return None, None, None
+            except (OSError, http.client.HTTPException):
+                self.conexion.close()
+                self.resultados.registrar(ruta, time.perf_counter() - inicio, "conexion", siempre)
+                return None, None, None
+        duracion = time.perf_counter() - inicio
+
+        for valor in respuesta.headers.get_all("Set-Cookie") or []:
+            for nombre, morsel in SimpleCookie(valor).items():
+                self.cookies[nombre] = morsel.value
+
+        error = f"http_{respuesta.status}" if respuesta.status >= 400 else None
+        self.resultados.registrar(ruta, duracion, error, siempre)
+        return respuesta.status, respuesta.headers, datos
+
+    def iniciar_sesion(self, nit, nom_usuario, contrasena):
+        """id_empresa de la sesión, o None"""
+        # Los logins ocurren al arrancar: se miden aunque caigan en el calentamiento
+        estado, cabeceras, _ = self.pedir("usuario.login", "POST", "/usuario/login", cuerpo={
+            "nit": nit, "nom_usuario": nom_usuario, "contrasena": contrasena
+        }, siempre=True)
+        if estado != 302:
+            return None
+        # El login redirige a /usuario/listar/<id_empresa>
+        return int(cabeceras["Location"].rstrip("/").rsplit("/", 1)[-1])
+
+
+def cajero(args, resultados, fin, nit, nom_usuario, semilla):
+    azar = random.Random(semilla)
+    terminal = Terminal(args.url, resultados, args.timeout)
+    id_empresa = terminal.iniciar_sesion(nit, nom_usuario, args.contrasena)
+    if id_empresa is None:
+        print(f"No se pudo iniciar sesión como {nom_usuario} en {nit}", file=sys.stderr)
+        return
+
+    def pausa(media):
+        if media:
+            time.sleep(azar.expovariate(1 / media))
+
+    while not fin.is_set():
+        items = []
+        for _ in range(azar.randint(1, args.max_items)):
+            termino = urllib.parse.quote(azar.choice(TERMINOS))
+            estado, _, datos = terminal.pedir("venta.buscar_producto", "GET", f"/venta/buscar_producto/{id_empresa}?q={termino}")
+            if estado != 200:
+                continue
+            disponibles = [p for p in json.loads(datos) if p['disponible']]
+            if disponibles:
+                # Escanear de nuevo un producto suma una unidad a su línea
+                id_producto = azar.choice(disponibles)['id_producto']
+                linea = next((item for item in items if item['id_producto'] == id_producto), None)
+                if linea:
+                    linea['cantidad'] += 1
+                else:
+                    items.append({'id_producto': id_producto, 'cantidad': 1})
+                terminal.pedir("venta.api_calcular", "POST", f"/venta/api/calcular/{id_empresa}", json_={'items': items})
+            pausa(args.pausa)
+
+        if not items:
+            continue
+        estado, _, datos = terminal.pedir("venta.procesar_venta", "POST", f"/venta/procesar/{id_empresa}", json_={
+            'items': items, 'metodo_pago': METODO_PAGO
+        })
+        if estado == 200:
+            respuesta = json.loads(datos)
+            if respuesta.get('success'):
+                resultados.venta()
+            else:
+                # La ruta responde 200 aun cuando la venta se rechaza
+                resultados.rechazo("venta.procesar_venta", respuesta.get('message', 'rechazada')[:80])
+        pausa(args.pausa * 2)
+
+
+def gerente(args, resultados, fin, nit, semilla):
+    azar = random.Random(semilla)
+    terminal = Terminal(args.url, resultados, args.timeout)
+    id_empresa = terminal.iniciar_sesion(nit, "admin", args.contrasena)
+    if id_empresa is None:
+        print(f"No se pudo iniciar sesión como admin en {nit}", file=sys.stderr)
+        return
+
+    while not fin.is_set():
+        terminal.pedir("venta.historial", "GET", f"/venta/historial/{id_empresa}")
+        terminal.pedir("venta.dashboard", "GET", f"/venta/dashboard/{id_empresa}")
+        if args.pausa_gerente:
+            time.sleep(azar.expovariate(1 / args.pausa_gerente))
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def levantar_servidor(args):
+    """Base temporal con datos sintéticos y gunicorn; devuelve el proceso"""
+    entorno = dict(os.environ)
+    entorno.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'carga_pos.db')}")
+    entorno.setdefault("LOGIN_INTENTOS_IP", "100000")
+    entorno["FLASK_APP"] = "main"
+
+    def flask(*argumentos):
+        subprocess.run([sys.executable, "-m", "flask", *argumentos], cwd=RAIZ, env=entorno, check=True,
+                       stdout=subprocess.DEVNULL)
+
+    inicio = time.perf_counter()
+    flask("db", "upgrade")
+    flask("datos", "generar", "--empresas", str(args.empresas), "--usuarios", str(args.usuarios),
+          "--productos", str(args.productos), "--meses", str(args.meses), "--ventas-dia", str(args.ventas_dia),
+          "--semilla", str(args.semilla), "--contrasena", args.contrasena)
+    print(f"datos listos en {time.perf_counter() - inicio:.1f}s ({entorno['DATABASE_URL']})")
+
+    puerto = puerto_libre()
+    entorno["PORT"] = str(puerto)
+    proceso = subprocess.Popen([sys.executable, "-m", "gunicorn", "main:app"], cwd=RAIZ, env=entorno,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    args.url = f"http://127.0.0.1:{puerto}"
+    limite = time.perf_counter() + 30
+    while time.perf_counter() < limite:
+        try:
+            conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=1)
+            conexion.request("GET", "/usuario/login")
+            conexion.getresponse().read()
+            print(f"gunicorn en {args.url} (workers={entorno.get('WEB_CONCURRENCY', 2)}, "
+                  f"hilos={entorno.get('GUNICORN_THREADS', 4)})")
+            return proceso
+        except OSError:
+            time.sleep(0.1)
+    proceso.terminate()
+    sys.exit("gunicorn no respondió en 30 s")
+
+
+def informe(resultados, segundos):
+    filas = {}
+    total = errores_total = 0
+    print(f"\n{'ruta':36s} {'req':>7s} {'req/s':>8s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} {'max ms':>8s} {'error %':>8s}")
+    for ruta in sorted(resultados.latencias):
+        latencias = resultados.latencias[ruta]
+        errores = sum(resultados.errores.get(ruta, {}).values())
+        total += len(latencias)
+        errores_total += errores
+        fila = {
+            'requests': len(latencias),
+            'rps': round(len(latencias) / segundos, 2),
+            'p50_ms': round(percentil(latencias, 50) * 1000, 1),
+            'p95_ms': round(percentil(latencias, 95) * 1000, 1),
+            'p99_ms': round(percentil(latencias, 99) * 1000, 1),
+            'max_ms': round(max(latencias) * 1000, 1),
+            'errores': resultados.errores.get(ruta, {}),
+            'tasa_error': round(errores / len(latencias), 4),
+        }
+        filas[ruta] = fila
+        print(f"{ruta:36s} {fila['requests']:7d} {fila['rps']:8.1f} {fila['p50_ms']:8.1f} {fila['p95_ms']:8.1f} "
+              f"{fila['p99_ms']:8.1f} {fila['max_ms']:8.1f} {fila['tasa_error'] * 100:7.2f}%")
+
+    print(f"\n{total} requests en {segundos:.0f}s -> {total / segundos:.1f} req/s, "
+          f"errores {errores_total / max(total, 1) * 100:.2f}%")
+    print(f"ventas: {resultados.ventas} ({resultados.ventas / segundos:.2f}/s)")
+    for ruta, errores in resultados.errores.items():
+        for tipo, cantidad in errores.items():
+            print(f"  {ruta}: {tipo} x{cantidad}")
+
+    return {
+        'segundos': round(segundos, 1),
+        'requests': total,
+        'rps': round(total / segundos, 2),
+        'tasa_error': round(errores_total / max(total, 1), 4),
+        'ventas': resultados.ventas,
+        'ventas_por_segundo': round(resultados.ventas / segundos, 2),
+        'rutas': filas,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="servidor ya corriendo; sin esto se levanta uno")
+    parser.add_argument("--cajeros", type=int, default=10, help="terminales de caja simultáneas")
+    parser.add_argument("--gerentes", type=int, default=1)
+    parser.add_argument("--duracion", type=float, default=30, help="segundos medidos")
+    parser.add_argument("--calentamiento", type=float, default=5, help="segundos iniciales sin medir")
+    parser.add_argument("--pausa", type=float, default=0.3, help="segundos promedio entre acciones del cajero (0 = sin pausa)")
+    parser.add_argument("--pausa-gerente", type=float, default=2.0)
+    parser.add_argument("--max-items", type=int, default=6, help="productos por venta (1 a N)")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--empresas", type=int, default=2)
+    parser.add_argument("--usuarios", type=int, default=6, help="usuarios por empresa (admin + cajeros)")
+    parser.add_argument("--productos", type=int, default=500)
+    parser.add_argument("--meses", type=int, default=3)
+    parser.add_argument("--ventas-dia", type=int, default=80)
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--contrasena", default="clave123")
+    parser.add_argument("--salida", default=None, help="archivo JSON con el informe")
+    args = parser.parse_args()
+
+    servidor = None if args.url else levantar_servidor(args)
+    resultados = Resultados()
+    fin = threading.Event()
+    nits = [nit_sintetico(args.semilla, n) for n in range(args.empresas)]
+    cajeros_por_empresa = max(args.usuarios - 1, 1)
+
+    hilos = []
+    for k in range(args.cajeros):
+        nit = nits[k % len(nits)]
+        nom_usuario = f"cajero{(k // len(nits)) % cajeros_por_empresa + 1}" if args.usuarios > 1 else "admin"
+        hilos.append(threading.Thread(target=cajero, args=(args, resultados, fin, nit, nom_usuario, args.semilla * 1000 + k), daemon=True))
+    for k in range(args.gerentes):
+        hilos.append(threading.Thread(target=gerente, args=(args, resultados, fin, nits[k % len(nits)], args.semilla * 2000 + k), daemon=True))
+
+    try:
+        for hilo in hilos:
+            hilo.start()
+        time.sleep(args.calentamiento)
+        resultados.midiendo = True
+        inicio = time.perf_counter()
+        time.sleep(args.duracion)
+        resultados.midiendo = False
+        segundos = time.perf_counter() - inicio
+        fin.set()
+        for hilo in hilos:
+            hilo.join(timeout=args.timeout)
+    finally:
+        if servidor:
+            servidor.terminate()
+            servidor.wait()
+
+    print(f"\ncajeros={args.cajeros} gerentes={args.gerentes} pausa={args.pausa}s duración={args.duracion:.0f}s")
+    datos = informe(resultados, segundos)
+    if args.salida:
+        datos['configuracion'] = {k: v for k, v in vars(args).items() if k != 'contrasena'}
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            json.dump(datos, archivo, indent=2, ensure_ascii=False)
+        print(f"\ninforme en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
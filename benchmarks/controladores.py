@@ -0,0 +1,276 @@
+"""
+Benchmarks de los controladores más usados.
+
+Crea una base con datos sintéticos reproducibles (los de `flask datos
+generar`: misma semilla, mismos datos) a la escala elegida y mide, llamando directamente a los
+controladores dentro de un contexto de request:
+  - crear_venta con tickets de 1, 5 y 20 productos;
+  - listar_ventas, obtener_resumen_ventas_hoy, obtener_estadisticas_ventas;
+  - buscar_producto_venta, listar_productos (sin caché);
+  - autenticar_usuario (incluye bcrypt con BCRYPT_LOG_ROUNDS).
+
+Cada medición guarda mediana, p95, mínimo y sentencias SQL por llamada en
+un JSON. Con --comparar se contrasta con una corrida anterior y el proceso
+termina con código 1 si alguna mediana empeora más que --umbral o si
+aumentan las sentencias SQL.
+
+Uso:
+    python benchmarks/controladores.py --escala pequena
+    python benchmarks/controladores.py --escala mediana --salida base.json
+    python benchmarks/controladores.py --escala mediana --comparar base.json --umbral 0.15
+    python benchmarks/controladores.py --database-url postgresql+psycopg2://localhost/bench
+
+Con --database-url la base debe ser desechable: se aplican las migraciones
+y se agregan datos de prueba.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ESCALAS = {
+    # productos, meses de historial, ventas por día, usuarios
+    'pequena': (500, 3, 25, 10),
+    'mediana': (5000, 6, 110, 30),
+    'grande': (20000, 12, 280, 100),
+}
+TAMANOS_TICKET = (1, 5, 20)
+CONTRASENA = "clave-bench"
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+
+def preparar(args):
+    """Aplicar migraciones y cargar los datos sintéticos de la escala"""
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        ruta = os.path.join(tempfile.mkdtemp(), "bench_controladores.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{ruta}"
+    os.environ.setdefault("BCRYPT_LOG_ROUNDS", str(args.rondas))
+
+    sys.path.insert(0, RAIZ)
+    from main import app
+    from flask_migrate import upgrade
+    from app.models import db, Empresa, Usuario, Producto
+    from app.datos_sinteticos import generar_datos_sinteticos
+
+    # Se mide la consulta, no la caché por proceso
+    app.config["CACHE_CONSULTAS"] = False
+
+    productos, meses, ventas_dia, usuarios = ESCALAS[args.escala]
+
+    with app.app_context():
+        upgrade(directory=os.path.join(RAIZ, "migrations"))
+
+        resumen, error = generar_datos_sinteticos(
+            1, usuarios=usuarios, productos=productos, meses=meses, ventas_dia=ventas_dia,
+            semilla=args.semilla, contrasena=CONTRASENA
+        )
+        if error:
+            sys.exit(error)
+
+        nit = resumen['nits'][0]
+        id_empresa = Empresa.query.filter_by(nit=nit).one().id_empresa
+        # crear_venta no debe fallar por stock durante las repeticiones
+        Producto.query.filter_by(id_empresa=id_empresa).update({'stock': 10 ** 7})
+        db.session.commit()
+
+        datos = {
+            'id_empresa': id_empresa,
+            'nit': nit,
+            'usuarios': [u.nom_usuario for u in Usuario.query.filter_by(id_empresa=id_empresa)],
+            'id_usuario': Usuario.query.filter_by(id_empresa=id_empresa, nom_usuario="admin").one().id_usuario,
+            'productos': [p.id_producto for p in Producto.query.filter_by(id_empresa=id_empresa)],
+            'ventas': resumen['ventas'],
+            'dialecto': db.engine.dialect.name,
+        }
+    return app, datos
+
+
+def casos(datos, azar):
+    """(nombre, función sin argumentos) de cada benchmark"""
+    from app.controllers.venta_controller import (
+        crear_venta, listar_ventas, obtener_resumen_ventas_hoy,
+        obtener_estadisticas_ventas, buscar_producto_venta
+    )
+    from app.controllers.producto_controller import listar_productos
+    from app.controllers.usuario_controller import autenticar_usuario
+
+    id_empresa = datos['id_empresa']
+    hace_30 = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+    terminos = ("Arroz", "Mouse 1", "B", "Monitor 4", "Teclado 12", "000123", "noexiste")
+
+    def venta(tamano):
+        def ejecutar():
+            items = [{'id_producto': p, 'cantidad': 1} for p in azar.sample(datos['productos'], tamano)]
+            _, error = crear_venta(items, "💵 Efectivo", id_empresa=id_empresa, id_usuario=datos['id_usuario'])
+            if error:
+                raise RuntimeError(error)
+        return ejecutar
+
+    lista = [
+        ("listar_ventas", lambda: listar_ventas(id_empresa)),
+        ("listar_ventas[30_dias]", lambda: listar_ventas(id_empresa, fecha_desde=hace_30)),
+        ("obtener_resumen_ventas_hoy", lambda: obtener_resumen_ventas_hoy(id_empresa)),
+        ("obtener_estadisticas_ventas", lambda: obtener_estadisticas_ventas(id_empresa)),
+        ("obtener_estadisticas_ventas[30_dias]", lambda: obtener_estadisticas_ventas(id_empresa, fecha_desde=hace_30)),
+        ("buscar_producto_venta", lambda: buscar_producto_venta(id_empresa, azar.choice(terminos))),
+        ("listar_productos", lambda: listar_productos(id_empresa)),
+        ("autenticar_usuario", lambda: autenticar_usuario(datos['nit'], azar.choice(datos['usuarios']), CONTRASENA)),
+    ]
+    # Las escrituras al final, para que no cambien los datos de las lecturas
+    lista += [(f"crear_venta[{tamano}]", venta(tamano)) for tamano in TAMANOS_TICKET]
+    return lista
+
+
+def medir(app, funcion, repeticiones, calentamiento, max_segundos):
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from app.models import db
+
+    sentencias = [0]
+
+    def contar(*args):
+        sentencias[0] += 1
+
+    tiempos, consultas = [], []
+    event.listen(Engine, "before_cursor_execute", contar)
+    try:
+        limite = time.perf_counter() + max_segundos
+        for i in range(calentamiento + repeticiones):
+            # Un contexto y una sesión nuevos por llamada, como en un request
+            with app.test_request_context():
+                sentencias[0] = 0
+                inicio = time.perf_counter()
+                funcion()
+                duracion = time.perf_counter() - inicio
+                db.session.remove()
+            if i >= calentamiento:
+                tiempos.append(duracion)
+                consultas.append(sentencias[0])
+                if time.perf_counter() > limite and len(tiempos) >= 3:
+                    break
+    finally:
+        event.remove(Engine, "before_cursor_execute", contar)
+
+    return {
+        'mediana_ms': round(statistics.median(tiempos) * 1000, 3),
+        'p95_ms': round(percentil(tiempos, 95) * 1000, 3),
+        'min_ms': round(min(tiempos) * 1000, 3),
+        'media_ms': round(statistics.mean(tiempos) * 1000, 3),
+        'n': len(tiempos),
+        'consultas': statistics.median(consultas),
+    }
+
+
+def comparar(resultados, base, umbral):
+    """Imprime la comparación y devuelve las regresiones"""
+    regresiones = []
+    for clave in ('escala', 'dialecto'):
+        if base['entorno'].get(clave) != resultados['entorno'].get(clave):
+            print(f"Aviso: {clave} distinta a la base ({base['entorno'].get(clave)} vs {resultados['entorno'].get(clave)})")
+
+    print(f"\n{'benchmark':40s} {'base ms':>10s} {'actual ms':>10s} {'cambio':>8s}  sql")
+    for nombre, actual in resultados['resultados'].items():
+        anterior = base['resultados'].get(nombre)
+        if anterior is None:
+            print(f"{nombre:40s} {'-':>10s} {actual['mediana_ms']:10.3f} {'nuevo':>8s}")
+            continue
+        cambio = actual['mediana_ms'] / anterior['mediana_ms'] - 1 if anterior['mediana_ms'] else 0
+        marca = ""
+        if cambio > umbral:
+            marca = "  REGRESIÓN"
+            regresiones.append(nombre)
+        if actual['consultas'] > anterior['consultas']:
+            marca += f"  MÁS SQL ({anterior['consultas']} -> {actual['consultas']})"
+            if nombre not in regresiones:
+                regresiones.append(nombre)
+        print(f"{nombre:40s} {anterior['mediana_ms']:10.3f} {actual['mediana_ms']:10.3f} {cambio:+8.1%}  "
+              f"{actual['consultas']}{marca}")
+    return regresiones
+
+
+def version_git():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--escala", choices=ESCALAS, default="pequena")
+    parser.add_argument("--repeticiones", type=int, default=50)
+    parser.add_argument("--calentamiento", type=int, default=3)
+    parser.add_argument("--max-segundos", type=float, default=10, help="tiempo máximo por benchmark")
+    parser.add_argument("--solo", default=None, help="solo benchmarks cuyo nombre contenga este texto")
+    parser.add_argument("--semilla", type=int, default=2024)
+    parser.add_argument("--rondas", type=int, default=12, help="BCRYPT_LOG_ROUNDS si no está en el entorno")
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--salida", default=None, help="archivo JSON de resultados")
+    parser.add_argument("--comparar", default=None, help="JSON de una corrida anterior")
+    parser.add_argument("--umbral", type=float, default=0.2, help="empeoramiento tolerado de la mediana (0.2 = 20 %%)")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    app, datos = preparar(args)
+    print(f"datos '{args.escala}' en {datos['dialecto']} ({datos['ventas']} ventas) listos en {time.perf_counter() - inicio:.1f}s")
+
+    azar = random.Random(args.semilla)
+    resultados = {
+        'fecha': datetime.now().isoformat(timespec="seconds"),
+        'entorno': {
+            'escala': args.escala,
+            'dialecto': datos['dialecto'],
+            'semilla': args.semilla,
+            'bcrypt_rondas': app.config['BCRYPT_LOG_ROUNDS'],
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'commit': version_git(),
+        },
+        'resultados': {},
+    }
+
+    print(f"{'benchmark':40s} {'mediana ms':>10s} {'p95 ms':>10s} {'min ms':>10s} {'n':>5s}  sql")
+    for nombre, funcion in casos(datos, azar):
+        if args.solo and args.solo not in nombre:
+            continue
+        r = medir(app, funcion, args.repeticiones, args.calentamiento, args.max_segundos)
+        resultados['resultados'][nombre] = r
+        print(f"{nombre:40s} {r['mediana_ms']:10.3f} {r['p95_ms']:10.3f} {r['min_ms']:10.3f} {r['n']:5d}  {r['consultas']}")
+
+    salida = args.salida or os.path.join(
+        tempfile.gettempdir(), f"bench_controladores_{args.escala}_{datos['dialecto']}_{int(time.time())}.json"
+    )
+    with open(salida, "w", encoding="utf-8") as archivo:
+        json.dump(resultados, archivo, indent=2, ensure_ascii=False)
+    print(f"\nresultados en {salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as archivo:
+            base = json.load(archivo)
+        regresiones = comparar(resultados, base, args.umbral)
+        if regresiones:
+            print(f"\n{len(regresiones)} regresiones (umbral {args.umbral:.0%}): {', '.join(regresiones)}")
+            sys.exit(1)
+        print("\nsin regresiones")
+
+
+if __name__ == "__main__":
+    main()
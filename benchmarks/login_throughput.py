@@ -0,0 +1,148 @@
+"""
+Benchmark de inicios de sesión concurrentes.
+
+Simula una ola de logins al abrir turno y mide, al mismo tiempo, la latencia
+de un request liviano (búsqueda de producto en el POS) para ver cuánto lo
+frena el hash de contraseñas.
+
+Uso:
+    python benchmarks/login_throughput.py --rondas 12 --concurrencia 16 --logins 64
+    BCRYPT_HILOS=2 python benchmarks/login_throughput.py
+
+Por defecto usa una base SQLite temporal; con --database-url se puede
+apuntar a otra (se aplican las migraciones y se agregan datos de prueba).
+
+Corre en un solo proceso: mide los cupos de hash de un worker
+(BCRYPT_HILOS, BCRYPT_MAX_PENDIENTES); con gunicorn cada worker tiene los
+suyos.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+
+def preparar(args):
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        ruta = os.path.join(tempfile.mkdtemp(), "bench_login.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{ruta}"
+    os.environ["BCRYPT_LOG_ROUNDS"] = str(args.rondas)
+    # Todos los logins salen de la misma IP
+    os.environ.setdefault("LOGIN_INTENTOS_IP", "100000")
+
+    sys.path.insert(0, RAIZ)
+    from main import app
+    from flask_migrate import upgrade
+    from app.models import db, Empresa, Rol, Usuario, Producto
+    from app.contrasenas import generar_hash
+
+    with app.app_context():
+        upgrade(directory=os.path.join(RAIZ, "migrations"))
+        if not db.session.get(Rol, "1"):
+            db.session.add(Rol(id_rol="1", nombre_rol="Admin"))
+        empresa = Empresa(nit=f"BENCH-{time.time_ns()}", nombre="Bench", correo_electronico="bench@bench.co", telefono_contacto="0")
+        db.session.add(empresa)
+        db.session.flush()
+
+        hash_comun = generar_hash("clave-bench")
+        usuarios = []
+        for i in range(args.usuarios):
+            nombre = f"bench_{empresa.id_empresa}_{i}"
+            db.session.add(Usuario(nom_usuario=nombre, contrasena=hash_comun, rol="1", id_empresa=empresa.id_empresa))
+            usuarios.append(nombre)
+        db.session.add(Producto(id_producto="BENCH-1", nombre="Producto bench", precio=1000, stock=100, id_empresa=empresa.id_empresa))
+        db.session.commit()
+
+        return app, empresa.id_empresa, empresa.nit, usuarios
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rondas", type=int, default=12, help="BCRYPT_LOG_ROUNDS")
+    parser.add_argument("--concurrencia", type=int, default=16, help="logins simultáneos")
+    parser.add_argument("--logins", type=int, default=64, help="total de logins")
+    parser.add_argument("--usuarios", type=int, default=16)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    app, id_empresa, nit, usuarios = preparar(args)
+    app.config["WTF_CSRF_ENABLED"] = False
+
+    latencias_login = []
+    latencias_pos = []
+    errores = {"login": 0, "ocupado": 0}
+    pendientes = list(range(args.logins))
+    candado = threading.Lock()
+    terminado = threading.Event()
+
+    def hacer_logins():
+        cliente = app.test_client()
+        while True:
+            with candado:
+                if not pendientes:
+                    return
+                i = pendientes.pop()
+            inicio = time.perf_counter()
+            r = cliente.post("/usuario/login", data={
+                "nit": nit,
+                "nom_usuario": usuarios[i % len(usuarios)],
+                "contrasena": "clave-bench"
+            })
+            duracion = time.perf_counter() - inicio
+            with candado:
+                latencias_login.append(duracion)
+                if r.status_code != 302:
+                    errores["ocupado" if "intenta de nuevo" in r.get_data(as_text=True) else "login"] += 1
+
+    def sondear_pos():
+        cliente = app.test_client()
+        with cliente.session_transaction() as s:
+            s["usuario_id"] = 1
+            s["empresa_id"] = id_empresa
+            s["rol"] = 1
+        while not terminado.is_set():
+            inicio = time.perf_counter()
+            cliente.get(f"/venta/buscar_producto/{id_empresa}?codigo=BENCH-1")
+            latencias_pos.append(time.perf_counter() - inicio)
+            time.sleep(0.01)
+
+    sonda = threading.Thread(target=sondear_pos)
+    sonda.start()
+    hilos = [threading.Thread(target=hacer_logins) for _ in range(args.concurrencia)]
+    inicio = time.perf_counter()
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    total = time.perf_counter() - inicio
+    terminado.set()
+    sonda.join()
+
+    print(f"rondas={args.rondas} hilos_bcrypt={app.config['BCRYPT_HILOS']} "
+          f"max_pendientes={app.config['BCRYPT_MAX_PENDIENTES']} concurrencia={args.concurrencia}")
+    print(f"logins: {len(latencias_login)} en {total:.2f}s -> {len(latencias_login) / total:.1f} logins/s "
+          f"(errores={errores['login']}, rechazados por saturación={errores['ocupado']})")
+    print(f"latencia login ms: p50={percentil(latencias_login, 50) * 1000:.0f} "
+          f"p95={percentil(latencias_login, 95) * 1000:.0f} p99={percentil(latencias_login, 99) * 1000:.0f}")
+    if latencias_pos:
+        print(f"latencia POS durante la ola ms: p50={percentil(latencias_pos, 50) * 1000:.1f} "
+              f"p95={percentil(latencias_pos, 95) * 1000:.1f} media={statistics.mean(latencias_pos) * 1000:.1f} "
+              f"({len(latencias_pos)} requests)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import os
+
+# ----------------------------------------------------------------------
+# Configuración de gunicorn (se lee sola al ejecutar `gunicorn main:app`)
+#
+# preload_app: la app se importa una vez en el proceso maestro y los
+# workers nacen con fork, ya inicializados. create_app no abre conexiones,
+# así que ningún socket a la BD queda compartido entre procesos.
+#
+# Workers con hilos (gthread, GUNICORN_THREADS > 1): las consultas
+# compartidas (app/cache.py) trabajan dentro de cada proceso, así que solo
+# sirven si un worker atiende varios requests a la vez. Con un hilo por
+# worker cada reporte concurrente se calcularía por separado, y un login
+# esperando cupo de bcrypt (app/contrasenas.py, cupos por worker)
+# bloquearía al worker entero.
+# ----------------------------------------------------------------------
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") != "0"
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 0))
+
+
+def post_fork(server, worker):
+    # Por si algo usó la BD antes del fork: el worker descarta el pool
+    # heredado (sin cerrar conexiones que siguen siendo del maestro)
+    from main import app
+    from app.models import db
+    from app.contrasenas import reiniciar_cupos
+
+    with app.app_context():
+        db.engine.dispose(close=False)
+    # Cupos de bcrypt propios del worker
+    reiniciar_cupos(app.config)
@@ -1,24 +1,9 @@
 from flask import render_template
 from app import create_app
-from app.routes.empresa_routes import empresa_bp
-from app.routes.usuario_routes import usuario_bp
-from app.routes.producto_routes import producto_bp
-from app.routes.venta_routes import venta_bp
-from app.routes.index_routes import index_bp
-
-
-
 
 
 app = create_app()
 
-# Registrar los blueprints
-app.register_blueprint(empresa_bp)
-app.register_blueprint(usuario_bp, url_prefix="/usuario")
-app.register_blueprint(producto_bp)
-app.register_blueprint(venta_bp)
-app.register_blueprint(index_bp)
-
 
 # Ruta principal
 @app.route("/")
@@ -27,4 +12,3 @@ def index():
 
 if __name__ == "__main__":
     app.run(debug=True)
-
@@ -0,0 +1,125 @@
+"""esquema base
+
+Las tablas tal como las creaba db.create_all() antes de usar migraciones.
+Una base creada así ya tiene este esquema: se marca con
+`flask db stamp 3f2a9c1d7b40` y luego `flask db upgrade` aplica el resto.
+
+Revision ID: 3f2a9c1d7b40
+Revises:
+Create Date: 2026-10-19 15:50:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d7b40'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('empresa',
+    sa.Column('id_empresa', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('nit', sa.String(length=20), nullable=False),
+    sa.Column('nombre', sa.String(length=100), nullable=False),
+    sa.Column('correo_electronico', sa.String(length=100), nullable=False),
+    sa.Column('telefono_contacto', sa.String(length=20), nullable=False),
+    sa.PrimaryKeyConstraint('id_empresa')
+    )
+    op.create_table('rol',
+    sa.Column('id_rol', sa.String(length=100), nullable=False),
+    sa.Column('nombre_rol', sa.String(length=100), nullable=False),
+    sa.Column('descripcion', sa.String(length=100), nullable=True),
+    sa.PrimaryKeyConstraint('id_rol')
+    )
+    op.create_table('usuario',
+    sa.Column('id_usuario', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('nom_usuario', sa.String(length=100), nullable=False),
+    sa.Column('contrasena', sa.String(length=100), nullable=False),
+    sa.Column('rol', sa.String(length=100), nullable=False),
+    sa.Column('correo_recuperacion', sa.String(length=100), nullable=True),
+    sa.Column('id_empresa', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['id_empresa'], ['empresa.id_empresa'], ),
+    sa.ForeignKeyConstraint(['rol'], ['rol.id_rol'], ),
+    sa.PrimaryKeyConstraint('id_usuario')
+    )
+    op.create_table('proveedor',
+    sa.Column('id_proveedores', sa.String(length=100), nullable=False),
+    sa.Column('nombre', sa.String(length=100), nullable=False),
+    sa.Column('telefono', sa.Integer(), nullable=True),
+    sa.Column('correo', sa.String(length=100), nullable=True),
+    sa.Column('direccion', sa.String(length=100), nullable=True),
+    sa.Column('id_empresa', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['id_empresa'], ['empresa.id_empresa'], ),
+    sa.PrimaryKeyConstraint('id_proveedores')
+    )
+    op.create_table('producto',
+    sa.Column('id_producto', sa.String(length=100), nullable=False),
+    sa.Column('nombre', sa.String(length=100), nullable=False),
+    sa.Column('descripcion', sa.String(length=100), nullable=True),
+    sa.Column('precio', sa.Integer(), nullable=False),
+    sa.Column('stock', sa.Integer(), nullable=False),
+    sa.Column('id_empresa', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['id_empresa'], ['empresa.id_empresa'], ),
+    sa.PrimaryKeyConstraint('id_producto')
+    )
+    op.create_table('venta',
+    sa.Column('id_venta', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('fecha_hora', sa.String(length=100), nullable=False),
+    sa.Column('metodo_pago', sa.String(length=100), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.Column('id_usuario', sa.Integer(), nullable=False),
+    sa.Column('id_empresa', sa.Integer(), nullable=False),
+    sa.Column('cantidad', sa.Integer(), nullable=False),
+    sa.Column('subtotal', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['id_empresa'], ['empresa.id_empresa'], ),
+    sa.ForeignKeyConstraint(['id_usuario'], ['usuario.id_usuario'], ),
+    sa.PrimaryKeyConstraint('id_venta')
+    )
+    op.create_table('movimiento_inventario',
+    sa.Column('id_movimiento', sa.String(length=100), nullable=False),
+    sa.Column('tipo_movimiento', sa.String(length=100), nullable=False),
+    sa.Column('fecha_hora', sa.String(length=100), nullable=False),
+    sa.Column('cantidad', sa.Integer(), nullable=False),
+    sa.Column('id_producto', sa.String(length=100), nullable=False),
+    sa.Column('id_usuario', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['id_producto'], ['producto.id_producto'], ),
+    sa.ForeignKeyConstraint(['id_usuario'], ['usuario.id_usuario'], ),
+    sa.PrimaryKeyConstraint('id_movimiento')
+    )
+    op.create_table('desactivacion_usuario',
+    sa.Column('id_desactivacion', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('id_usuario', sa.Integer(), nullable=False),
+    sa.Column('motivo', sa.String(length=255), nullable=False),
+    sa.Column('fecha_desactivacion', sa.DateTime(), nullable=True),
+    sa.Column('id_admin', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['id_admin'], ['usuario.id_usuario'], ),
+    sa.ForeignKeyConstraint(['id_usuario'], ['usuario.id_usuario'], ),
+    sa.PrimaryKeyConstraint('id_desactivacion')
+    )
+    op.create_table('detalle_venta',
+    sa.Column('id_detalle', sa.String(length=100), nullable=False),
+    sa.Column('id_venta', sa.Integer(), nullable=False),
+    sa.Column('id_producto', sa.String(length=100), nullable=False),
+    sa.Column('cantidad', sa.Integer(), nullable=False),
+    sa.Column('precio_unitario', sa.Integer(), nullable=False),
+    sa.Column('subtotal', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['id_producto'], ['producto.id_producto'], ),
+    sa.ForeignKeyConstraint(['id_venta'], ['venta.id_venta'], ),
+    sa.PrimaryKeyConstraint('id_detalle')
+    )
+
+
+def downgrade():
+    op.drop_table('detalle_venta')
+    op.drop_table('desactivacion_usuario')
+    op.drop_table('movimiento_inventario')
+    op.drop_table('venta')
+    op.drop_table('producto')
+    op.drop_table('proveedor')
+    op.drop_table('usuario')
+    op.drop_table('rol')
+    op.drop_table('empresa')
@@ -0,0 +1,90 @@
+"""secuencia de movimientos
+
+Columna `secuencia` en movimiento_inventario: desempata en el kardex los
+movimientos registrados en el mismo segundo (antes quedaban ordenados por
+el prefijo de id_movimiento). Las filas existentes se numeran por
+(fecha_hora, id_movimiento), el orden que ya mostraba el kardex; las nuevas
+la reciben de una secuencia en PostgreSQL y de un trigger (rowid) en SQLite.
+El índice del kardex pasa a (id_producto, fecha_hora, secuencia).
+
+Revision ID: 8d41e6b2c7f3
+Revises: cb0ff9dc6834
+Create Date: 2026-10-19 17:20:00.000000
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d41e6b2c7f3'
+down_revision = 'cb0ff9dc6834'
+branch_labels = None
+depends_on = None
+
+MOVIMIENTOS = 'movimiento_inventario'
+ARCHIVO = f'{MOVIMIENTOS}_archivo'
+SECUENCIA = f'{MOVIMIENTOS}_secuencia_seq'
+TRIGGER = f'{MOVIMIENTOS}_secuencia'
+
+
+def _es_postgresql():
+    return op.get_bind().dialect.name == 'postgresql'
+
+
+def _archivo_existe():
+    """`flask inventario archivar` crea la tabla de archivo con SELECT *"""
+    if context.is_offline_mode():
+        return False
+    return sa.inspect(op.get_bind()).has_table(ARCHIVO)
+
+
+def upgrade():
+    with op.batch_alter_table(MOVIMIENTOS, schema=None) as batch_op:
+        batch_op.drop_index('ix_movimiento_producto_fecha')
+        batch_op.add_column(sa.Column('secuencia', sa.BigInteger(), nullable=True))
+
+    if _es_postgresql():
+        op.execute(f"CREATE SEQUENCE {SECUENCIA} OWNED BY {MOVIMIENTOS}.secuencia")
+        op.execute(
+            f"UPDATE {MOVIMIENTOS} m SET secuencia = o.n FROM ("
+            f"SELECT id_movimiento, fecha_hora, "
+            f"row_number() OVER (ORDER BY fecha_hora, id_movimiento) AS n FROM {MOVIMIENTOS}"
+            f") o WHERE m.id_movimiento = o.id_movimiento AND m.fecha_hora = o.fecha_hora"
+        )
+        op.execute(f"SELECT setval('{SECUENCIA}', COALESCE((SELECT MAX(secuencia) FROM {MOVIMIENTOS}), 0) + 1, false)")
+        op.execute(f"ALTER TABLE {MOVIMIENTOS} ALTER COLUMN secuencia SET DEFAULT nextval('{SECUENCIA}')")
+        # El archivo se llena con INSERT ... SELECT *: necesita las mismas columnas
+        op.execute(f"ALTER TABLE IF EXISTS {ARCHIVO} ADD COLUMN IF NOT EXISTS secuencia BIGINT")
+    else:
+        # rowid sigue el orden de inserción; el trigger lo copia en las filas nuevas
+        op.execute(f"UPDATE {MOVIMIENTOS} SET secuencia = rowid")
+        op.execute(
+            f"CREATE TRIGGER {TRIGGER} AFTER INSERT ON {MOVIMIENTOS} WHEN NEW.secuencia IS NULL "
+            f"BEGIN UPDATE {MOVIMIENTOS} SET secuencia = NEW.rowid WHERE rowid = NEW.rowid; END"
+        )
+        if _archivo_existe():
+            op.add_column(ARCHIVO, sa.Column('secuencia', sa.BigInteger(), nullable=True))
+
+    with op.batch_alter_table(MOVIMIENTOS, schema=None) as batch_op:
+        batch_op.create_index('ix_movimiento_producto_fecha', ['id_producto', 'fecha_hora', 'secuencia'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table(MOVIMIENTOS, schema=None) as batch_op:
+        batch_op.drop_index('ix_movimiento_producto_fecha')
+
+    if _es_postgresql():
+        op.execute(f"ALTER TABLE IF EXISTS {ARCHIVO} DROP COLUMN IF EXISTS secuencia")
+        # OWNED BY: la secuencia se borra con la columna
+        op.drop_column(MOVIMIENTOS, 'secuencia')
+    else:
+        op.execute(f"DROP TRIGGER IF EXISTS {TRIGGER}")
+        if _archivo_existe():
+            with op.batch_alter_table(ARCHIVO, schema=None) as batch_op:
+                batch_op.drop_column('secuencia')
+        with op.batch_alter_table(MOVIMIENTOS, schema=None) as batch_op:
+            batch_op.drop_column('secuencia')
+
+    with op.batch_alter_table(MOVIMIENTOS, schema=None) as batch_op:
+        batch_op.create_index('ix_movimiento_producto_fecha', ['id_producto', 'fecha_hora', 'id_movimiento'], unique=False)
@@ -0,0 +1,391 @@
+"""tablas y restricciones de la serie
+
+Sobre el esquema base (3f2a9c1d7b40):
+  - tablas nuevas: métodos de pago, versiones de caché, eventos de
+    invalidación, límites de login, carritos y reservas, compras, conteos,
+    snapshots de stock y devoluciones;
+  - NIT único (uq_empresa_nit) y usuario único por empresa
+    (uq_usuario_empresa_nom_usuario). Si hay repetidos la migración se
+    detiene y los lista: hay que resolverlos a mano;
+  - movimiento_inventario reconstruida con llave (id_movimiento,
+    fecha_hora), particionada por mes en PostgreSQL (partición DEFAULT más
+    una por mes desde el movimiento más antiguo hasta tres meses adelante)
+    y con el índice del kardex.
+
+Conserva el id de la antigua revisión única "esquema inicial": las bases
+creadas con ella ya tienen todo esto y siguen en head.
+
+Revision ID: cb0ff9dc6834
+Revises: 3f2a9c1d7b40
+Create Date: 2026-10-19 15:50:00.680356
+
+"""
+from datetime import date
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cb0ff9dc6834'
+down_revision = '3f2a9c1d7b40'
+branch_labels = None
+depends_on = None
+
+MOVIMIENTOS = 'movimiento_inventario'
+COLUMNAS_MOVIMIENTO = "id_movimiento, tipo_movimiento, fecha_hora, cantidad, id_producto, id_usuario"
+
+
+def _en_linea():
+    return not context.is_offline_mode()
+
+
+def _es_postgresql():
+    return op.get_bind().dialect.name == 'postgresql'
+
+
+def _verificar_duplicados():
+    """Los índices únicos no se pueden crear con NIT o usuarios repetidos"""
+    conexion = op.get_bind()
+    nits = conexion.execute(sa.text(
+        "SELECT nit, COUNT(*) FROM empresa GROUP BY nit HAVING COUNT(*) > 1"
+    )).all()
+    usuarios = conexion.execute(sa.text(
+        "SELECT id_empresa, nom_usuario, COUNT(*) FROM usuario "
+        "GROUP BY id_empresa, nom_usuario HAVING COUNT(*) > 1"
+    )).all()
+    if nits or usuarios:
+        detalle = [f"NIT repetido: {nit} ({cantidad} empresas)" for nit, cantidad in nits]
+        detalle += [
+            f"Usuario repetido en empresa {id_empresa}: {nom_usuario} ({cantidad})"
+            for id_empresa, nom_usuario, cantidad in usuarios
+        ]
+        raise RuntimeError(
+            "Corrige los repetidos antes de migrar:\n" + "\n".join(detalle)
+        )
+
+
+def _restriccion_existe(tabla, nombre):
+    """
+    `flask seguridad indices-login` (ya retirado) pudo haber creado la
+    restricción como índice único con el mismo nombre
+    """
+    if not _en_linea():
+        return False
+    inspector = sa.inspect(op.get_bind())
+    nombres = {r['name'] for r in inspector.get_unique_constraints(tabla)}
+    nombres |= {i['name'] for i in inspector.get_indexes(tabla)}
+    return nombre in nombres
+
+
+def _crear_unica(tabla, nombre, columnas):
+    if _restriccion_existe(tabla, nombre):
+        return
+    with op.batch_alter_table(tabla, schema=None) as batch_op:
+        batch_op.create_unique_constraint(nombre, columnas)
+
+
+def _meses_movimientos():
+    """Primer día de cada mes desde el movimiento más antiguo hasta tres meses adelante"""
+    hoy = date.today()
+    primera = None
+    if _en_linea():
+        primera = op.get_bind().execute(sa.text(
+            f"SELECT MIN(fecha_hora) FROM {MOVIMIENTOS}_sin_particion"
+        )).scalar()
+    mes = date(int(primera[:4]), int(primera[5:7]), 1) if primera else date(hoy.year, hoy.month, 1)
+    total_ultimo = hoy.year * 12 + hoy.month - 1 + 3
+    while mes.year * 12 + mes.month - 1 <= total_ultimo:
+        yield mes
+        siguiente = mes.year * 12 + mes.month
+        mes = date(siguiente // 12, siguiente % 12 + 1, 1)
+
+
+def _tabla_movimientos(llave, **opciones):
+    op.create_table(MOVIMIENTOS,
+    sa.Column('id_movimiento', sa.String(length=100), nullable=False),
+    sa.Column('tipo_movimiento', sa.String(length=100), nullable=False),
+    sa.Column('fecha_hora', sa.String(length=100), nullable=False),
+    sa.Column('cantidad', sa.Integer(), nullable=False),
+    sa.Column('id_producto', sa.String(length=100), nullable=False),
+    sa.Column('id_usuario', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['id_producto'], ['producto.id_producto'], ),
+    sa.ForeignKeyConstraint(['id_usuario'], ['usuario.id_usuario'], ),
+    llave,
+    **opciones
+    )
+
+
+def _reconstruir_movimientos():
+    """Llave (id_movimiento, fecha_hora) y particiones por mes en PostgreSQL"""
+    if not _es_postgresql():
+        # SQLite y otros: batch copia la tabla con la nueva llave
+        with op.batch_alter_table(MOVIMIENTOS, schema=None, recreate='always') as batch_op:
+            batch_op.create_primary_key(f'pk_{MOVIMIENTOS}', ['id_movimiento', 'fecha_hora'])
+        return
+
+    anterior = f'{MOVIMIENTOS}_sin_particion'
+    op.rename_table(MOVIMIENTOS, anterior)
+    op.execute(f"ALTER TABLE {anterior} RENAME CONSTRAINT {MOVIMIENTOS}_pkey TO {anterior}_pkey")
+
+    _tabla_movimientos(
+        sa.PrimaryKeyConstraint('id_movimiento', 'fecha_hora'),
+        postgresql_partition_by='RANGE (fecha_hora)'
+    )
+    op.execute(f"CREATE TABLE {MOVIMIENTOS}_pdefault PARTITION OF {MOVIMIENTOS} DEFAULT")
+    for mes in _meses_movimientos():
+        siguiente = date(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
+        op.execute(
+            f"CREATE TABLE {MOVIMIENTOS}_p{mes.strftime('%Y%m')} PARTITION OF {MOVIMIENTOS} "
+            f"FOR VALUES FROM ('{mes:%Y-%m-%d} 00:00:00') TO ('{siguiente:%Y-%m-%d} 00:00:00')"
+        )
+    op.execute(f"INSERT INTO {MOVIMIENTOS} ({COLUMNAS_MOVIMIENTO}) SELECT {COLUMNAS_MOVIMIENTO} FROM {anterior}")
+    op.drop_table(anterior)
+
+
+def upgrade():
+    if _en_linea():
+        _verificar_duplicados()
+
+    _crear_unica('empresa', 'uq_empresa_nit', ['nit'])
+    _crear_unica('usuario', 'uq_usuario_empresa_nom_usuario', ['id_empresa', 'nom_usuario'])
+
+    op.create_table('evento_invalidacion',
+    sa.Column('id_evento', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('tabla', sa.String(length=100), nullable=False),
+    sa.Column('id_empresa', sa.Integer(), nullable=True),
+    sa.Column('llave', sa.String(length=100), nullable=True),
+    sa.Column('columnas', sa.String(length=255), nullable=True),
+    sa.Column('origen', sa.String(length=32), nullable=False),
+    sa.Column('fecha_hora', sa.String(length=100), nullable=False),
+    sa.PrimaryKeyConstraint('id_evento')
+    )
+    with op.batch_alter_table('evento_invalidacion', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_evento_invalidacion_fecha_hora'), ['fecha_hora'], unique=False)
+
+    op.create_table('limite_intento',
+    sa.Column('llave', sa.String(length=200), nullable=False),
+    sa.Column('tokens', sa.Float(), nullable=False),
+    sa.Column('actualizado', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('llave')
+    )
+    op.create_table('version_cache',
+    sa.Column('clave', sa.String(length=100), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('clave')
+    )
+    op.create_table('metodo_pago',
+    sa.Column('id_metodo', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('nombre', sa.String(length=100), nullable=False),
+    sa.Column('descripcion', sa.String(length=200), nullable=True),
+    sa.Column('activo', sa.Boolean(), nullable=False),
+    sa.Column('predeterminado', sa.Boolean(), nullable=False),
+    sa.Column('id_empresa', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['id_empresa'], ['empresa.id_empresa'], ),
+    sa.PrimaryKeyConstraint('id_metodo'),
+    sa.UniqueConstraint('id_empresa', 'nombre', name='uq_metodo_pago_empresa_nombre')
+    )
+    op.create_table('carrito',
+    sa.Column('id_carrito', sa.String(length=64), nullable=False),
+    sa.Column('descuento', sa.Float(), nullable=False),
+    sa.Column('subtotal', sa.Integer(), nullable=False),
+    sa.Column('cantidad', sa.Integer(), nullable=False),
+    sa.Column('actualizado_en', sa.String(length=100), nullable=False),
+    sa.Column('id_usuario', sa.Integer(), nullable=False),
+    sa.Column('id_empresa', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['id_empresa'], ['empresa.id_empresa'], ),
+    sa.ForeignKeyConstraint(['id_usuario'], ['usuario.id_usuario'], ),
+    sa.PrimaryKeyConstraint('id_carrito')
+    )
+    with op.batch_alter_table('carrito', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_carrito_id_empresa'), ['id_empresa'], unique=False)
+
+    op.create_table('compra',
+    sa.Column('id_compra', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('numero_factura', sa.String(length=100), nullable=True),
+    sa.Column('fecha_hora', sa.String(length=100), nullable=False),
+    sa.Column('cantidad', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.Column('id_proveedor', sa.String(length=100), nullable=False),
+    sa.Column('id_usuario', sa.Integer(), nullable=False),
+    sa.Column('id_empresa', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['id_empresa'], ['empresa.id_empresa'], ),
+    sa.ForeignKeyConstraint(['id_proveedor'], ['proveedor.id_proveedores'], ),
+    sa.ForeignKeyConstraint(['id_usuario'], ['usuario.id_usuario'], ),
+    sa.PrimaryKeyConstraint('id_compra')
+    )
+    with op.batch_alter_table('compra', schema=None) as batch_op:
+        batch_op.create_index('ix_compra_empresa_proveedor_fecha', ['id_empresa', 'id_proveedor', 'fecha_hora'], unique=False)
+
+    op.create_table('conteo_inventario',
+    sa.Column('id_conteo', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('descripcion', sa.String(length=255), nullable=True),
+    sa.Column('estado', sa.String(length=20), nullable=False),
+    sa.Column('fecha_inicio', sa.String(length=100), nullable=False),
+    sa.Column('fecha_cierre', sa.String(length=100), nullable=True),
+    sa.Column('id_usuario', sa.Integer(), nullable=False),
+    sa.Column('id_empresa', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['id_empresa'], ['empresa.id_empresa'], ),
+    sa.ForeignKeyConstraint(['id_usuario'], ['usuario.id_usuario'], ),
+    sa.PrimaryKeyConstraint('id_conteo')
+    )
+    op.create_table('reserva_stock',
+    sa.Column('id_carrito', sa.String(length=64), nullable=False),
+    sa.Column('id_producto', sa.String(length=100), nullable=False),
+    sa.Column('cantidad', sa.Integer(), nullable=False),
+    sa.Column('expira_en', sa.String(length=100), nullable=False),
+    sa.Column('id_usuario', sa.Integer(), nullable=False),
+    sa.Column('id_empresa', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['id_empresa'], ['empresa.id_empresa'], ),
+    sa.ForeignKeyConstraint(['id_producto'], ['producto.id_producto'], ),
+    sa.ForeignKeyConstraint(['id_usuario'], ['usuario.id_usuario'], ),
+    sa.PrimaryKeyConstraint('id_carrito', 'id_producto')
+    )
+    with op.batch_alter_table('reserva_stock', schema=None) as batch_op:
+        batch_op.create_index('ix_reserva_producto_expira', ['id_producto', 'expira_en'], unique=False)
+
+    op.create_table('snapshot_stock',
+    sa.Column('id_producto', sa.String(length=100), nullable=False),
+    sa.Column('fecha_corte', sa.String(length=100), nullable=False),
+    sa.Column('stock', sa.Integer(), nullable=False),
+    sa.Column('id_empresa', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['id_empresa'], ['empresa.id_empresa'], ),
+    sa.ForeignKeyConstraint(['id_producto'], ['producto.id_producto'], ),
+    sa.PrimaryKeyConstraint('id_producto', 'fecha_corte')
+    )
+    with op.batch_alter_table('snapshot_stock', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_snapshot_stock_id_empresa'), ['id_empresa'], unique=False)
+
+    op.create_table('detalle_compra',
+    sa.Column('id_detalle_compra', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('id_compra', sa.Integer(), nullable=False),
+    sa.Column('id_producto', sa.String(length=100), nullable=False),
+    sa.Column('cantidad', sa.Integer(), nullable=False),
+    sa.Column('costo_unitario', sa.Integer(), nullable=False),
+    sa.Column('subtotal', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['id_compra'], ['compra.id_compra'], ),
+    sa.ForeignKeyConstraint(['id_producto'], ['producto.id_producto'], ),
+    sa.PrimaryKeyConstraint('id_detalle_compra')
+    )
+    with op.batch_alter_table('detalle_compra', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_detalle_compra_id_compra'), ['id_compra'], unique=False)
+
+    op.create_table('detalle_conteo',
+    sa.Column('id_detalle_conteo', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('id_conteo', sa.Integer(), nullable=False),
+    sa.Column('id_producto', sa.String(length=100), nullable=False),
+    sa.Column('cantidad_contada', sa.Integer(), nullable=False),
+    sa.Column('stock_sistema', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['id_conteo'], ['conteo_inventario.id_conteo'], ),
+    sa.ForeignKeyConstraint(['id_producto'], ['producto.id_producto'], ),
+    sa.PrimaryKeyConstraint('id_detalle_conteo'),
+    sa.UniqueConstraint('id_conteo', 'id_producto', name='uq_detalle_conteo_producto')
+    )
+    op.create_table('devolucion_venta',
+    sa.Column('id_devolucion', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('id_venta', sa.Integer(), nullable=False),
+    sa.Column('tipo', sa.String(length=20), nullable=False),
+    sa.Column('motivo', sa.String(length=255), nullable=False),
+    sa.Column('fecha_hora', sa.String(length=100), nullable=False),
+    sa.Column('cantidad', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.Column('id_usuario', sa.Integer(), nullable=False),
+    sa.Column('id_empresa', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['id_empresa'], ['empresa.id_empresa'], ),
+    sa.ForeignKeyConstraint(['id_usuario'], ['usuario.id_usuario'], ),
+    sa.ForeignKeyConstraint(['id_venta'], ['venta.id_venta'], ),
+    sa.PrimaryKeyConstraint('id_devolucion')
+    )
+    with op.batch_alter_table('devolucion_venta', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_devolucion_venta_id_venta'), ['id_venta'], unique=False)
+
+    op.create_table('item_carrito',
+    sa.Column('id_carrito', sa.String(length=64), nullable=False),
+    sa.Column('id_producto', sa.String(length=100), nullable=False),
+    sa.Column('cantidad', sa.Integer(), nullable=False),
+    sa.Column('precio_unitario', sa.Integer(), nullable=False),
+    sa.Column('subtotal', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['id_carrito'], ['carrito.id_carrito'], ),
+    sa.ForeignKeyConstraint(['id_producto'], ['producto.id_producto'], ),
+    sa.PrimaryKeyConstraint('id_carrito', 'id_producto')
+    )
+    op.create_table('detalle_devolucion',
+    sa.Column('id_detalle_devolucion', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('id_devolucion', sa.Integer(), nullable=False),
+    sa.Column('id_detalle', sa.String(length=100), nullable=False),
+    sa.Column('id_producto', sa.String(length=100), nullable=False),
+    sa.Column('cantidad', sa.Integer(), nullable=False),
+    sa.Column('subtotal', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['id_detalle'], ['detalle_venta.id_detalle'], ),
+    sa.ForeignKeyConstraint(['id_devolucion'], ['devolucion_venta.id_devolucion'], ),
+    sa.ForeignKeyConstraint(['id_producto'], ['producto.id_producto'], ),
+    sa.PrimaryKeyConstraint('id_detalle_devolucion')
+    )
+    with op.batch_alter_table('detalle_devolucion', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_detalle_devolucion_id_detalle'), ['id_detalle'], unique=False)
+        batch_op.create_index(batch_op.f('ix_detalle_devolucion_id_devolucion'), ['id_devolucion'], unique=False)
+
+    _reconstruir_movimientos()
+    with op.batch_alter_table(MOVIMIENTOS, schema=None) as batch_op:
+        batch_op.create_index('ix_movimiento_producto_fecha', ['id_producto', 'fecha_hora', 'id_movimiento'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table(MOVIMIENTOS, schema=None) as batch_op:
+        batch_op.drop_index('ix_movimiento_producto_fecha')
+
+    if _es_postgresql():
+        # Vuelve a una tabla sin particiones con llave id_movimiento
+        particionada = f'{MOVIMIENTOS}_particionada'
+        op.rename_table(MOVIMIENTOS, particionada)
+        op.execute(f"ALTER TABLE {particionada} RENAME CONSTRAINT {MOVIMIENTOS}_pkey TO {particionada}_pkey")
+        _tabla_movimientos(sa.PrimaryKeyConstraint('id_movimiento'))
+        op.execute(f"INSERT INTO {MOVIMIENTOS} ({COLUMNAS_MOVIMIENTO}) SELECT {COLUMNAS_MOVIMIENTO} FROM {particionada}")
+        op.execute(f"DROP TABLE {particionada} CASCADE")
+    else:
+        with op.batch_alter_table(MOVIMIENTOS, schema=None, recreate='always') as batch_op:
+            batch_op.create_primary_key(f'pk_{MOVIMIENTOS}', ['id_movimiento'])
+
+    with op.batch_alter_table('detalle_devolucion', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_detalle_devolucion_id_devolucion'))
+        batch_op.drop_index(batch_op.f('ix_detalle_devolucion_id_detalle'))
+
+    op.drop_table('detalle_devolucion')
+    op.drop_table('item_carrito')
+    with op.batch_alter_table('devolucion_venta', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_devolucion_venta_id_venta'))
+
+    op.drop_table('devolucion_venta')
+    op.drop_table('detalle_conteo')
+    with op.batch_alter_table('detalle_compra', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_detalle_compra_id_compra'))
+
+    op.drop_table('detalle_compra')
+    with op.batch_alter_table('snapshot_stock', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_snapshot_stock_id_empresa'))
+
+    op.drop_table('snapshot_stock')
+    with op.batch_alter_table('reserva_stock', schema=None) as batch_op:
+        batch_op.drop_index('ix_reserva_producto_expira')
+
+    op.drop_table('reserva_stock')
+    op.drop_table('conteo_inventario')
+    with op.batch_alter_table('compra', schema=None) as batch_op:
+        batch_op.drop_index('ix_compra_empresa_proveedor_fecha')
+
+    op.drop_table('compra')
+    with op.batch_alter_table('carrito', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_carrito_id_empresa'))
+
+    op.drop_table('carrito')
+    op.drop_table('metodo_pago')
+    op.drop_table('version_cache')
+    op.drop_table('limite_intento')
+    with op.batch_alter_table('evento_invalidacion', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_evento_invalidacion_fecha_hora'))
+
+    op.drop_table('evento_invalidacion')
+
+    with op.batch_alter_table('usuario', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_usuario_empresa_nom_usuario', type_='unique')
+    with op.batch_alter_table('empresa', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_empresa_nit', type_='unique')